@@ -1,244 +1,609 @@
-from flask import Flask, request, jsonify
+import hashlib
+import importlib.util
+import json
+import math
+import time
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+import budget
+import gridmap
+import metrics
+import prefetch
+import warmup
 from geo import get_location_data
-from weather import get_weather_forecast
-from snow_engine import SnowPredictor
-from datetime import datetime
-from zoneinfo import ZoneInfo
+from weather import (
+    ENSEMBLE_MODELS, FORECAST_DAYS, MAX_FORECAST_DAYS, current_model_run, get_ensemble_forecasts,
+    get_weather_forecast, get_weather_forecasts, next_model_update
+)
+from pipeline import (
+    assemble, assemble_compact, build_ensemble, build_route, build_sweep, classify, forecast_days_for,
+    hours_left, iter_prediction, location_header, parse_elevation, prepare_hours, quarter_hourly
+)
+
+# MessagePack is optional (compact JSON still works); msgpack is imported on first use
+MSGPACK_AVAILABLE = importlib.util.find_spec("msgpack") is not None
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {"origins": "*"}}) 
 
-@app.route("/api/predict", methods=["POST"])
+if prefetch.ENABLED:
+    prefetch.start()
+if warmup.ENABLED:
+    warmup.start()
+
+MAX_BATCH_LOCATIONS = 50
+MAX_SWEEP_STEPS = 500
+MAX_ROUTE_WAYPOINTS = 500
+# Step lengths (minutes) of /api/predict and /api/predict/stream
+RESOLUTIONS = (60, 15)
+
+# Part of every ETag; bump when the same inputs start giving a different response
+RESPONSE_VERSION = "1"
+
+# /api/map: the index is re-read often (new runs), tiles of a build never change
+MAP_INDEX_MAX_AGE = 300
+MAP_TILE_MAX_AGE = 7 * 24 * 3600
+
+# Response formats of /api/predict and /api/predict/batch, negotiated via Accept.
+# The default stays the original JSON shape; MessagePack is always compact.
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.swisssnow.compact+json"
+MSGPACK_TYPES = ["application/vnd.swisssnow.compact+msgpack", "application/msgpack", "application/x-msgpack"]
+
+
+def response_format() -> str:
+    """Returns the mimetype to answer with, based on the request's Accept header."""
+    offered = [JSON, COMPACT_JSON] + (MSGPACK_TYPES if MSGPACK_AVAILABLE else [])
+    return request.accept_mimetypes.best_match(offered, default=JSON)
+
+
+def encode_response(body: dict, mimetype: str) -> Response:
+    with metrics.stage("serialize"):
+        if mimetype in MSGPACK_TYPES:
+            import msgpack
+
+            # Single-precision floats keep 7 significant digits, more than the
+            # 0.1 resolution of the model data, at about half the size
+            response = Response(msgpack.packb(body, use_single_float=True), mimetype=mimetype)
+        elif mimetype == COMPACT_JSON:
+            response = Response(json.dumps(body, separators=(",", ":")), mimetype=mimetype)
+        else:
+            response = jsonify(body)
+    response.vary.add("Accept")
+    return response
+
+
+def request_data():
+    """The request parameters: the query string of a GET, the JSON body otherwise."""
+    if request.method in ("GET", "HEAD"):
+        return request.args.to_dict()
+    return request.json
+
+
+def prediction_etag(data: dict, location_data: dict, weather_data: dict, mimetype: str) -> str:
+    """
+    Strong ETag of a prediction: a hash of the request parameters, the
+    resolved location, the response format, the current hour in Zurich (the
+    forecast window starts there) and the forecast data it is computed from.
+    None if the forecast has no fingerprint.
+    """
+    if not weather_data.get("fingerprint"):
+        return None
+    hour = datetime.now(ZoneInfo("Europe/Zurich")).strftime("%Y-%m-%dT%H")
+    key = [RESPONSE_VERSION, data, location_data, mimetype, hour, weather_data["fingerprint"]]
+    text = json.dumps(key, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def max_age(weather_data: dict) -> int:
+    """
+    Seconds a prediction stays valid: until the next hour (the forecast window
+    moves on) or the next model update, whichever comes first. 0 while a
+    forecast from a previous run is served and refreshed.
+    """
+    now = datetime.now(timezone.utc)
+    if weather_data.get("model_run") != current_model_run(now):
+        return 0
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return max(0, int((min(next_hour, next_model_update(now)) - now).total_seconds()))
+
+
+def not_modified(etag: str) -> bool:
+    """Whether a GET/HEAD request already holds the response with this ETag."""
+    return etag is not None and request.method in ("GET", "HEAD") and request.if_none_match.contains(etag)
+
+
+def with_cache_headers(response: Response, etag: str, seconds: int) -> Response:
+    if etag is not None:
+        response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = seconds
+    response.vary.add("Accept")
+    return response
+
+
+def parse_hours_range(data: dict) -> tuple:
+    """
+    Reads the optional hour range of a prediction request: "start" (hours
+    after the current hour, default 0), "hours" (default 24) and
+    "resolution" (minutes per step, 60 or 15). The range must end within
+    the MAX_FORECAST_DAYS days (from local midnight) of the forecast.
+
+    Returns:
+        tuple: (start, hours, resolution).
+
+    Raises:
+        ValueError: With a message for the client.
+    """
+    try:
+        start = int(data.get("start", 0))
+        hours = int(data.get("hours", 24))
+        resolution = int(data.get("resolution", 60))
+    except (TypeError, ValueError):
+        raise ValueError("'start', 'hours' and 'resolution' must be integers")
+    if resolution not in RESOLUTIONS:
+        raise ValueError("'resolution' must be 60 or 15 (minutes)")
+    horizon = hours_left(MAX_FORECAST_DAYS)
+    if start < 0 or hours < 1 or start + hours > horizon:
+        raise ValueError(f"The range must lie within the next {horizon} hours")
+    return start, hours, resolution
+
+
+def awaited(name: str, resolve, *args, **kwargs):
+    """
+    The value the async front end (asgi.py) already awaited for this request,
+    or resolve(*args, **kwargs) when running without it.
+    """
+    key = f"swisssnow.{name}"
+    if key in request.environ:
+        return request.environ[key]
+    return resolve(*args, **kwargs)
+
+
+def range_forecast(location_data: dict, start: int, hours: int, resolution: int):
+    """Fetches the forecast covering the range, as a 15-minute view if asked for."""
+    weather_data = awaited(
+        "forecast", get_weather_forecast, location_data['lat'], location_data['lon'],
+        days=forecast_days_for(start + hours), minutely=resolution == 15
+    )
+    if weather_data and resolution == 15:
+        weather_data = quarter_hourly(weather_data)
+    return weather_data
+
+
+def upstream_error(message: str, status: int):
+    """
+    Error response for a failed geocode or forecast: 503 with Retry-After
+    instead if an upstream call of this request was shed by its request
+    budget (see budget.py).
+    """
+    retry_after = budget.shed_retry_after()
+    if retry_after is None:
+        return jsonify({"error": message}), status
+    seconds = max(1, math.ceil(retry_after))
+    response = jsonify({"error": "The weather services are busy, please retry shortly", "retry_after": seconds})
+    response.headers["Retry-After"] = str(seconds)
+    return response, 503
+
+
+@app.before_request
+def start_timing():
+    # Calls shed while asgi.py awaited the inputs count for this request
+    budget.begin_request(request.environ.get("swisssnow.retry_after"))
+    if metrics.ENABLED:
+        g.request_started = time.perf_counter()
+        metrics.begin_request()
+
+
+@app.after_request
+def record_timing(response):
+    if not metrics.ENABLED or "request_started" not in g:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else "other"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.request_started, endpoint, str(response.status_code))
+    size = response.calculate_content_length()
+    if size is not None:
+        metrics.RESPONSE_BYTES.observe(size, endpoint, response.mimetype)
+    timing = metrics.server_timing()
+    if timing:
+        response.headers["Server-Timing"] = timing
+    return response
+
+
+@app.route("/metrics")
+def metrics_api():
+    """Prometheus scrape endpoint (404 when SNOW_METRICS=0)."""
+    if not metrics.ENABLED:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/api/predict", methods=["GET", "POST"])
 def predict_api():
-    data = request.json
+    """
+    Hourly prediction for one location.
+
+    Parameters come as a JSON body (POST) or as the query string (GET, e.g.
+    /api/predict?location=Zermatt&elevation=2500). Responses carry an ETag
+    and a Cache-Control max-age up to the next hour or model update; a GET
+    with a matching If-None-Match gets a 304 without the prediction being
+    computed.
+
+    Answers with the original JSON shape by default. Clients can ask for the
+    compact columnar form (see pipeline.assemble_compact) with
+    "Accept: application/vnd.swisssnow.compact+json", or for the same encoded
+    as MessagePack with "Accept: application/msgpack" (if msgpack is installed).
+
+    The next 24 hours are returned by default. Other pages of the next 7 days
+    are requested with "start" and "hours" (e.g. 48 and 24 for the day after
+    tomorrow), 15-minute steps with "resolution": 15; only the requested
+    steps are computed. Such responses carry "page": {"start", "hours",
+    "resolution", "next"}, where "next" is the start of the following page
+    (null at the end of the forecast).
+    """
+    data = request_data()
     if not data or "location" not in data:
         return jsonify({"error": "Location query is required"}), 400
     
     location_query = data.get("location")
-    manual_elevation = data.get("elevation")
-    
-    if manual_elevation and manual_elevation != '':
-        try:
-            manual_elevation = float(manual_elevation)
-        except ValueError:
-            manual_elevation = None
-    else:
-        manual_elevation = None
+    manual_elevation = parse_elevation(data.get("elevation"))
+    try:
+        start, hours, resolution = parse_hours_range(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    steps_per_hour = 60 // resolution
 
     # 1. Geocoding
-    location_data = get_location_data(location_query)
+    with metrics.stage("geocode"):
+        location_data = awaited("location", get_location_data, location_query)
     if not location_data:
-        return jsonify({"error": f"Could not find location '{location_query}'"}), 404
+        return upstream_error(f"Could not find location '{location_query}'", 404)
 
 
-    # 2. Weather
-    weather_data = get_weather_forecast(location_data['lat'], location_data['lon'])
+    # 2. Weather (as many days as the range needs)
+    with metrics.stage("weather"):
+        weather_data = range_forecast(location_data, start, hours, resolution)
     if not weather_data:
-        return jsonify({"error": "Could not fetch weather data"}), 500
+        return upstream_error("Could not fetch weather data", 500)
 
-    # 3. Process Data & Apply Manual Elevation if needed
-    base_elevation = weather_data.get('elevation', 0)
-    display_elevation = manual_elevation if manual_elevation is not None else base_elevation
+    # 3. Conditional request: the inputs are known, nothing is computed yet
+    mimetype = response_format()
+    etag = prediction_etag(data, location_data, weather_data, mimetype)
+    seconds = max_age(weather_data)
+    if not_modified(etag):
+        return with_cache_headers(Response(status=304), etag, seconds)
 
-    # 3. Process Data & Apply Manual Elevation logic handled dynamically in loop
-    base_elevation = weather_data.get('elevation', 0)
-    display_elevation = manual_elevation if manual_elevation is not None else base_elevation
+    # 4. Process Data & Apply Manual Elevation if needed (only the requested steps),
+    # unless the default window of a popular location was precomputed
+    precomputed = None
+    if (start, hours, resolution) == (0, 24, 60):
+        prefetch.popularity.record(location_data, manual_elevation)
+        precomputed = prefetch.results.get(weather_data, manual_elevation)
+    if precomputed is not None:
+        block, physics = precomputed
+    else:
+        with metrics.stage("prepare"):
+            block = prepare_hours(weather_data, manual_elevation, None, start * steps_per_hour, hours * steps_per_hour)
+        with metrics.stage("classify"):
+            physics = classify([block])[0]
+    with metrics.stage("assemble"):
+        assembler = assemble if mimetype == JSON else assemble_compact
+        body = assembler(location_data, block, physics)
+        if any(key in data for key in ("start", "hours", "resolution")):
+            complete = len(block["times"]) == hours * steps_per_hour
+            body["page"] = {
+                "start": start,
+                "hours": hours,
+                "resolution": resolution,
+                "next": start + hours if complete and start + hours < hours_left(MAX_FORECAST_DAYS) else None
+            }
+    return with_cache_headers(encode_response(body, mimetype), etag, seconds)
 
-    # Hourly data processing
-    hourly = weather_data.get("hourly", {})
-    all_times = hourly.get("time", [])
-    
-    # Find start index for current hour in Zurich timezone
-    now_zurich = datetime.now(ZoneInfo("Europe/Zurich"))
-    current_hour_iso = now_zurich.strftime("%Y-%m-%dT%H:00")
-    start_index = 0
-    for idx, t in enumerate(all_times):
-        if t >= current_hour_iso:
-            start_index = idx
-            break
-            
-    # Slice next 24 hours
-    end_index = start_index + 24
-    
-    times = all_times[start_index:end_index]
-    temps = hourly.get("temperature_2m", [])[start_index:end_index]
-    rhs = hourly.get("relative_humidity_2m", [])[start_index:end_index]
-    precips = hourly.get("precipitation", [])[start_index:end_index]
-    freezing_levels = hourly.get("freezing_level_height", [])[start_index:end_index]
-    temps_850 = hourly.get("temperature_850hPa", [])[start_index:end_index]
-    cloud_covers = hourly.get("cloud_cover", [])[start_index:end_index]
-    is_day_list = hourly.get("is_day", [])[start_index:end_index]
-    pressures = hourly.get("surface_pressure", [])[start_index:end_index]
-
-    # Pre-extract multi-level profile data
-    p_levels = [1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 700, 650, 600, 550, 500]
-    lvl_temps = {p: hourly.get(f"temperature_{p}hPa", [])[start_index:end_index] for p in p_levels}
-    lvl_heights = {p: hourly.get(f"geopotential_height_{p}hPa", [])[start_index:end_index] for p in p_levels}
-    lvl_rhs = {p: hourly.get(f"relative_humidity_{p}hPa", [])[start_index:end_index] for p in p_levels}
-
-    hourly_data = []
-    today_day = now_zurich.day
-    
-    for i, time_str in enumerate(times):
-        dt = datetime.fromisoformat(time_str)
-        temp = temps[i]
-        rh = rhs[i]
-        precip = precips[i]
-        fl = freezing_levels[i]
-        t850 = temps_850[i]
-        cloud_cover = cloud_covers[i] if i < len(cloud_covers) else 0
-        is_day = is_day_list[i] if i < len(is_day_list) else 1
-
-        pressure = pressures[i] if i < len(pressures) else 1013.25
-        
-        # Build Upper Air Profile (Pressure Levels)
-        upper_air_points = []
-        for p in p_levels:
-            z_h = lvl_heights[p][i]
-            if z_h is not None:
-                upper_air_points.append({
-                    "z": z_h, 
-                    "temp": lvl_temps[p][i], 
-                    "rh": lvl_rhs[p][i] if lvl_rhs.get(p) else 80, # Fallback RH
-                    "type": f"{p}hPa"
-                })
-        
-        # Sort by altitude
-        upper_profile = sorted(upper_air_points, key=lambda x: x['z'])
-
-        # Determine User Conditions (Temp/RH)
-        # If Manual Elevation: Interpolate from Upper Profile
-        # If Auto Elevation: Use Modeled Surface Data (temps[i], rhs[i])
-        
-        user_temp = temps[i]
-        user_rh = rhs[i]
-
-        if manual_elevation is not None:
-            # Interpolation Logic
-            # Find neighbors
-            p_below = None
-            p_above = None
-            
-            for p in upper_profile:
-                if p['z'] <= display_elevation:
-                    p_below = p
-                elif p['z'] > display_elevation:
-                    p_above = p
-                    break
-            
-            if p_below and p_above:
-                # Linear Interpolation
-                fraction = (display_elevation - p_below['z']) / (p_above['z'] - p_below['z'])
-                user_temp = p_below['temp'] + fraction * (p_above['temp'] - p_below['temp'])
-                user_rh = p_below['rh'] + fraction * (p_above['rh'] - p_below['rh'])
-            elif p_above and not p_below:
-                # We are below the lowest pressure level -> Extrapolate or use lowest
-                # Often standard lapse rate is safer for boundary layer below lowest data
-                # But here we just use the lowest point to avoid crazy extrapolation
-                user_temp = p_above['temp'] + (display_elevation - p_above['z']) * -0.0065
-                user_rh = p_above['rh']
-            elif p_below and not p_above:
-                # We are above the highest pressure level -> Extrapolate using standard atmosphere
-                user_temp = p_below['temp'] + (display_elevation - p_below['z']) * -0.0065
-                user_rh = p_below['rh']
-
-        # Construct Final Profile for Calculation
-        # Always inject the user "Surface" point
-        raw_points = [{"z": display_elevation, "temp": user_temp, "type": "SFC"}] + upper_air_points
-        
-        # Sort by altitude
-        profile = sorted(raw_points, key=lambda x: x['z'])
-        
-        # Deduplication (only if VERY close, e.g. < 5m) to avoid glitches
-        clean_profile = []
-        if profile:
-            clean_profile.append(profile[0])
-            for point in profile[1:]:
-                last = clean_profile[-1]
-                if (point['z'] - last['z'] > 5): 
-                    clean_profile.append(point)
-        
-        profile = clean_profile
-
-        # Override temp/rh variables for downstream use (precip calc, etc)
-        temp = user_temp
-        rh = user_rh
-
-        # Dynamic Freezing Level Calculation (Isotherm)
-        fl = SnowPredictor.calculate_freezing_level(profile, display_elevation)
-
-        precip_info = SnowPredictor.determine_precip_type(temp, rh, fl, display_elevation, t850, pressure, profile)
-        
-        # Icon & Type Logic
-        condition_icon = precip_info['icon']
-        weather_type = precip_info['type']
-        
-        if precip == 0:
-            if cloud_cover > 75:
-                condition_icon = "☁️"
-                weather_type = "Cloudy"
-            elif cloud_cover > 25:
-                condition_icon = "⛅"
-                weather_type = "Partly Cloudy"
-            else:
-                condition_icon = "☀️" if is_day else "🌙"
-                weather_type = "Clear"
-        
-        day_label = "Today" if dt.day == today_day else "Tomorrow"
-        
-        # Build Visualization Data (Backend Logic for Frontend)
-        viz_profile = []
-        for p in profile:
-            z_rel = int(p['z'] - display_elevation)
-            
-            # Filter for relevant range (Widened for dynamic frontend scaling)
-            # We keep a large buffer (-1000 to +4000) to ensure we catch high FLs/SFGs
-            if z_rel < -1000 or z_rel > 4000:
-                continue
-
-            sign = "+" if z_rel > 0 else ""
-            label = f"{int(p['z'])}m ({sign}{z_rel}m)"
-            if p.get('type') == 'SFC':
-                label = "Surface (0m)"
-            
-            viz_profile.append({
-                "z": p['z'],
-                "temp": p['temp'],
-                "z_rel": z_rel,
-                "label": label,
-                "type": p.get('type', '')
-            })
-
-        hourly_data.append({
-            "time": dt.strftime("%H:%M"),
-            "day": day_label,
-            "temp": temp,
-            "humidity": rh,
-            "wet_bulb": round(precip_info['wet_bulb'], 1),
-            "precip": precip if precip > 0 else 0,
-            "fl": int(fl),
-            "icon": condition_icon,
-            "type": weather_type,
-            "wb_class": "wb-freezing" if precip_info['wet_bulb'] < 0.5 else ("wb-cold" if precip_info['wet_bulb'] < 1.0 else "wb-warm"),
-            "profile": profile, 
-            "viz": { 
-                "profile": viz_profile,
-                "elevation": int(display_elevation), # User Elevation for ASL labels
-                "sfg": int(fl - 300) if fl else None # Snowfall Limit (approx 300m below FL)
-            }, 
-            "areas": precip_info.get('areas', {"pos": 0, "neg": 0})
-        })
-
-    return jsonify({
-        "location": {
-            "display_name": location_data["display_name"],
-            "lat": location_data["lat"],
-            "lon": location_data["lon"]
-        },
-        "elevation": int(display_elevation),
-        "hourly_data": hourly_data
-    })
+
+@app.route("/api/predict/batch", methods=["POST"])
+def predict_batch_api():
+    """
+    Predicts several locations in one request.
+
+    Body: {"locations": [{"location": "Zermatt", "elevation": 2500}, "Davos", ...]}
+    Returns {"results": [...]} in request order; each entry is either a regular
+    /api/predict response or {"location": query, "error": message}. Accepts
+    the same formats as /api/predict.
+    """
+    data = request.json
+    items = data.get("locations") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty 'locations' list is required"}), 400
+    if len(items) > MAX_BATCH_LOCATIONS:
+        return jsonify({"error": f"At most {MAX_BATCH_LOCATIONS} locations per batch"}), 400
+
+    entries = []
+    for item in items:
+        if isinstance(item, str):
+            item = {"location": item}
+        if not isinstance(item, dict) or not item.get("location"):
+            return jsonify({"error": "Each entry needs a 'location'"}), 400
+        entries.append((item["location"], parse_elevation(item.get("elevation"))))
+
+    # Batches yield the upstream budget to single predictions
+    budget.set_priority(budget.BATCH)
+
+    # 1. Geocoding (each distinct query once)
+    with metrics.stage("geocode"):
+        locations = {query: get_location_data(query) for query, _ in entries}
+
+    # 2. Weather (cached cells are reused, misses share multi-location upstream calls)
+    found = [locations[query] for query, _ in entries if locations[query]]
+    with metrics.stage("weather"):
+        forecasts = iter(get_weather_forecasts([(loc['lat'], loc['lon']) for loc in found]))
+
+    # 3. Prepare every location, then classify all hours of all locations in one pass
+    results = []
+    blocks = []
+    for query, manual_elevation in entries:
+        location_data = locations[query]
+        if not location_data:
+            results.append({"location": query, "error": f"Could not find location '{query}'"})
+            continue
+        weather_data = next(forecasts)
+        if not weather_data:
+            results.append({"location": query, "error": "Could not fetch weather data"})
+            continue
+        with metrics.stage("prepare"):
+            block = prepare_hours(weather_data, manual_elevation)
+        blocks.append(block)
+        results.append((location_data, block))
+    if not blocks and budget.shed_retry_after() is not None:
+        return upstream_error("Could not fetch weather data", 500)
+
+    mimetype = response_format()
+    assembler = assemble if mimetype == JSON else assemble_compact
+    with metrics.stage("classify"):
+        physics = iter(classify(blocks))
+    with metrics.stage("assemble"):
+        results = [
+            assembler(result[0], result[1], next(physics)) if isinstance(result, tuple) else result
+            for result in results
+        ]
+    return encode_response({"results": results}, mimetype)
+
+
+@app.route("/api/predict/sweep", methods=["POST"])
+def predict_sweep_api():
+    """
+    Precipitation type across an elevation range for every hour.
+
+    Body: {"location": "Zermatt", "min": 400, "max": 4000, "step": 50}
+    """
+    data = request.json
+    if not data or "location" not in data:
+        return jsonify({"error": "Location query is required"}), 400
+
+    try:
+        low = float(data.get("min", 400))
+        high = float(data.get("max", 4000))
+        step = float(data.get("step", 50))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'min', 'max' and 'step' must be numbers"}), 400
+    if step <= 0 or high < low or (high - low) / step + 1 > MAX_SWEEP_STEPS:
+        return jsonify({"error": f"Invalid range (at most {MAX_SWEEP_STEPS} steps)"}), 400
+    elevations = [low + i * step for i in range(int((high - low) // step) + 1)]
+
+    location_query = data.get("location")
+    with metrics.stage("geocode"):
+        location_data = get_location_data(location_query)
+    if not location_data:
+        return upstream_error(f"Could not find location '{location_query}'", 404)
+
+    with metrics.stage("weather"):
+        weather_data = get_weather_forecast(location_data['lat'], location_data['lon'])
+    if not weather_data:
+        return upstream_error("Could not fetch weather data", 500)
+
+    with metrics.stage("sweep"):
+        body = build_sweep(location_data, weather_data, elevations)
+    with metrics.stage("serialize"):
+        return jsonify(body)
+
+
+def parse_waypoint(item) -> tuple:
+    """
+    Reads a waypoint of /api/predict/route: {"lat": .., "lon": .., "ele": ..}
+    ("elevation" also works) or [lat, lon, ele]; the elevation is optional.
+
+    Raises:
+        ValueError: With a message for the client.
+    """
+    if isinstance(item, dict):
+        lat, lon = item.get("lat"), item.get("lon")
+        elevation = item.get("ele", item.get("elevation"))
+    elif isinstance(item, (list, tuple)) and len(item) in (2, 3):
+        lat, lon, elevation = (list(item) + [None])[:3]
+    else:
+        raise ValueError("Each waypoint needs 'lat' and 'lon'")
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        raise ValueError("Each waypoint needs numeric 'lat' and 'lon'")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError("Waypoint coordinates out of range")
+    return lat, lon, parse_elevation(elevation)
+
+
+@app.route("/api/predict/route", methods=["POST"])
+def predict_route_api():
+    """
+    Precipitation type, wet-bulb and freezing level along a track (e.g. a ski
+    tour) for every hour.
+
+    Body: {"waypoints": [{"lat": 46.53, "lon": 8.56, "ele": 1450}, [46.54, 8.58, 2100], ...],
+    "start": 0, "hours": 24} ("start" and "hours" optional, within the
+    FORECAST_DAYS days of the cached forecasts). Waypoints in one grid cell
+    share its forecast; all of them are classified in one pass.
+    """
+    data = request.json
+    items = data.get("waypoints") if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "A non-empty 'waypoints' list is required"}), 400
+    if len(items) > MAX_ROUTE_WAYPOINTS:
+        return jsonify({"error": f"At most {MAX_ROUTE_WAYPOINTS} waypoints per route"}), 400
+    try:
+        waypoints = [parse_waypoint(item) for item in items]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        start = int(data.get("start", 0))
+        hours = int(data.get("hours", 24))
+    except (TypeError, ValueError):
+        return jsonify({"error": "'start' and 'hours' must be integers"}), 400
+    horizon = hours_left(FORECAST_DAYS)
+    if start < 0 or hours < 1 or start + hours > horizon:
+        return jsonify({"error": f"The range must lie within the next {horizon} hours"}), 400
+
+    # 1. Weather (one forecast per grid cell, misses share multi-location upstream calls)
+    with metrics.stage("weather"):
+        forecasts = get_weather_forecasts([(lat, lon) for lat, lon, _ in waypoints])
+    if not all(forecasts):
+        return upstream_error("Could not fetch weather data", 500)
+
+    # 2. Every waypoint and hour in one vectorized pass
+    with metrics.stage("route"):
+        body = build_route(waypoints, forecasts, offset=start, count=hours)
+    with metrics.stage("serialize"):
+        return jsonify(body)
+
+
+@app.route("/api/predict/ensemble", methods=["GET", "POST"])
+def predict_ensemble_api():
+    """
+    Multi-model ensemble for the next 24 hours: per-hour probabilities of
+    Snow/Mix/Rain/Freezing Rain and the spread of the snow line.
+
+    Body (or query string): {"location": "Zermatt", "elevation": 2500,
+    "models": ["icon_seamless", "ecmwf_ifs025"]} ("models" optional, any of
+    weather.ENSEMBLE_MODELS). The models are fetched concurrently.
+    """
+    data = request_data()
+    if not data or "location" not in data:
+        return jsonify({"error": "Location query is required"}), 400
+
+    models = data.get("models") or ENSEMBLE_MODELS
+    if isinstance(models, str):
+        models = [model.strip() for model in models.split(",") if model.strip()]
+    unknown = [model for model in models if model not in ENSEMBLE_MODELS]
+    if unknown:
+        return jsonify({"error": f"Unknown models: {', '.join(map(str, unknown))}"}), 400
+
+    location_query = data.get("location")
+    manual_elevation = parse_elevation(data.get("elevation"))
+    with metrics.stage("geocode"):
+        location_data = get_location_data(location_query)
+    if not location_data:
+        return upstream_error(f"Could not find location '{location_query}'", 404)
+
+    with metrics.stage("weather"):
+        forecasts = get_ensemble_forecasts(location_data['lat'], location_data['lon'], models)
+    if not any(forecasts.values()):
+        return upstream_error("Could not fetch weather data", 500)
+
+    with metrics.stage("ensemble"):
+        body = build_ensemble(location_data, forecasts, manual_elevation)
+    body["failed"] = [model for model, forecast in forecasts.items() if not forecast]
+    with metrics.stage("serialize"):
+        return jsonify(body)
+
+
+@app.route("/api/predict/stream", methods=["GET", "POST"])
+def predict_stream_api():
+    """
+    Streaming variant of /api/predict: same request body (including the
+    optional "start", "hours" and "resolution"), but the response is sent as
+    it is computed.
+
+    Sends Server-Sent Events if the client accepts text/event-stream, NDJSON
+    otherwise. GET requests and caching work as for /api/predict. Messages: {"event": "location", ...location header...}, one
+    {"event": "hour", "index": i, "hour": {...}} per hour, then
+    {"event": "end", "count": n}.
+    """
+    data = request_data()
+    if not data or "location" not in data:
+        return jsonify({"error": "Location query is required"}), 400
+
+    location_query = data.get("location")
+    manual_elevation = parse_elevation(data.get("elevation"))
+    try:
+        start, hours, resolution = parse_hours_range(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    steps_per_hour = 60 // resolution
+
+    # Errors before the first byte still get a regular JSON response
+    with metrics.stage("geocode"):
+        location_data = awaited("location", get_location_data, location_query)
+    if not location_data:
+        return upstream_error(f"Could not find location '{location_query}'", 404)
+
+    with metrics.stage("weather"):
+        weather_data = range_forecast(location_data, start, hours, resolution)
+    if not weather_data:
+        return upstream_error("Could not fetch weather data", 500)
+
+    display_elevation = manual_elevation if manual_elevation is not None else weather_data.get('elevation', 0)
+    use_sse = request.accept_mimetypes.best_match(["application/x-ndjson", "text/event-stream"]) == "text/event-stream"
+    mimetype = "text/event-stream" if use_sse else "application/x-ndjson"
+    etag = prediction_etag(data, location_data, weather_data, mimetype)
+    seconds = max_age(weather_data)
+    if not_modified(etag):
+        return with_cache_headers(Response(status=304), etag, seconds)
+
+    def encode(message: dict) -> str:
+        payload = json.dumps(message, separators=(",", ":"))
+        if use_sse:
+            return f"event: {message['event']}\ndata: {payload}\n\n"
+        return payload + "\n"
+
+    def generate():
+        yield encode({"event": "location", **location_header(location_data, display_elevation)})
+        count = 0
+        for hour in iter_prediction(
+            weather_data, manual_elevation, hours * steps_per_hour, start=start * steps_per_hour
+        ):
+            yield encode({"event": "hour", "index": count, "hour": hour})
+            count += 1
+        yield encode({"event": "end", "count": count})
+
+    response = Response(stream_with_context(generate()), mimetype=mimetype, headers={"X-Accel-Buffering": "no"})
+    return with_cache_headers(response, etag, seconds)
+
+
+@app.route("/api/map")
+def map_api():
+    """
+    Index of the latest snow-line map (built by gridmap.py): grid, hours and
+    the tile of each hour under /api/map/<map>/<tile>.
+    """
+    index = gridmap.latest_index()
+    if index is None:
+        return jsonify({"error": "No map has been built yet"}), 404
+    response = jsonify(index)
+    response.cache_control.public = True
+    response.cache_control.max_age = MAP_INDEX_MAX_AGE
+    return response
+
+
+@app.route("/api/map/<name>/<tile>")
+def map_tile_api(name, tile):
+    if not tile.endswith(".bin"):
+        return jsonify({"error": "Not found"}), 404
+    # send_from_directory rejects paths outside MAP_DIR and answers conditional requests
+    response = send_from_directory(
+        gridmap.MAP_DIR, f"{name}/{tile}", mimetype="application/octet-stream", max_age=MAP_TILE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+"""
+ASGI entry point: the Flask app behind an event loop that does the upstream
+waiting.
+
+For /api/predict and /api/predict/stream, the geocode and the forecast are
+awaited with non-blocking HTTP (httpx), so one process keeps hundreds of
+upstream requests in flight. The request then runs through the unchanged
+Flask view in a thread pool, which receives the awaited values through the
+WSGI environ (see app.awaited) and only does the CPU-bound work there.
+Responses are identical to the WSGI deployment. Every other route runs in
+the thread pool as it is.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001 --workers 2
+
+Needs httpx and uvicorn (requirements.txt). SNOW_ASGI_THREADS sets the
+threads per process for the Flask side (default 8; mostly CPU-bound now).
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl
+
+import app as flask_app
+import budget
+from geo import get_location_data_async
+from pipeline import forecast_days_for
+from upstream import close_async_client
+from weather import get_weather_forecast_async
+
+# Routes whose upstream I/O is awaited before they are handed to Flask
+AWAITED_ROUTES = ("/api/predict", "/api/predict/stream")
+
+THREADS = int(os.environ.get("SNOW_ASGI_THREADS", "8"))
+_executor = ThreadPoolExecutor(max_workers=THREADS, thread_name_prefix="wsgi")
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    body = await _read_body(receive)
+    environ = _environ(scope, body)
+    if scope["path"] in AWAITED_ROUTES and scope["method"] in ("GET", "HEAD", "POST"):
+        budget.begin_request()
+        try:
+            environ.update(await awaited_inputs(_request_data(scope, body)))
+        except Exception as e:
+            # Flask resolves (or rejects) the request itself
+            print(f"Error awaiting prediction inputs: {e}")
+        if budget.shed_retry_after() is not None:
+            environ["swisssnow.retry_after"] = budget.shed_retry_after()
+    await _call_flask(environ, send)
+
+
+async def awaited_inputs(data: dict) -> dict:
+    """
+    Geocodes the location and fetches the forecast of a prediction request,
+    as /api/predict would (see app.range_forecast).
+
+    Returns:
+        dict: WSGI environ entries for app.awaited ({} if the request is
+              invalid; Flask then answers with the error).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("location"), str):
+        return {}
+    try:
+        start, hours, resolution = flask_app.parse_hours_range(data)
+    except ValueError:
+        return {}
+
+    location_data = await get_location_data_async(data["location"])
+    inputs = {"swisssnow.location": location_data}
+    if location_data:
+        inputs["swisssnow.forecast"] = await get_weather_forecast_async(
+            location_data['lat'], location_data['lon'],
+            days=forecast_days_for(start + hours), minutely=resolution == 15
+        )
+    return inputs
+
+
+def _request_data(scope, body: bytes):
+    """app.request_data() from the raw request (None if there is nothing to read)."""
+    if scope["method"] in ("GET", "HEAD"):
+        # First value per name, like request.args.to_dict()
+        data = {}
+        for name, value in parse_qsl(scope.get("query_string", b"").decode("latin-1"), keep_blank_values=True):
+            data.setdefault(name, value)
+        return data
+    try:
+        return json.loads(body) if body else None
+    except ValueError:
+        return None
+
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def _environ(scope, body: bytes) -> dict:
+    """The WSGI environ of an ASGI HTTP request (PEP 3333)."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+            continue
+        key = f"HTTP_{name}"
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def _call_flask(environ: dict, send):
+    """Runs the Flask app in the thread pool, streaming its response body to `send`."""
+    loop = asyncio.get_running_loop()
+
+    def send_from_thread(message: dict):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    def run():
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response["start"] = {
+                "type": "http.response.start",
+                "status": int(status.split(" ", 1)[0]),
+                "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+            }
+
+        result = flask_app.app.wsgi_app(environ, start_response)
+        try:
+            started = False
+            for chunk in result:
+                if not chunk:
+                    continue
+                if not started:
+                    send_from_thread(response["start"])
+                    started = True
+                send_from_thread({"type": "http.response.body", "body": chunk, "more_body": True})
+            if not started:
+                send_from_thread(response["start"])
+            send_from_thread({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+    await loop.run_in_executor(_executor, run)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await close_async_client()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
@@ -0,0 +1,234 @@
+"""
+Load driver for /api/predict.
+
+Starts the upstream stand-in (bench/standin.py) and a gunicorn server for
+every combination of --workers and --worker-class, drives it with
+--concurrency client threads for --duration seconds and reports throughput
+and latency percentiles.
+
+Usage (from the backend directory):
+    python bench/load.py --workers 1,2,4 --worker-class sync,gthread --concurrency 16
+    python bench/load.py --workers 1 --worker-class sync,uvicorn --latency 300 --concurrency 64
+    python bench/load.py --latency 150 --jitter 50 --error-rate 0.02 --duration 60
+    python bench/load.py --url http://127.0.0.1:5001     # an already running server
+
+Worker class "uvicorn" runs the async entry point (asgi.py) with uvicorn
+instead; others than sync and gthread (e.g. gevent) need their package
+installed. With --url, the server must already point at its upstreams.
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import standin  # noqa: E402
+from gazetteer import get_gazetteer  # noqa: E402
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def pick_locations(count: int) -> list:
+    """The `count` best-ranked gazetteer places (distinct grid cells, offline geocoding)."""
+    places = sorted(get_gazetteer().places, key=lambda p: -p.rank)
+    seen, names = set(), []
+    for place in places:
+        cell = (round(place.lat, 2), round(place.lon, 2))
+        if cell not in seen:
+            seen.add(cell)
+            names.append(place.name)
+        if len(names) == count:
+            break
+    return names
+
+
+def start_server(workers: int, worker_class: str, threads: int, upstream: str) -> tuple:
+    """Starts gunicorn (or uvicorn, for worker class "uvicorn") on a free port; returns (process, base_url)."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        OPEN_METEO_URL=f"{upstream}/v1/forecast",
+        NOMINATIM_URL=f"{upstream}/search",
+        # Every configuration starts with an empty shared cache
+        SNOW_CACHE_PATH=os.path.join(tempfile.mkdtemp(prefix="snow-load-"), "cache.sqlite3"),
+    )
+    cmd = [
+        sys.executable, "-m", "gunicorn", "app:app",
+        "--bind", f"127.0.0.1:{port}",
+        "--workers", str(workers),
+        "--worker-class", worker_class,
+        "--log-level", "warning",
+    ]
+    if worker_class == "uvicorn":
+        # The async entry point (asgi.py) instead of gunicorn
+        cmd = [
+            sys.executable, "-m", "uvicorn", "asgi:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers),
+            "--log-level", "warning",
+        ]
+    elif worker_class == "gthread":
+        # gunicorn turns sync workers into gthread ones when threads > 1
+        cmd += ["--threads", str(threads)]
+    process = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 20
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{cmd[2]} exited with status {process.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return process, base_url
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(f"{cmd[2]} did not start within 20s")
+
+
+def drive(base_url: str, locations: list, concurrency: int, duration: float, warmup: float = 2.0) -> dict:
+    """
+    Posts /api/predict from `concurrency` threads for `duration` seconds
+    (after `warmup` seconds that are not measured) and summarizes the results.
+    """
+    url = f"{base_url}/api/predict"
+    queries = itertools.cycle(locations)
+    queries_lock = threading.Lock()
+    samples = []
+    samples_lock = threading.Lock()
+    measure_from = time.monotonic() + warmup
+    stop_at = measure_from + duration
+
+    def client():
+        session = requests.Session()
+        local = []
+        while True:
+            started = time.monotonic()
+            if started >= stop_at:
+                break
+            with queries_lock:
+                query = next(queries)
+            try:
+                status = session.post(url, json={"location": query}, timeout=60).status_code
+            except requests.RequestException:
+                status = 0
+            if started >= measure_from:
+                local.append((time.monotonic() - started, status))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, duration)
+
+
+def summarize(samples: list, duration: float) -> dict:
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status != 200)
+
+    def percentile(p):
+        if not latencies:
+            return None
+        return round(latencies[max(0, math.ceil(p / 100 * len(latencies)) - 1)] * 1000, 1)
+
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "throughput": round(len(samples) / duration, 1),
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else None,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _print_row(label: str, result: dict):
+    print(
+        f"{label:<24} {result['requests']:>8} {result['errors']:>7} {result['throughput']:>9} "
+        f"{result['p50_ms']!s:>9} {result['p95_ms']!s:>9} {result['p99_ms']!s:>9} {result['max_ms']!s:>9}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Drive an already running server instead of starting gunicorn")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated gunicorn worker counts")
+    parser.add_argument("--worker-class", default="sync,gthread", help="Comma-separated gunicorn worker classes")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per gthread worker")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client threads")
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds per configuration")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Unmeasured seconds before each run")
+    parser.add_argument("--locations", type=int, default=40, help="Distinct places to request")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stand-in latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Stand-in latency jitter in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Stand-in error rate")
+    parser.add_argument("--output", help="Write the results as JSON")
+    args = parser.parse_args()
+
+    locations = pick_locations(args.locations)
+    print(f"{'configuration':<24} {'requests':>8} {'errors':>7} {'req/s':>9} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+
+    results = []
+    if args.url:
+        result = drive(args.url.rstrip("/"), locations, args.concurrency, args.duration, args.warmup)
+        _print_row(args.url, result)
+        results.append({"url": args.url, "concurrency": args.concurrency, **result})
+    else:
+        faults = standin.Faults(args.latency, args.jitter, args.error_rate, seed=0)
+        server = standin.serve(port=0, faults=faults)
+        upstream = f"http://127.0.0.1:{server.server_port}"
+        try:
+            for worker_class in args.worker_class.split(","):
+                for workers in (int(w) for w in args.workers.split(",")):
+                    label = f"{worker_class} x{workers}" + (f" ({args.threads} threads)" if worker_class == "gthread" else "")
+                    try:
+                        process, base_url = start_server(workers, worker_class, args.threads, upstream)
+                    except RuntimeError as e:
+                        print(f"{label:<24} skipped: {e}")
+                        continue
+                    try:
+                        result = drive(base_url, locations, args.concurrency, args.duration, args.warmup)
+                    finally:
+                        process.terminate()
+                        process.wait()
+                    _print_row(label, result)
+                    results.append({
+                        "worker_class": worker_class,
+                        "workers": workers,
+                        "threads": args.threads if worker_class == "gthread" else 1,
+                        "concurrency": args.concurrency,
+                        "upstream_latency_ms": args.latency,
+                        "upstream_error_rate": args.error_rate,
+                        **result,
+                    })
+        finally:
+            server.shutdown()
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Records the live Nominatim and Open-Meteo responses for a location as a
+benchmark fixture (bench/fixtures/<scenario>.json).
+
+Usage (from the backend directory):
+    python bench/record.py inversion --location Sion \
+        --description "Valley cold pool under a warm layer"
+
+Record on a day that actually shows the scenario; check the result with
+`python bench/run.py -k <scenario>` before saving a new baseline.
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay  # noqa: E402
+from replay import geo, weather  # noqa: E402
+
+
+class Recorder:
+    """Captures the decoded upstream responses, keyed by URL."""
+
+    def __init__(self, get_json):
+        self._get_json = get_json
+        self.responses = {}
+
+    def get_json(self, url: str, params: dict = None, headers: dict = None, cost: float = 1.0):
+        data = self._get_json(url, params=params, headers=headers, cost=cost)
+        self.responses[url] = data
+        return data
+
+
+def record(scenario: str, location: str, description: str, elevation: float = None) -> dict:
+    recorder = Recorder(geo.get_json)
+    saved = (geo.get_json, weather.get_json)
+    geo.get_json = weather.get_json = recorder.get_json
+    try:
+        # Nominatim directly: the fixture should hold its response even for
+        # places the gazetteer already knows
+        location_data = geo._fetch_nominatim(location)
+        if not location_data:
+            raise SystemExit(f"Nominatim did not find '{location}'")
+        if not weather.fetch_weather_forecast(location_data["lat"], location_data["lon"]):
+            raise SystemExit("Could not fetch the Open-Meteo forecast")
+    finally:
+        geo.get_json, weather.get_json = saved
+
+    today = datetime.now(ZoneInfo("Europe/Zurich")).date().isoformat()
+    return {
+        "scenario": scenario,
+        "description": description,
+        "source": f"recorded {today}",
+        "location": location,
+        "elevation": elevation,
+        "nominatim": recorder.responses[geo.NOMINATIM_URL],
+        "open_meteo": recorder.responses[weather.OPEN_METEO_URL],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenario", help="Fixture name, e.g. 'inversion'")
+    parser.add_argument("--location", required=True, help="Query as a user would type it")
+    parser.add_argument("--description", default="")
+    parser.add_argument("--elevation", type=float, help="Manual elevation to predict for")
+    args = parser.parse_args()
+
+    fixture = record(args.scenario, args.location, args.description, args.elevation)
+    path = replay.fixture_path(args.scenario)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(fixture, f, ensure_ascii=False, separators=(",", ":"))
+        f.write("\n")
+    print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
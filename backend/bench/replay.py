@@ -0,0 +1,129 @@
+"""
+Upstream fixtures for the benchmarks and a stub that replays them.
+
+A fixture (fixtures/<scenario>.json) holds one Nominatim search response and
+one Open-Meteo forecast response for a location, as returned by the APIs:
+
+    {"scenario": ..., "description": ..., "source": "recorded 2026-01-14" | "synthetic",
+     "location": "Sion", "elevation": null,
+     "nominatim": [...], "open_meteo": {...}}
+
+New fixtures are recorded with bench/record.py.
+"""
+import atexit
+import json
+import os
+import shutil
+import sys
+import tempfile
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Replayed fixtures must never reach the default shared cache (see
+# cache.SharedStore): without a SNOW_CACHE_PATH of the caller's (tests/conftest.py
+# sets one), they get a temporary one
+if "SNOW_CACHE_PATH" not in os.environ:
+    _cache_dir = tempfile.mkdtemp(prefix="snow-bench-")
+    atexit.register(shutil.rmtree, _cache_dir, ignore_errors=True)
+    os.environ["SNOW_CACHE_PATH"] = os.path.join(_cache_dir, "cache.sqlite3")
+
+import geo  # noqa: E402
+import weather  # noqa: E402
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+SCENARIOS = ("inversion", "all-cold", "all-warm", "freezing-rain")
+
+
+def fixture_path(scenario: str) -> str:
+    return os.path.join(FIXTURES_DIR, f"{scenario}.json")
+
+
+def load(scenario: str) -> dict:
+    with open(fixture_path(scenario), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def first_hour(open_meteo: dict) -> datetime:
+    """The first forecast hour of a response, as an aware Zurich datetime."""
+    return datetime.fromisoformat(open_meteo["hourly"]["time"][0]).replace(tzinfo=ZoneInfo("Europe/Zurich"))
+
+
+def shift_to(open_meteo: dict, day: date) -> dict:
+    """
+    Returns a copy of an Open-Meteo response moved to start at `day`, like a
+    live response fetched that day (the API starts at local midnight).
+    """
+    shifted = json.loads(json.dumps(open_meteo))
+    delta = datetime.combine(day, datetime.min.time()) - first_hour(open_meteo).replace(tzinfo=None)
+    hourly = shifted["hourly"]
+    hourly["time"] = [(datetime.fromisoformat(t) + delta).strftime("%Y-%m-%dT%H:%M") for t in hourly["time"]]
+    if "current" in shifted:
+        current = shifted["current"]
+        current["time"] = (datetime.fromisoformat(current["time"]) + delta).strftime("%Y-%m-%dT%H:%M")
+    return shifted
+
+
+def select_hourly(open_meteo: dict, variables) -> dict:
+    """
+    Returns a copy of an Open-Meteo response with only the requested hourly
+    variables, as the API would answer a request for them (None: all).
+    """
+    if variables is None:
+        return open_meteo
+    keep = {"time", *variables}
+    selected = dict(open_meteo)
+    selected["hourly"] = {key: values for key, values in open_meteo["hourly"].items() if key in keep}
+    return selected
+
+
+class Replay:
+    """
+    Serves a fixture in place of the upstream APIs while active:
+
+        with Replay(load("inversion")):
+            client.post("/api/predict", json={"location": "Sion"})
+
+    The Open-Meteo response is moved to today so the usual "next 24 hours"
+    window finds its hours. Only the requested hourly variables are returned.
+    Responses are decoded from JSON text on every call, as requests does, so
+    callers never share objects. Any other URL raises requests.ConnectionError.
+    """
+
+    def __init__(self, fixture: dict, today: date = None):
+        today = today or datetime.now(ZoneInfo("Europe/Zurich")).date()
+        self._forecast = shift_to(fixture["open_meteo"], today)
+        self._open_meteo = {}
+        self._nominatim = json.dumps(fixture["nominatim"])
+        self.calls = {"open_meteo": 0, "nominatim": 0}
+        self._saved = None
+
+    def get_json(self, url: str, params: dict = None, headers: dict = None, cost: float = 1.0):
+        if url == weather.OPEN_METEO_URL:
+            self.calls["open_meteo"] += 1
+            params = params or {}
+            hourly = params.get("hourly")
+            text = self._open_meteo.get(hourly)
+            if text is None:
+                variables = hourly.split(",") if hourly else None
+                text = self._open_meteo[hourly] = json.dumps(select_hourly(self._forecast, variables))
+            n_locations = len(str(params.get("latitude", "")).split(","))
+            if n_locations == 1:
+                return json.loads(text)
+            return [json.loads(text) for _ in range(n_locations)]
+        if url == geo.NOMINATIM_URL:
+            self.calls["nominatim"] += 1
+            return json.loads(self._nominatim)
+        raise requests.ConnectionError(f"No fixture for {url}")
+
+    def __enter__(self):
+        self._saved = (geo.get_json, weather.get_json)
+        geo.get_json = weather.get_json = self.get_json
+        return self
+
+    def __exit__(self, *exc):
+        geo.get_json, weather.get_json = self._saved
+        return False
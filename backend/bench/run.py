@@ -0,0 +1,428 @@
+"""
+Benchmarks the snow engine and the /api/predict pipeline on recorded
+upstream fixtures, and compares the results with bench/baseline.json.
+
+Usage (from the backend directory):
+    python bench/run.py                  # run everything, compare with the baseline
+    python bench/run.py -k wet_bulb      # only benchmarks whose name contains "wet_bulb"
+    python bench/run.py --check          # exit 1 on changed outputs or slowdowns
+    python bench/run.py --save           # write the results as the new baseline
+
+Besides timings, every run hashes the outputs of the engine functions and of
+the full prediction for each fixture. A changed digest means the numbers
+changed; an optimization must leave every digest untouched.
+
+The startup benchmarks time cold starts in fresh interpreters: importing
+app.py (which must stay within IMPORT_BUDGET of importing its third-party
+dependencies, and must not import DEFERRED_MODULES) and the first request.
+
+Timings are only comparable on the machine that produced the baseline.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay  # noqa: E402
+from replay import SCENARIOS, geo, weather  # noqa: E402
+
+import app as app_module  # noqa: E402
+from pipeline import assemble, build_sweep, classify, prepare_hours  # noqa: E402
+from profiles import ProfileColumn  # noqa: E402
+from snow_engine import WET_BULB_FAST_DOMAIN, WET_BULB_FAST_MAX_ERROR, SnowPredictor  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Hours per fixture fed to the engine (Open-Meteo returns two days)
+FIXTURE_HOURS = 48
+
+# Elevations of the sweep benchmark (the /api/predict/sweep defaults)
+SWEEP_ELEVATIONS = [400 + 50 * i for i in range(73)]
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold starts run as on the serverless deployment (vercel.json), minus the network warm-up
+STARTUP_ENV = {"SNOW_PREFETCH": "0", "SNOW_WARMUP": "0", "SNOW_METRICS": "1"}
+
+# What app.py needs from other packages; importing app.py may take at most
+# IMPORT_BUDGET times as long as importing these alone
+STARTUP_DEPENDENCIES = "flask, flask_cors, requests, numpy"
+IMPORT_BUDGET = 1.25
+
+# Only the async entry point (httpx), the map builder's process pool
+# (multiprocessing) and MessagePack responses need these; importing app.py
+# must not load them
+DEFERRED_MODULES = ("httpx", "multiprocessing", "msgpack")
+
+
+def digest(value) -> str:
+    """Stable hash of a JSON-serializable value; floats are hashed exactly (repr)."""
+    text = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_jsonable)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def _jsonable(value):
+    if isinstance(value, ProfileColumn):
+        return value.to_points()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot hash {type(value).__name__}")
+
+
+def measure(fn, calls: int = 1, repeat: int = 5) -> dict:
+    """
+    Times `fn` (which makes `calls` calls of the measured operation) and
+    returns per-call microseconds: the median and best of `repeat` runs.
+    """
+    timer = timeit.Timer(fn)
+    loops, _ = timer.autorange()
+    runs = sorted(t / loops / calls * 1e6 for t in timer.repeat(repeat, loops))
+    return {"unit": "us", "median": round(runs[len(runs) // 2], 3), "min": round(runs[0], 3), "calls": calls}
+
+
+def startup_run(statement: str, setup: str = "") -> tuple:
+    """
+    Runs `statement` in a fresh interpreter (after `setup`, in the backend
+    directory) and returns (seconds, modules loaded afterwards).
+    """
+    script = "\n".join([
+        "import sys, time",
+        setup,
+        "started = time.perf_counter()",
+        statement,
+        "print(time.perf_counter() - started)",
+        "print(' '.join(sys.modules))",
+    ])
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=BACKEND_DIR, env={**os.environ, **STARTUP_ENV},
+        capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    return float(output[-2]), set(output[-1].split())
+
+
+def measure_startup(statement: str, setup: str = "", repeat: int = 5) -> tuple:
+    """Like measure(), over `repeat` fresh interpreters; also returns the modules loaded."""
+    [(result, modules)] = measure_startups([statement], setup, repeat)
+    return result, modules
+
+
+def measure_startups(statements: list, setup: str = "", repeat: int = 5) -> list:
+    """
+    measure_startup() of several statements, run in turns so that drift of the
+    machine affects them alike (their ratio is compared); one (result, modules)
+    per statement.
+    """
+    runs, modules = [[] for _ in statements], [set() for _ in statements]
+    for _ in range(repeat):
+        for i, statement in enumerate(statements):
+            seconds, modules[i] = startup_run(statement, setup)
+            runs[i].append(seconds * 1e6)
+    results = []
+    for times, loaded in zip(runs, modules):
+        times.sort()
+        result = {"unit": "us", "median": round(times[len(times) // 2], 3), "min": round(times[0], 3), "calls": 1}
+        results.append((result, loaded))
+    return results
+
+
+def startup_benchmarks(selected, repeat: int) -> tuple:
+    """Returns (benchmarks, startup summary for compare())."""
+    benchmarks, startup = {}, {}
+    if selected("startup/import_app"):
+        (dependencies, _), (app_import, modules) = measure_startups(
+            [f"import {STARTUP_DEPENDENCIES}", "import app"], "", repeat
+        )
+        benchmarks["startup/import_dependencies"], benchmarks["startup/import_app"] = dependencies, app_import
+        startup["import_ratio"] = app_import["median"] / dependencies["median"]
+        startup["deferred_loaded"] = sorted(m for m in DEFERRED_MODULES if m in modules)
+
+    if selected("startup/first_request"):
+        # The first /api/predict of a fresh process (after importing app.py)
+        setup = "\n".join([
+            "sys.path.insert(0, 'bench')",
+            "import replay, app",
+            "fixture = replay.load('inversion')",
+            "client = app.app.test_client()",
+        ])
+        statement = "\n".join([
+            "with replay.Replay(fixture):",
+            "    assert client.post('/api/predict', json={'location': fixture['location']}).status_code == 200",
+        ])
+        benchmarks["startup/first_request"], _ = measure_startup(statement, setup, repeat)
+    return benchmarks, startup
+
+
+class EngineInputs:
+    """Every fixture hour as the engine sees it (same arguments as pipeline.classify)."""
+
+    def __init__(self, fixtures: dict):
+        self.fixtures = fixtures
+        self.blocks = self.prepare()
+
+        self.profiles, self.temps, self.rhs, self.pressures, self.temps_850, self.elevations = [], [], [], [], [], []
+        for block in self.blocks:
+            n_hours = len(block["times"])
+            self.profiles += block["profiles"]
+            self.temps += block["temps"]
+            self.rhs += block["rhs"]
+            self.pressures += block["pressures"]
+            self.temps_850 += block["temps_850"][:n_hours]
+            self.elevations += [block["display_elevation"]] * n_hours
+
+        self.freezing_levels = [
+            SnowPredictor.calculate_freezing_level(profile, elevation)
+            for profile, elevation in zip(self.profiles, self.elevations)
+        ]
+        self.z, self.temp = SnowPredictor.stack_profiles(self.profiles)
+        self.freezing_levels_batch = SnowPredictor.calculate_freezing_level_batch(self.z, self.temp, self.elevations)
+
+    def prepare(self) -> list:
+        blocks = []
+        for fixture in self.fixtures.values():
+            open_meteo = fixture["open_meteo"]
+            blocks.append(prepare_hours(
+                open_meteo, fixture.get("elevation"), replay.first_hour(open_meteo), 0, FIXTURE_HOURS
+            ))
+        return blocks
+
+    def __len__(self):
+        return len(self.profiles)
+
+
+def micro_benchmarks(inputs: EngineInputs) -> dict:
+    """name -> (callable returning the outputs, calls per invocation)."""
+    rows = list(zip(inputs.temps, inputs.rhs, inputs.pressures))
+    profiles = list(zip(inputs.profiles, inputs.elevations))
+    hours = list(zip(
+        inputs.temps, inputs.rhs, inputs.freezing_levels, inputs.elevations,
+        inputs.temps_850, inputs.pressures, inputs.profiles
+    ))
+    n = len(inputs)
+    return {
+        "calculate_wet_bulb": (lambda: [SnowPredictor.calculate_wet_bulb(t, rh, p) for t, rh, p in rows], n),
+        "calculate_freezing_level": (
+            lambda: [SnowPredictor.calculate_freezing_level(profile, e) for profile, e in profiles], n
+        ),
+        "calculate_bourgouin_areas": (
+            lambda: [SnowPredictor.calculate_bourgouin_areas(profile) for profile, _ in profiles], n
+        ),
+        "determine_precip_type": (lambda: [SnowPredictor.determine_precip_type(*hour) for hour in hours], n),
+        "calculate_wet_bulb_batch": (
+            lambda: SnowPredictor.calculate_wet_bulb_batch(inputs.temps, inputs.rhs, inputs.pressures).tolist(), n
+        ),
+        "calculate_wet_bulb_batch[fast]": (
+            lambda: SnowPredictor.calculate_wet_bulb_batch(
+                inputs.temps, inputs.rhs, inputs.pressures, method="fast"
+            ).tolist(),
+            n
+        ),
+        "calculate_freezing_level_batch": (
+            lambda: SnowPredictor.calculate_freezing_level_batch(inputs.z, inputs.temp, inputs.elevations).tolist(), n
+        ),
+        "calculate_bourgouin_areas_batch": (
+            lambda: {k: v.tolist() for k, v in SnowPredictor.calculate_bourgouin_areas_batch(inputs.z, inputs.temp).items()},
+            n
+        ),
+        "determine_precip_type_batch": (
+            lambda: _batch_result(SnowPredictor.determine_precip_type_batch(
+                inputs.temps, inputs.rhs, inputs.freezing_levels_batch, inputs.elevations,
+                np.asarray(inputs.temps_850, dtype=float), inputs.pressures, inputs.z, inputs.temp
+            )),
+            n
+        ),
+        "prepare_hours": (inputs.prepare, n),
+        "classify": (lambda: classify(inputs.blocks), n),
+    }
+
+
+def wet_bulb_fast_error() -> float:
+    """Largest |fast - iterative| wet-bulb difference on a dense grid over the calibrated domain."""
+    (t_min, t_max), (rh_min, rh_max), (p_min, p_max) = WET_BULB_FAST_DOMAIN
+    temp, rh, pressure = np.meshgrid(
+        np.linspace(t_min, t_max, 321),
+        np.linspace(rh_min, rh_max, 201),
+        np.linspace(p_min, p_max, 56),
+        indexing="ij"
+    )
+    fast = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure, method="fast")
+    iterative = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure)
+    return float(np.abs(fast - iterative).max())
+
+
+def _batch_result(result: dict) -> dict:
+    return {
+        "type": result["type"].tolist(),
+        "icon": result["icon"].tolist(),
+        "wet_bulb": result["wet_bulb"].tolist(),
+        "pos": result["areas"]["pos"].tolist(),
+        "neg": result["areas"]["neg"].tolist(),
+    }
+
+
+def run(selected, repeat: int) -> dict:
+    fixtures = {scenario: replay.load(scenario) for scenario in SCENARIOS}
+    benchmarks, digests = {}, {}
+
+    # Micro: the engine over every fixture hour
+    inputs = EngineInputs(fixtures)
+    for name, (fn, calls) in micro_benchmarks(inputs).items():
+        name = f"micro/{name}"
+        if selected(name):
+            digests[name] = digest(fn())
+            benchmarks[name] = measure(fn, calls, repeat)
+
+    # Macro: /api/predict with the upstream APIs replayed from the fixtures
+    client = app_module.app.test_client()
+    for scenario, fixture in fixtures.items():
+        body = {"location": fixture["location"], "elevation": fixture.get("elevation")}
+        with replay.Replay(fixture):
+            # The full prediction for a fixed "now" (response of the recorded day)
+            name = f"macro/predict[{scenario}]"
+            if selected(name):
+                location_data = geo._fetch_nominatim(fixture["location"])
+                open_meteo = fixture["open_meteo"]
+                block = prepare_hours(
+                    open_meteo, fixture.get("elevation"), replay.first_hour(open_meteo), 0, FIXTURE_HOURS
+                )
+                digests[name] = digest(assemble(location_data, block, classify([block])[0]))
+
+                def cold_request():
+                    weather._forecast_cache.clear()
+                    response = client.post("/api/predict", json=body)
+                    assert response.status_code == 200, response.get_data(as_text=True)
+
+                benchmarks[name] = measure(cold_request, 1, repeat)
+
+            name = f"macro/predict_cached[{scenario}]"
+            if selected(name):
+                client.post("/api/predict", json=body)
+                benchmarks[name] = measure(lambda: client.post("/api/predict", json=body), 1, repeat)
+
+            name = f"macro/geocode_nominatim[{scenario}]"
+            if selected(name):
+                benchmarks[name] = measure(lambda: geo._fetch_nominatim(fixture["location"]), 1, repeat)
+
+            name = f"macro/sweep[{scenario}]"
+            if selected(name):
+                location_data = geo._fetch_nominatim(fixture["location"])
+                open_meteo = fixture["open_meteo"]
+                digests[name] = digest(
+                    build_sweep(location_data, open_meteo, SWEEP_ELEVATIONS, replay.first_hour(open_meteo))
+                )
+                sweep_body = {"location": fixture["location"]}
+                benchmarks[name] = measure(lambda: client.post("/api/predict/sweep", json=sweep_body), 1, repeat)
+
+    accuracy = {}
+    if selected("accuracy/wet_bulb_fast"):
+        accuracy["wet_bulb_fast_max_error"] = wet_bulb_fast_error()
+
+    startup_results, startup = startup_benchmarks(selected, repeat)
+    benchmarks.update(startup_results)
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+            "fixture_hours": len(inputs),
+        },
+        "benchmarks": benchmarks,
+        "digests": digests,
+        "accuracy": accuracy,
+        "startup": startup,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Prints a comparison table and returns the list of problems found."""
+    problems = []
+    base_benchmarks = baseline.get("benchmarks", {})
+    base_digests = baseline.get("digests", {})
+
+    print(f"{'benchmark':<48} {'median':>12} {'baseline':>12} {'ratio':>7}")
+    for name, result in results["benchmarks"].items():
+        base = base_benchmarks.get(name)
+        line = f"{name:<48} {result['median']:>10.2f}us"
+        if base:
+            ratio = result["median"] / base["median"] if base["median"] else float("inf")
+            line += f" {base['median']:>10.2f}us {ratio:>6.2f}x"
+            if ratio > tolerance:
+                line += "  SLOWER"
+                problems.append(f"{name} is {ratio:.2f}x slower than the baseline")
+        if name in results["digests"] and name in base_digests and results["digests"][name] != base_digests[name]:
+            line += "  OUTPUT CHANGED"
+            problems.append(f"{name} output differs from the baseline")
+        print(line)
+
+    error = results["accuracy"].get("wet_bulb_fast_max_error")
+    if error is not None:
+        print(f"{'accuracy/wet_bulb_fast':<48} {error:.1e} C (limit {WET_BULB_FAST_MAX_ERROR:.0e})")
+        if error > WET_BULB_FAST_MAX_ERROR:
+            problems.append(f"Fast wet-bulb is off by {error:.1e} C, more than {WET_BULB_FAST_MAX_ERROR:.0e}")
+
+    startup = results.get("startup", {})
+    if "import_ratio" in startup:
+        ratio = startup["import_ratio"]
+        print(f"{'startup/import_budget':<48} {ratio:.2f}x the dependencies (limit {IMPORT_BUDGET:.2f}x)")
+        if ratio > IMPORT_BUDGET:
+            problems.append(f"Importing app.py takes {ratio:.2f}x its dependencies, more than {IMPORT_BUDGET:.2f}x")
+        for module in startup["deferred_loaded"]:
+            problems.append(f"Importing app.py loads {module}, which must only be imported when used")
+    return problems
+
+
+def _write(path: str, results: dict):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", dest="keyword", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per benchmark (median is reported)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--save", action="store_true", help="Write the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="Exit 1 on changed outputs or slowdowns")
+    parser.add_argument("--tolerance", type=float, default=1.25, help="Slowdown ratio --check accepts")
+    args = parser.parse_args()
+
+    results = run(lambda name: args.keyword in name, args.repeat)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    problems = compare(results, baseline, args.tolerance)
+
+    if args.output:
+        _write(args.output, results)
+    if args.save:
+        # A partial run (-k) only replaces the benchmarks it ran
+        _write(args.baseline, {
+            "meta": results["meta"],
+            "benchmarks": {**baseline.get("benchmarks", {}), **results["benchmarks"]},
+            "digests": {**baseline.get("digests", {}), **results["digests"]},
+            "accuracy": {**baseline.get("accuracy", {}), **results["accuracy"]},
+        })
+
+    if problems:
+        print("\n".join(problems))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""
+Local stand-in for the Open-Meteo and Nominatim APIs, for load tests.
+
+Serves the benchmark fixtures (moved to today) in the exact shape the real
+APIs return (only the requested hourly variables), with optional latency
+and error injection. Point the backend
+at it with:
+
+    OPEN_METEO_URL=http://127.0.0.1:8081/v1/forecast
+    NOMINATIM_URL=http://127.0.0.1:8081/search
+
+Usage (from the backend directory):
+    python bench/standin.py --port 8081 --latency 120 --jitter 60 --error-rate 0.02
+
+Each forecast location gets one of the fixtures, picked by its coordinates
+(and model), so different places and ensemble members see different scenarios. Nominatim queries matching a
+fixture location return its recorded result; anything else gets a synthetic
+result at a stable point inside Switzerland.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay  # noqa: E402
+
+# Rough bounding box of Switzerland for synthetic Nominatim results
+SWISS_BOUNDS = (45.85, 47.75, 6.05, 10.45)
+
+
+class Faults:
+    """Latency and error injection settings shared by all handler threads."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+                 retry_after=None, hang_rate=0.0, hang_seconds=15.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> tuple:
+        """Returns (delay_seconds, error_status or None) for one request."""
+        with self._lock:
+            if self._random.random() < self.hang_rate:
+                return self.hang_seconds, None
+            delay = max(0.0, self.latency_ms + self._random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+            error = self.error_status if self._random.random() < self.error_rate else None
+        return delay, error
+
+
+class StandIn:
+    """Builds the response bodies from the fixtures."""
+
+    def __init__(self, scenarios=replay.SCENARIOS):
+        today = datetime.now(ZoneInfo("Europe/Zurich")).date()
+        fixtures = [replay.load(scenario) for scenario in scenarios]
+        self.forecasts = [replay.shift_to(fixture["open_meteo"], today) for fixture in fixtures]
+        self.places = {}
+        for fixture in fixtures:
+            for result in fixture["nominatim"]:
+                self.places[fixture["location"].lower()] = result
+
+    def forecast(self, params: dict):
+        lats = params.get("latitude", [""])[0].split(",")
+        lons = params.get("longitude", [""])[0].split(",")
+        if len(lats) != len(lons) or not lats[0]:
+            return 400, {"error": True, "reason": "Parameter 'latitude' and 'longitude' must have the same number of elements"}
+        try:
+            coords = [(float(lat), float(lon)) for lat, lon in zip(lats, lons)]
+        except ValueError:
+            return 400, {"error": True, "reason": "Latitude and longitude must be numbers"}
+
+        hourly = params.get("hourly", [""])[0]
+        variables = hourly.split(",") if hourly else None
+        # Other models than the default get their own scenario per location (ensembles disagree)
+        model = params.get("models", ["icon_seamless"])[0]
+        suffix = "" if model == "icon_seamless" else f",{model}"
+        responses = []
+        for lat, lon in coords:
+            scenario = _bucket(f"{lat:.2f},{lon:.2f}{suffix}", len(self.forecasts))
+            forecast = replay.select_hourly(self.forecasts[scenario], variables)
+            forecast = dict(forecast)
+            forecast["latitude"], forecast["longitude"] = lat, lon
+            responses.append(forecast)
+        return 200, responses[0] if len(responses) == 1 else responses
+
+    def search(self, params: dict):
+        query = params.get("q", [""])[0].strip()
+        if not query:
+            return 400, {"error": "Nothing to search for"}
+        known = self.places.get(query.lower())
+        if known is not None:
+            return 200, [known]
+
+        lat_min, lat_max, lon_min, lon_max = SWISS_BOUNDS
+        rng = random.Random(_bucket(query.lower(), 2 ** 32))
+        lat, lon = rng.uniform(lat_min, lat_max), rng.uniform(lon_min, lon_max)
+        return 200, [{
+            "place_id": rng.randrange(10 ** 6, 10 ** 8),
+            "licence": "Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright",
+            "osm_type": "node",
+            "osm_id": rng.randrange(10 ** 8, 10 ** 10),
+            "lat": f"{lat:.7f}",
+            "lon": f"{lon:.7f}",
+            "class": "place",
+            "type": "village",
+            "place_rank": 19,
+            "importance": 0.3,
+            "addresstype": "village",
+            "name": query,
+            "display_name": f"{query}, Schweiz/Suisse/Svizzera/Svizra",
+            "boundingbox": [f"{lat - 0.01:.7f}", f"{lat + 0.01:.7f}", f"{lon - 0.01:.7f}", f"{lon + 0.01:.7f}"],
+        }]
+
+
+def make_handler(standin: StandIn, faults: Faults, quiet: bool = True):
+    routes = {"/v1/forecast": standin.forecast, "/search": standin.search}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            route = routes.get(url.path)
+            if route is None:
+                return self._send(404, {"error": "Not found"})
+
+            delay, error = faults.draw()
+            if delay:
+                time.sleep(delay)
+            if error:
+                headers = {"Retry-After": str(faults.retry_after)} if faults.retry_after is not None else {}
+                return self._send(error, {"error": True, "reason": "Injected error"}, headers)
+            self._send(*route(parse_qs(url.query)))
+
+        def do_HEAD(self):
+            # The warm-up's connection check (see warmup.preconnect)
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _send(self, status: int, body, headers: dict = None):
+            payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            if not quiet:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8081, faults: Faults = None, quiet: bool = True) -> ThreadingHTTPServer:
+    """Starts the stand-in in a background thread and returns the server (port 0 picks a free port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(StandIn(), faults or Faults(), quiet))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _bucket(key: str, buckets: int) -> int:
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest(), 16) % buckets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean added latency in ms")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency is uniform in latency +/- jitter (ms)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with --error-status")
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=int, help="Retry-After header (seconds) sent with injected errors")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="Fraction of requests delayed by --hang-seconds")
+    parser.add_argument("--hang-seconds", type=float, default=15.0)
+    parser.add_argument("--seed", type=int, help="Seed for reproducible fault injection")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    faults = Faults(args.latency, args.jitter, args.error_rate, args.error_status,
+                    args.retry_after, args.hang_rate, args.hang_seconds, args.seed)
+    server = serve(args.host, args.port, faults, quiet=not args.verbose)
+    base = f"http://{args.host}:{server.server_port}"
+    print(f"Serving on {base}")
+    print(f"  OPEN_METEO_URL={base}/v1/forecast")
+    print(f"  NOMINATIM_URL={base}/search")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
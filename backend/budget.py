@@ -0,0 +1,328 @@
+"""
+Request budgets of the upstream APIs, shared by all workers of a host.
+
+Every upstream call (upstream.get_json) first takes tokens from the token
+bucket of its host. The buckets live in the shared SQLite file of the caches
+(cache.SHARED_CACHE_PATH), so the limits hold for all processes together;
+without that file they are per process.
+
+Calls have a priority (see priority()). Interactive calls queue: they reserve
+tokens ahead and wait for them, for at most their max_wait. Background and
+batch calls only take tokens that are already there, leaving a share of the
+bucket to interactive calls, and retry until their own max_wait. Within an
+API request (see begin_request()), all calls together wait at most
+REQUEST_MAX_WAIT, whatever their priority. A call that
+cannot get its tokens in time is shed with BudgetExceeded (a
+RequestException, so the fetchers treat it as a failed request); the API
+answers 503 with Retry-After (see shed_retry_after()).
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import metrics
+from cache import SHARED_CACHE_PATH
+
+INTERACTIVE, BACKGROUND, BATCH = "interactive", "background", "batch"
+
+
+class Limit:
+    """`rate` tokens per second, at most `burst` at once and `daily` per UTC day (None: no daily quota)."""
+    __slots__ = ("rate", "burst", "daily")
+
+    def __init__(self, rate: float, burst: float, daily: float = None):
+        self.rate = rate
+        self.burst = burst
+        self.daily = daily
+
+
+class Priority:
+    """Share of the burst left to interactive calls, and the longest wait for tokens (s)."""
+    __slots__ = ("reserve", "max_wait")
+
+    def __init__(self, reserve: float, max_wait: float):
+        self.reserve = reserve
+        self.max_wait = max_wait
+
+
+# Hosts without a limit (e.g. a local stand-in) are not budgeted
+LIMITS = {
+    # Usage policy: at most 1 request per second
+    "nominatim.openstreetmap.org": Limit(rate=1.0, burst=1.0),
+    # Free tier: 600 calls per minute, 5000 per hour, 10000 per day (weighted, see weather.call_cost)
+    "api.open-meteo.com": Limit(rate=5000 / 3600, burst=600.0, daily=10000.0),
+}
+
+# Interactive waits stay well below the host deadlines of upstream.HOST_POLICIES;
+# the long background and batch waits are for prefetching and map builds
+PRIORITIES = {
+    INTERACTIVE: Priority(reserve=0.0, max_wait=4.0),
+    BACKGROUND: Priority(reserve=0.25, max_wait=60.0),
+    BATCH: Priority(reserve=0.5, max_wait=300.0),
+}
+
+# Tokens waited for by one API request in total (e.g. a batch geocoding many
+# places), so it is shed well before gunicorn's 30s worker timeout
+REQUEST_MAX_WAIT = 10.0
+
+_priority = ContextVar("upstream_priority", default=INTERACTIVE)
+_shed = ContextVar("upstream_shed", default=None)
+_deadline = ContextVar("upstream_deadline", default=None)
+
+SHED = metrics.Counter("snow_upstream_shed_total", "Upstream calls shed by the request budget", ("host", "priority"))
+
+
+class BudgetExceeded(requests.RequestException):
+    """Raised instead of an upstream call that would exceed the host's budget."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"Request budget of {host} exhausted (retry in {retry_after:.0f}s)")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class _State:
+    __slots__ = ("tokens", "updated", "day", "used")
+
+    def __init__(self, tokens, updated, day, used):
+        self.tokens = tokens
+        self.updated = updated
+        self.day = day
+        self.used = used
+
+
+class Budget:
+    """Token buckets per host, in an SQLite file (shared) or in memory."""
+
+    def __init__(self, path: str = SHARED_CACHE_PATH, limits: dict = None):
+        self.path = path
+        self.limits = LIMITS if limits is None else limits
+        self._local = threading.local()
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def take(self, host: str, cost: float, priority: str = INTERACTIVE) -> tuple:
+        """
+        One attempt at taking `cost` tokens for a call to `host`.
+
+        Returns:
+            tuple: (taken, seconds): when taken, how long to wait before the
+                   call (queued behind earlier calls); otherwise when to try again.
+
+        Raises:
+            BudgetExceeded: If the daily quota is used up, or an interactive
+                call would wait longer than its max_wait.
+        """
+        limit = self.limits.get(host)
+        if limit is None:
+            return True, 0.0
+        policy = PRIORITIES[priority]
+        with self._state(host, limit) as state:
+            if limit.daily is not None and state.used + cost > limit.daily:
+                raise BudgetExceeded(host, _seconds_to_utc_midnight())
+            if priority == INTERACTIVE:
+                wait = max(0.0, (cost - state.tokens) / limit.rate)
+                if wait > policy.max_wait:
+                    raise BudgetExceeded(host, wait)
+                state.tokens -= cost
+                state.used += cost
+                return True, wait
+            # Leave the reserve to interactive calls (never more than the burst allows)
+            reserve = min(policy.reserve * limit.burst, max(0.0, limit.burst - cost))
+            if state.tokens - cost >= reserve:
+                state.tokens -= cost
+                state.used += cost
+                return True, 0.0
+            return False, (cost + reserve - state.tokens) / limit.rate
+
+    def block(self, host: str, seconds: float):
+        """Empties the bucket for `seconds` (the host answered 429 with Retry-After)."""
+        limit = self.limits.get(host)
+        if limit is None:
+            return
+        with self._state(host, limit) as state:
+            state.tokens = min(state.tokens, -limit.rate * seconds)
+
+    def report(self) -> dict:
+        """Per host: the tokens available now, and the calls left today (None without a daily quota)."""
+        result = {}
+        for host, limit in self.limits.items():
+            with self._state(host, limit) as state:
+                result[host] = {
+                    "tokens": round(state.tokens, 2),
+                    "burst": limit.burst,
+                    "rate": limit.rate,
+                    "daily_remaining": None if limit.daily is None else round(limit.daily - state.used, 2),
+                }
+        return result
+
+    @contextmanager
+    def _state(self, host: str, limit: Limit):
+        """The refilled state of a bucket, saved on exit (atomic across processes)."""
+        now = time.time()
+        today = datetime.now(timezone.utc).date().isoformat()
+        if not self.path:
+            with self._lock:
+                state = self._memory.get(host) or _State(limit.burst, now, today, 0.0)
+                _refill(state, limit, now, today)
+                yield state
+                self._memory[host] = state
+            return
+
+        db = self._connection()
+        # IMMEDIATE takes the write lock up front, so read-modify-write is atomic
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT tokens, updated, day, used FROM budgets WHERE host = ?", (host,)).fetchone()
+            state = _State(*row) if row else _State(limit.burst, now, today, 0.0)
+            _refill(state, limit, now, today)
+            yield state
+            db.execute(
+                "INSERT OR REPLACE INTO budgets (host, tokens, updated, day, used) VALUES (?, ?, ?, ?, ?)",
+                (host, state.tokens, state.updated, state.day, state.used)
+            )
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross threads or forks
+        db = getattr(self._local, "db", None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS budgets ("
+                "host TEXT PRIMARY KEY, tokens REAL, updated REAL, day TEXT, used REAL)"
+            )
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+
+def _refill(state: _State, limit: Limit, now: float, today: str):
+    state.tokens = min(limit.burst, state.tokens + limit.rate * max(0.0, now - state.updated))
+    state.updated = now
+    if state.day != today:
+        state.day, state.used = today, 0.0
+
+
+def _seconds_to_utc_midnight() -> float:
+    now = datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
+
+BUDGET = Budget()
+
+
+@contextmanager
+def priority(name: str):
+    """Runs the upstream calls of a block with the given priority (INTERACTIVE by default)."""
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_priority(name: str):
+    """Sets the priority of the current thread's (or task's) upstream calls."""
+    _priority.set(name)
+
+
+def acquire(host: str, cost: float = 1.0):
+    """Waits for the tokens of an upstream call; raises BudgetExceeded when it is shed."""
+    name = _priority.get()
+    deadline = _wait_deadline(name)
+    while True:
+        taken, seconds = _take(host, cost, name)
+        if not taken and time.monotonic() + seconds > deadline:
+            _shed_call(host, name, seconds)
+        time.sleep(seconds)
+        if taken:
+            return
+
+
+async def acquire_async(host: str, cost: float = 1.0):
+    """acquire() for the event loop of asgi.py."""
+    name = _priority.get()
+    deadline = _wait_deadline(name)
+    while True:
+        # The budget's SQLite transaction may wait for the file lock: not on the event loop
+        taken, seconds = await asyncio.to_thread(_take, host, cost, name)
+        if not taken and time.monotonic() + seconds > deadline:
+            _shed_call(host, name, seconds)
+        await asyncio.sleep(seconds)
+        if taken:
+            return
+
+
+def begin_request(retry_after: float = None):
+    """
+    Starts a request: its upstream calls are interactive, wait for at most
+    REQUEST_MAX_WAIT together, and shed ones are recorded (see shed_retry_after).
+    """
+    _priority.set(INTERACTIVE)
+    _shed.set({"retry_after": retry_after})
+    _deadline.set(time.monotonic() + REQUEST_MAX_WAIT)
+
+
+def begin_background(name: str = BACKGROUND):
+    """
+    Starts background work (e.g. a cache refresh): its upstream calls have
+    priority `name`, and shed ones are not reported to a request.
+    """
+    _priority.set(name)
+    _shed.set(None)
+    _deadline.set(None)
+
+
+def shed_retry_after():
+    """Seconds after which to retry, if an upstream call of this request was shed (else None)."""
+    record = _shed.get()
+    return record["retry_after"] if record else None
+
+
+def _wait_deadline(name: str) -> float:
+    """When waiting for tokens must end: the priority's max_wait, within the request's REQUEST_MAX_WAIT."""
+    deadline = time.monotonic() + PRIORITIES[name].max_wait
+    request_deadline = _deadline.get()
+    return deadline if request_deadline is None else min(deadline, request_deadline)
+
+
+def _take(host: str, cost: float, name: str) -> tuple:
+    try:
+        return BUDGET.take(host, cost, name)
+    except BudgetExceeded as e:
+        _shed_call(host, name, e.retry_after)
+    except sqlite3.Error as e:
+        # A broken budget file must not stop the service
+        print(f"Error reading request budget: {e}")
+        return True, 0.0
+
+
+def _shed_call(host: str, name: str, retry_after: float):
+    SHED.inc(host, name)
+    record = _shed.get()
+    if record is not None:
+        record["retry_after"] = max(record["retry_after"] or 0, retry_after)
+    raise BudgetExceeded(host, retry_after)
+
+
+def _budget_metrics():
+    for host, state in BUDGET.report().items():
+        yield "snow_upstream_budget_tokens", "gauge", "Upstream calls available now", state["tokens"], {"host": host}
+        if state["daily_remaining"] is not None:
+            yield ("snow_upstream_budget_daily_remaining", "gauge", "Upstream calls left today (UTC)",
+                   state["daily_remaining"], {"host": host})
+
+
+metrics.register_collector(_budget_metrics)
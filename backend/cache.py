@@ -0,0 +1,342 @@
+import json
+import os
+import sqlite3
+import threading
+import tempfile
+import time
+from collections import OrderedDict
+
+# SQLite file shared by the processes of a host (see SharedStore); set
+# SNOW_CACHE_PATH to an empty string to keep every cache per process
+SHARED_CACHE_PATH = os.environ.get("SNOW_CACHE_PATH", os.path.join(tempfile.gettempdir(), "swiss_snow_cache.sqlite3"))
+SHARED_CACHE_MAX_BYTES = int(os.environ.get("SNOW_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+
+class _Entry:
+    __slots__ = ("value", "version", "fresh_until", "stale_until")
+
+    def __init__(self, value, version, fresh_until, stale_until):
+        self.value = value
+        self.version = version
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class _Flight:
+    """A single in-progress load that concurrent callers can wait on."""
+    __slots__ = ("event", "value")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+
+
+class SharedStore:
+    """
+    Size-bounded key/value store in an SQLite file, shared by all processes
+    on the host (e.g. gunicorn workers) and kept across restarts.
+
+    The database runs in WAL mode, so readers never block each other or the
+    writer, and is memory-mapped, so reads come from the page cache instead
+    of being copied through read() calls. Values are JSON. When the values
+    exceed `max_bytes`, the least recently read ones are evicted.
+
+    Every thread of every process uses its own connection. Errors (locked or
+    unwritable database) are printed and treated as misses.
+    """
+
+    # Reads refresh the access time at most this often (seconds), to keep them read-only
+    TOUCH_INTERVAL = 60
+
+    def __init__(self, path: str, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._setup_lock = threading.Lock()
+
+    def get(self, namespace: str, key) -> tuple:
+        """
+        Returns (value, version, age_seconds) for `key`, or None.
+        """
+        try:
+            db = self._connection()
+            row = db.execute(
+                "SELECT value, version, stored, accessed FROM entries WHERE key = ?", (_key(namespace, key),)
+            ).fetchone()
+            if row is None:
+                return None
+            value, version, stored, accessed = row
+            now = time.time()
+            if now - accessed > self.TOUCH_INTERVAL:
+                with db:
+                    db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, _key(namespace, key)))
+            return json.loads(value), json.loads(version), now - stored
+        except (sqlite3.Error, OSError, ValueError) as e:
+            print(f"Error reading shared cache {self.path}: {e}")
+            return None
+
+    def put(self, namespace: str, key, version, value):
+        try:
+            text = json.dumps(value, separators=(",", ":"))
+            now = time.time()
+            db = self._connection()
+            with db:
+                db.execute(
+                    "INSERT OR REPLACE INTO entries (key, version, value, size, stored, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (_key(namespace, key), json.dumps(version), text, len(text), now, now)
+                )
+                # Keep the most recently read entries that fit in max_bytes
+                db.execute(
+                    "DELETE FROM entries WHERE key IN (SELECT key FROM ("
+                    "SELECT key, SUM(size) OVER (ORDER BY accessed DESC, key) AS total FROM entries"
+                    ") WHERE total > ?)",
+                    (self.max_bytes,)
+                )
+        except (sqlite3.Error, OSError, TypeError, ValueError) as e:
+            print(f"Error writing shared cache {self.path}: {e}")
+
+    def clear(self, namespace: str = None):
+        try:
+            db = self._connection()
+            with db:
+                if namespace is None:
+                    db.execute("DELETE FROM entries")
+                else:
+                    db.execute("DELETE FROM entries WHERE key >= ? AND key < ?", (f"{namespace}:", f"{namespace};"))
+        except (sqlite3.Error, OSError) as e:
+            print(f"Error clearing shared cache {self.path}: {e}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections must not cross threads or forks
+        db = getattr(self._local, "db", None)
+        if db is not None and self._local.pid == os.getpid():
+            return db
+        db = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(f"PRAGMA mmap_size={self.max_bytes * 2}")
+        with self._setup_lock, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, version TEXT, value TEXT, size INTEGER, stored REAL, accessed REAL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+
+def _key(namespace: str, key) -> str:
+    return f"{namespace}:{json.dumps(key, separators=(',', ':'))}"
+
+
+class ForecastCache:
+    """
+    Thread-safe, versioned LRU cache with single-flight loading and
+    stale-while-revalidate.
+
+    An entry is fresh while its version matches the requested version (e.g. the
+    current model run) and its TTL has not passed. A non-fresh entry younger than
+    `max_stale` is still served immediately while one background thread refreshes
+    it. Concurrent misses for the same key share a single loader call.
+
+    Loaders return None on failure; None is never cached, and a stale entry is
+    kept (and served) until a refresh succeeds or it ages out.
+
+    With a `shared` store, misses are looked up there before the loader is
+    called, and loaded values are written to it, so other processes (and this
+    one after a restart) do not load them again. Keys and values must then be
+    JSON-serializable.
+
+    Refresh threads start with an empty context; `background` (e.g.
+    budget.begin_background) is called first in each of them to set it up.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 3 * 3600, max_stale: float = 6 * 3600,
+                 shared: SharedStore = None, namespace: str = "cache", background=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.shared = shared
+        self.namespace = namespace
+        self.background = background
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.shared_hits = 0
+
+    def get(self, key, version, loader):
+        """
+        Returns the cached value for `key`, loading it with `loader()` if needed.
+
+        Args:
+            key: Hashable cache key (e.g. a snapped grid cell).
+            version: Freshness token; a different version makes the entry stale.
+            loader (callable): Zero-argument function fetching the value.
+
+        Returns:
+            The cached or freshly loaded value, or None if loading failed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.version == version and now < entry.fresh_until:
+                    self.hits += 1
+                    return entry.value
+                if now < entry.stale_until:
+                    self.stale_hits += 1
+                    self._refresh(key, version, loader)
+                    return entry.value
+
+            flight = self._inflight.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+                leader = True
+
+        if leader:
+            return self._load(key, version, loader, flight, allow_stale=True)
+        flight.event.wait()
+        return flight.value
+
+    def lookup(self, key, version):
+        """
+        Returns (value, fresh) without loading. value is None on a miss or when
+        the entry is too old to serve; fresh tells whether it is current.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now >= entry.stale_until:
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.version == version and now < entry.fresh_until:
+                    self.hits += 1
+                    return entry.value, True
+
+        # Another process may hold a newer value
+        shared = self._get_shared(key)
+        if shared is not None:
+            value, shared_version, age = shared
+            fresh = shared_version == version and age < self.ttl
+            if fresh or entry is None:
+                with self._lock:
+                    self.shared_hits += 1
+                    self._store(key, shared_version, value, age)
+                return value, fresh
+        if entry is not None:
+            return entry.value, False
+        with self._lock:
+            self.misses += 1
+        return None, False
+
+    def put(self, key, version, value):
+        """Stores a value loaded outside of get() (e.g. by a batched fetch)."""
+        if value is None:
+            return
+        with self._lock:
+            self._store(key, version, value)
+        if self.shared is not None:
+            self.shared.put(self.namespace, key, version, value)
+
+    def peek(self, key):
+        """Returns the cached value for `key` (fresh or stale) without loading, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "shared_hits": self.shared_hits,
+            }
+
+    def clear(self):
+        """Empties the cache, including this namespace of the shared store."""
+        with self._lock:
+            self._entries.clear()
+        if self.shared is not None:
+            self.shared.clear(self.namespace)
+
+    def _refresh(self, key, version, loader):
+        # Caller holds the lock; at most one refresh per key
+        if key not in self._inflight:
+            flight = self._inflight[key] = _Flight()
+            threading.Thread(
+                target=self._load_in_background, args=(key, version, loader, flight), daemon=True
+            ).start()
+
+    def _load_in_background(self, key, version, loader, flight):
+        if self.background is not None:
+            self.background()
+        self._load(key, version, loader, flight)
+
+    def _get_shared(self, key) -> tuple:
+        """(value, version, age) from the shared store if it is young enough to serve, else None."""
+        if self.shared is None:
+            return None
+        shared = self.shared.get(self.namespace, key)
+        if shared is None or shared[2] >= self.max_stale:
+            return None
+        return shared
+
+    def _load(self, key, version, loader, flight, allow_stale=False):
+        value = None
+        stale = False
+        try:
+            # Another process may have loaded it already (a stale copy is only
+            # served on a miss, and refreshed right away)
+            shared = self._get_shared(key)
+            if shared is not None:
+                shared_value, shared_version, age = shared
+                stale = shared_version != version or age >= self.ttl
+                if allow_stale or not stale:
+                    with self._lock:
+                        self.shared_hits += 1
+                        self._store(key, shared_version, shared_value, age)
+                    value = shared_value
+            if value is None:
+                stale = False
+                value = loader()
+                if value is not None:
+                    with self._lock:
+                        self._store(key, version, value)
+                    if self.shared is not None:
+                        self.shared.put(self.namespace, key, version, value)
+        except Exception as e:
+            print(f"Error loading cache entry {key!r}: {e}")
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if stale:
+                    self._refresh(key, version, loader)
+            flight.value = value
+            flight.event.set()
+        return value
+
+    def _store(self, key, version, value, age: float = 0.0):
+        # Caller holds the lock
+        now = time.monotonic() - age
+        self._entries[key] = _Entry(value, version, now + self.ttl, now + self.max_stale)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+# The store of this process, or None if sharing is off
+SHARED_STORE = SharedStore(SHARED_CACHE_PATH, SHARED_CACHE_MAX_BYTES) if SHARED_CACHE_PATH else None
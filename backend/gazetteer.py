@@ -0,0 +1,293 @@
+import bisect
+import gzip
+import hashlib
+import math
+import os
+import pickle
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import Counter
+from difflib import SequenceMatcher
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.tsv.gz")
+
+# Lookup index of the gazetteer (see Gazetteer.write_index), written by the
+# first load; loading it skips normalizing every name, which is most of a
+# cold start's first lookup. Not in git: build it at install time with
+# tools/build_gazetteer.py --index-only where the data directory is read-only
+INDEX_PATH = os.path.join(os.path.dirname(GAZETTEER_PATH), "gazetteer.index")
+# Bump when normalize(), the trigrams or the index layout change
+INDEX_VERSION = 1
+
+# "46.63, 8.59", "46.63 8.59" or "46.63;8.59"
+_COORDINATES = re.compile(r"^\s*([-+]?\d{1,2}(?:\.\d+)?)\s*[,;\s]\s*([-+]?\d{1,3}(?:\.\d+)?)\s*$")
+
+# Country suffixes users tend to append ("Zermatt, Switzerland")
+_COUNTRY_SUFFIX = re.compile(r",\s*(switzerland|schweiz|suisse|svizzera|svizra|ch)\s*$", re.IGNORECASE)
+
+_SAINT = re.compile(r"\b(sankt|saint|st)\b")
+
+MIN_PREFIX_LENGTH = 3
+MIN_FUZZY_RATIO = 0.85
+NEAREST_MAX_KM = 20
+
+
+def normalize(name: str) -> str:
+    """
+    Folds a place name to its lookup key: lowercase, no accents, German
+    transliterations collapsed (ü/ue -> u), "Sankt"/"Saint"/"St." unified
+    and punctuation reduced to single spaces.
+    """
+    folded = unicodedata.normalize("NFKD", name)
+    folded = "".join(c for c in folded if not unicodedata.combining(c)).lower()
+    folded = folded.replace("ae", "a").replace("oe", "o").replace("ue", "u")
+    folded = re.sub(r"[^a-z0-9]+", " ", folded).strip()
+    return _SAINT.sub("st", folded)
+
+
+def parse_coordinates(query: str):
+    """Returns (lat, lon) if the query is a valid "lat, lon" pair, else None."""
+    match = _COORDINATES.match(query)
+    if not match:
+        return None
+    lat, lon = float(match.group(1)), float(match.group(2))
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+class Place:
+    __slots__ = ("name", "aliases", "lat", "lon", "kind", "canton", "elevation", "rank")
+
+    def __init__(self, name, aliases, lat, lon, kind, canton, elevation=None, rank=0):
+        self.name = name
+        self.aliases = aliases
+        self.lat = lat
+        self.lon = lon
+        self.kind = kind
+        self.canton = canton
+        self.elevation = elevation
+        self.rank = rank
+
+    @property
+    def display_name(self) -> str:
+        label = self.name
+        if self.kind in ("peak", "pass") and self.elevation is not None:
+            label = f"{self.name} ({int(self.elevation)} m)"
+        return ", ".join(part for part in (label, self.canton, "Switzerland") if part)
+
+    def to_location(self) -> dict:
+        """Returns the place in the shape returned by geo.get_location_data."""
+        return {
+            "lat": self.lat,
+            "lon": self.lon,
+            "name": self.name,
+            "display_name": self.display_name
+        }
+
+
+class Gazetteer:
+    """
+    In-memory index of Swiss places, peaks, passes and resorts.
+
+    Lookups try, in order: exact (accent/case-insensitive) name or alias,
+    the best-ranked name starting with the query, and a trigram-filtered fuzzy
+    match. All of them are sub-millisecond for the bundled data set.
+    """
+
+    def __init__(self, places: list):
+        self.places = places
+        self._by_key = {}
+        for place in places:
+            for name in (place.name, *place.aliases):
+                key = normalize(name)
+                if not key:
+                    continue
+                best = self._by_key.get(key)
+                if best is None or place.rank > best.rank:
+                    self._by_key[key] = place
+
+        self._keys = sorted(self._by_key)
+        self._trigrams = {}
+        for idx, key in enumerate(self._keys):
+            for gram in self._grams(key):
+                self._trigrams.setdefault(gram, []).append(idx)
+
+    @classmethod
+    def load(cls, path: str = GAZETTEER_PATH, index_path: str = INDEX_PATH) -> "Gazetteer":
+        """
+        Loads a gazetteer built by tools/build_gazetteer.py, from its lookup
+        index if that was built from the same file. Otherwise the index is
+        written for the next load (if `index_path` is writable).
+
+        File format (gzip TSV, '#' comments): name, aliases (|-separated),
+        lat, lon, kind, canton, elevation, rank.
+        """
+        source = source_hash(path) if index_path else None
+        gazetteer = cls.read_index(index_path, source) if index_path else None
+        if gazetteer is not None:
+            return gazetteer
+
+        places = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#") or not line.strip():
+                    continue
+                name, aliases, lat, lon, kind, canton, elevation, rank = line.rstrip("\n").split("\t")
+                places.append(Place(
+                    name,
+                    tuple(a for a in aliases.split("|") if a),
+                    float(lat),
+                    float(lon),
+                    kind,
+                    canton,
+                    float(elevation) if elevation else None,
+                    int(rank or 0)
+                ))
+        gazetteer = cls(places)
+        if index_path:
+            try:
+                gazetteer.write_index(index_path, source)
+            except OSError as e:
+                print(f"Error writing the gazetteer index {index_path}: {e}")
+        return gazetteer
+
+    def write_index(self, path: str, source: str):
+        """Writes the lookup index (a pickle) for the gazetteer file with hash `source`."""
+        positions = {id(place): i for i, place in enumerate(self.places)}
+        index = {
+            "version": INDEX_VERSION,
+            "source": source,
+            "places": [
+                (p.name, p.aliases, p.lat, p.lon, p.kind, p.canton, p.elevation, p.rank) for p in self.places
+            ],
+            "keys": self._keys,
+            "by_key": [positions[id(self._by_key[key])] for key in self._keys],
+            "trigrams": self._trigrams,
+        }
+        # Written aside and renamed: other workers may be reading the old one
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".gazetteer-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(index, f, protocol=4)
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    @classmethod
+    def read_index(cls, path: str, source: str):
+        """Loads a prebuilt index, or returns None if it is missing or was built from another file."""
+        try:
+            with open(path, "rb") as f:
+                index = pickle.load(f)
+            if index["version"] != INDEX_VERSION or index["source"] != source:
+                return None
+            gazetteer = cls.__new__(cls)
+            gazetteer.places = [Place(*row) for row in index["places"]]
+            gazetteer._keys = index["keys"]
+            gazetteer._by_key = {key: gazetteer.places[i] for key, i in zip(index["keys"], index["by_key"])}
+            gazetteer._trigrams = index["trigrams"]
+            return gazetteer
+        except (OSError, EOFError, pickle.UnpicklingError, ValueError, TypeError, KeyError, IndexError):
+            return None
+
+    def lookup(self, query: str):
+        """
+        Resolves a free-text query to a Place.
+
+        Returns:
+            Place: The best match, or None if nothing is close enough.
+        """
+        query = _COUNTRY_SUFFIX.sub("", query)
+        candidates = [query]
+        if "," in query:
+            # "Andermatt, Uri" -> also try "Andermatt"
+            candidates.append(query.split(",", 1)[0])
+
+        keys = [normalize(c) for c in candidates]
+        for key in keys:
+            if key in self._by_key:
+                return self._by_key[key]
+        for key in keys:
+            place = self._prefix(key)
+            if place is not None:
+                return place
+        for key in keys:
+            place = self._fuzzy(key)
+            if place is not None:
+                return place
+        return None
+
+    def nearest(self, lat: float, lon: float, max_km: float = NEAREST_MAX_KM):
+        """Returns the closest place within max_km of (lat, lon), or None."""
+        best, best_d2 = None, None
+        cos_lat = math.cos(math.radians(lat))
+        for place in self.places:
+            d2 = (place.lat - lat) ** 2 + ((place.lon - lon) * cos_lat) ** 2
+            if best_d2 is None or d2 < best_d2:
+                best, best_d2 = place, d2
+        if best is None or math.sqrt(best_d2) * 111.2 > max_km:
+            return None
+        return best
+
+    def _prefix(self, key: str):
+        if len(key) < MIN_PREFIX_LENGTH:
+            return None
+        best = None
+        idx = bisect.bisect_left(self._keys, key)
+        while idx < len(self._keys) and self._keys[idx].startswith(key):
+            place = self._by_key[self._keys[idx]]
+            if best is None or place.rank > best.rank:
+                best = place
+            idx += 1
+        return best
+
+    def _fuzzy(self, key: str):
+        if len(key) < MIN_PREFIX_LENGTH + 1:
+            return None
+        shared = Counter()
+        for gram in self._grams(key):
+            shared.update(self._trigrams.get(gram, ()))
+
+        best, best_ratio = None, MIN_FUZZY_RATIO
+        for idx, _ in shared.most_common(20):
+            matcher = SequenceMatcher(None, key, self._keys[idx])
+            if matcher.quick_ratio() <= best_ratio:
+                continue
+            ratio = matcher.ratio()
+            if ratio > best_ratio:
+                best, best_ratio = self._by_key[self._keys[idx]], ratio
+        return best
+
+    @staticmethod
+    def _grams(key: str) -> set:
+        padded = f"  {key} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def source_hash(path: str) -> str:
+    """The hash of a gazetteer file its index is checked against."""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Returns the process-wide gazetteer, loading it on first use (once, see warmup.py)."""
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                try:
+                    _gazetteer = Gazetteer.load()
+                except (OSError, ValueError) as e:
+                    print(f"Error loading gazetteer: {e}")
+                    _gazetteer = Gazetteer([])
+    return _gazetteer
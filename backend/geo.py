@@ -1,8 +1,39 @@
+import asyncio
+import functools
+import os
 import requests
+from cache import SHARED_STORE, ForecastCache
+from gazetteer import get_gazetteer, parse_coordinates
+from upstream import USER_AGENT, get_json, get_json_async
+
+# Override to point at a local stand-in (see bench/standin.py)
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+
+# Nominatim results per normalized query, shared by all workers (places do not move)
+GEOCODE_TTL = 30 * 24 * 3600
+GEOCODE_VERSION = "1"
+_geocode_cache = ForecastCache(
+    max_entries=1024, ttl=GEOCODE_TTL, max_stale=GEOCODE_TTL, shared=SHARED_STORE, namespace="geocode"
+)
+
+# Queries Nominatim found nothing for are not sent again for a while
+GEOCODE_MISS_TTL = 3600
+_miss_cache = ForecastCache(
+    max_entries=1024, ttl=GEOCODE_MISS_TTL, max_stale=GEOCODE_MISS_TTL, shared=SHARED_STORE, namespace="geocode_miss"
+)
+
+# Nominatim requests in flight on the event loop of asgi.py, per normalized query
+_pending_lookups = {}
 
 def get_location_data(query: str) -> dict:
     """
-    Fetches location data from Nominatim (OpenStreetMap) API.
+    Resolves a location query to coordinates.
+    
+    Coordinates ("46.63, 8.59") are parsed directly and names are looked up in
+    the bundled Swiss gazetteer. Only gazetteer misses go to Nominatim
+    (OpenStreetMap), whose usage policy allows about 1 request per second;
+    its results are cached (across workers, see cache.SharedStore), and
+    queries it finds nothing for are not sent again for GEOCODE_MISS_TTL.
     
     Args:
         query (str): The location name or coordinates (e.g., "Andermatt" or "46.63, 8.59").
@@ -11,40 +42,123 @@ def get_location_data(query: str) -> dict:
         dict: A dictionary containing 'lat', 'lon', 'name', 'display_name'.
               Returns None if location is not found or error occurs.
     """
+    coordinates = parse_coordinates(query)
+    if coordinates:
+        return _coordinate_location(*coordinates)
+
+    place = get_gazetteer().lookup(query)
+    if place is not None:
+        return place.to_location()
+
+    key = _query_key(query)
+    if _known_miss(key):
+        return None
+    return _geocode_cache.get(key, GEOCODE_VERSION, lambda: _fetch_nominatim(query))
+
+
+def _coordinate_location(lat: float, lon: float) -> dict:
+    name = f"{lat:.4f}, {lon:.4f}"
+    nearby = get_gazetteer().nearest(lat, lon)
+    return {
+        "lat": lat,
+        "lon": lon,
+        "name": name,
+        "display_name": f"{name} (near {nearby.name})" if nearby else name
+    }
+
+
+def _fetch_nominatim(query: str) -> dict:
+    """
+    Fetches location data from Nominatim (OpenStreetMap) API.
+    """
     try:
-        # Check if query is likely coordinates
-        if "," in query and any(char.isdigit() for char in query):
-            # Simple coordinate parsing logic could be added here if needed,
-            # but Nominatim search also handles "lat, lon" strings often.
-            pass
-
-        url = "https://nominatim.openstreetmap.org/search"
-        params = {
-            "q": query,
-            "format": "json",
-            "limit": 1,
-            "countrycodes": "ch" # Limit to Switzerland
-        }
-        headers = {
-            "User-Agent": "SwissSnowPredictor/1.0" # Required by Nominatim policy
-        }
-
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()
-        
-        data = response.json()
-        
-        if not data:
-            return None
-            
-        location = data[0]
-        return {
-            "lat": float(location["lat"]),
-            "lon": float(location["lon"]),
-            "name": location["name"],
-            "display_name": location["display_name"]
-        }
-        
+        data = get_json(*_nominatim_request(query))
     except requests.RequestException as e:
         print(f"Error fetching location data: {e}")
         return None
+    return _found(query, data)
+
+
+async def get_location_data_async(query: str) -> dict:
+    """
+    Async counterpart of get_location_data (same caches), for asgi.py. Only
+    the Nominatim request of a gazetteer miss is awaited; concurrent misses
+    for the same query share one request.
+    """
+    coordinates = parse_coordinates(query)
+    if coordinates:
+        return _coordinate_location(*coordinates)
+
+    place = get_gazetteer().lookup(query)
+    if place is not None:
+        return place.to_location()
+
+    key = _query_key(query)
+    location, _ = _geocode_cache.lookup(key, GEOCODE_VERSION)
+    if location is not None or _known_miss(key):
+        return location
+    pending = _pending_lookups.get(key)
+    if pending is None:
+        pending = _pending_lookups[key] = asyncio.ensure_future(_fetch_nominatim_async(query))
+        pending.add_done_callback(functools.partial(_looked_up, key))
+    # Shielded: a cancelled request does not cancel a lookup others wait on
+    return await asyncio.shield(pending)
+
+
+async def _fetch_nominatim_async(query: str) -> dict:
+    try:
+        data = await get_json_async(*_nominatim_request(query))
+    except requests.RequestException as e:
+        print(f"Error fetching location data: {e}")
+        return None
+    location = _found(query, data)
+    _geocode_cache.put(_query_key(query), GEOCODE_VERSION, location)
+    return location
+
+
+def _looked_up(key: str, pending):
+    _pending_lookups.pop(key, None)
+
+
+def _query_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _known_miss(key: str) -> bool:
+    miss, _ = _miss_cache.lookup(key, GEOCODE_VERSION)
+    return miss is not None
+
+
+def _found(query: str, data: list) -> dict:
+    """The location of a Nominatim answer; an empty one is remembered as a miss."""
+    location = _nominatim_location(data)
+    if location is None:
+        _miss_cache.put(_query_key(query), GEOCODE_VERSION, True)
+    return location
+
+
+def _nominatim_request(query: str) -> tuple:
+    """(url, params, headers) of a Nominatim search."""
+    params = {
+        "q": query,
+        "format": "json",
+        "limit": 1,
+        "countrycodes": "ch" # Limit to Switzerland
+    }
+    headers = {
+        "User-Agent": USER_AGENT # Required by Nominatim policy
+    }
+    return NOMINATIM_URL, params, headers
+
+
+def _nominatim_location(data: list) -> dict:
+    if not data:
+        return None
+
+    location = data[0]
+    return {
+        "lat": float(location["lat"]),
+        "lon": float(location["lon"]),
+        "name": location["name"],
+        "display_name": location["display_name"]
+    }
@@ -0,0 +1,357 @@
+"""
+Snow-line and precipitation-type map of Switzerland.
+
+Builds, for every forecast hour, the snow line and the precipitation type at
+the model terrain on a regular lat/lon grid, and writes them as binary tiles
+that can be served as they are (see /api/map in app.py):
+
+    python gridmap.py --step 0.2 --hours 24 --workers 4
+
+Forecasts are fetched with multi-location requests (bypassing the
+per-request cache, which they would flush), and the classification runs in a
+process pool, one chunk of cells per task. Every build gets a directory of
+its own (tiles are served as immutable) and is published by atomically
+replacing 'latest.json' in the output directory; the KEEP_MAPS latest builds
+are kept for clients that still hold an older index.
+
+Builds draw on the daily Open-Meteo quota that /api/predict needs too
+(budget.LIMITS): every cell costs about 5 calls (MAP_VARIABLES and all
+pressure levels), so the default 0.2° grid (253 cells) costs ~1300 calls and
+a 0.1° grid (966 cells) ~5000. Run it once or twice a day, not after every
+model run. A build that would use more than MAP_BUDGET_SHARE of what is left
+of the day's quota is refused before fetching anything.
+
+Tile format (little-endian), one file per hour named by its valid time in UTC
+('YYYYMMDDTHHMMZ.bin') plus 'terrain.bin':
+
+    header   TILE_HEADER: magic b"SNWT", version, layer kind, rows, cols,
+             lat_min, lon_min, step (float32, degrees; cell centres) and the
+             valid time (unix seconds; 0 for terrain)
+    hour     uint16[rows * cols] snow line in m (NO_SNOW_LINE: none/no data),
+             then uint8[rows * cols] type index into PRECIP_TYPES at the
+             terrain (DRY: no precipitation, NO_DATA: no forecast)
+    terrain  int16[rows * cols] model terrain height in m (NO_TERRAIN: no data)
+
+Rows run south to north, columns west to east (row-major).
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+import budget
+from pipeline import classify, forecast_days_for, prepare_hours, snow_lines, sweep
+from snow_engine import PRECIP_TYPES
+from weather import (
+    GRID_RESOLUTION_DEG, MAX_LOCATIONS_PER_REQUEST, OPEN_METEO_URL, current_model_run, fetch_weather_forecasts,
+    forecast_cost
+)
+
+# Bounding box of Switzerland (lat_min, lat_max, lon_min, lon_max)
+SWISS_BOUNDS = (45.80, 47.82, 5.94, 10.50)
+
+# Snow lines are searched on these elevations (the Swiss terrain spans ~190-4630 m)
+MAP_ELEVATIONS = list(range(200, 4601, 100))
+
+# Output directory of the map job and /api/map
+MAP_DIR = os.environ.get("SNOW_MAP_DIR", os.path.join(tempfile.gettempdir(), "swiss_snow_map"))
+
+# Builds kept in MAP_DIR (the index is cached for MAP_INDEX_MAX_AGE in app.py)
+KEEP_MAPS = 3
+
+TILE_MAGIC = b"SNWT"
+TILE_VERSION = 1
+TILE_HEADER = struct.Struct("<4sBBHHfffi")
+HOUR_TILE, TERRAIN_TILE = 1, 2
+
+NO_SNOW_LINE = 0xFFFF
+DRY = 254
+NO_DATA = 255
+NO_TERRAIN = -32768
+
+# Concurrent upstream requests of the map job (each one covers MAX_LOCATIONS_PER_REQUEST cells)
+FETCH_CONCURRENCY = 2
+
+# Grid spacing in degrees (multiple of GRID_RESOLUTION_DEG)
+DEFAULT_STEP = 0.2
+
+# Hourly surface series the map uses (besides every pressure level). The type
+# at each elevation integrates the column above it and interpolates between the
+# levels around it, so all levels are fetched; the other series of a
+# prediction (cloud cover, weather code, current conditions) are not.
+MAP_VARIABLES = ("temperature_2m", "relative_humidity_2m", "precipitation", "surface_pressure")
+
+# Largest share of the remaining daily Open-Meteo quota one build may use;
+# the rest is left to predictions
+MAP_BUDGET_SHARE = 0.5
+
+
+class MapBudgetExceeded(Exception):
+    """A map build would use too much of the day's upstream quota."""
+
+
+class Grid:
+    """Cell centres of the map, aligned to the forecast grid."""
+    __slots__ = ("lat_min", "lon_min", "step", "rows", "cols")
+
+    def __init__(self, step: float = DEFAULT_STEP, bounds: tuple = SWISS_BOUNDS):
+        # Whole forecast grid cells, so every map cell is exactly one forecast cell
+        self.step = max(GRID_RESOLUTION_DEG, round(step / GRID_RESOLUTION_DEG) * GRID_RESOLUTION_DEG)
+        lat_min, lat_max, lon_min, lon_max = bounds
+        self.lat_min = round(round(lat_min / GRID_RESOLUTION_DEG) * GRID_RESOLUTION_DEG, 4)
+        self.lon_min = round(round(lon_min / GRID_RESOLUTION_DEG) * GRID_RESOLUTION_DEG, 4)
+        self.rows = int((lat_max - self.lat_min) // self.step) + 1
+        self.cols = int((lon_max - self.lon_min) // self.step) + 1
+
+    def __len__(self):
+        return self.rows * self.cols
+
+    def coords(self) -> list:
+        """(lat, lon) of every cell, row-major from the south-west corner."""
+        return [
+            (round(self.lat_min + r * self.step, 4), round(self.lon_min + c * self.step, 4))
+            for r in range(self.rows) for c in range(self.cols)
+        ]
+
+    def header(self, kind: int, valid_time: int = 0) -> bytes:
+        return TILE_HEADER.pack(
+            TILE_MAGIC, TILE_VERSION, kind, self.rows, self.cols,
+            self.lat_min, self.lon_min, self.step, valid_time
+        )
+
+    def to_dict(self) -> dict:
+        return {"lat_min": self.lat_min, "lon_min": self.lon_min, "step": self.step,
+                "rows": self.rows, "cols": self.cols}
+
+
+def fetch_cost(coords: list, days: int) -> float:
+    """The Open-Meteo calls fetch_grid() costs (see weather.call_cost)."""
+    return sum(forecast_cost(chunk, days=days, surface=MAP_VARIABLES) for chunk in _chunks(coords))
+
+
+def check_budget(cost: float):
+    """
+    Raises MapBudgetExceeded if `cost` calls are more than MAP_BUDGET_SHARE
+    of what is left of today's Open-Meteo quota (hosts without a daily quota,
+    e.g. a local stand-in, are not checked).
+    """
+    host = urlsplit(OPEN_METEO_URL).hostname
+    remaining = budget.BUDGET.report().get(host, {}).get("daily_remaining")
+    if remaining is not None and cost > MAP_BUDGET_SHARE * remaining:
+        raise MapBudgetExceeded(
+            f"The map would cost {cost:.0f} Open-Meteo calls, more than {MAP_BUDGET_SHARE:.0%} of the "
+            f"{remaining:.0f} left today; use a coarser --step or build it later"
+        )
+
+
+def fetch_grid(coords: list, days: int, concurrency: int = FETCH_CONCURRENCY) -> list:
+    """
+    Fetches the forecasts of all cells with multi-location requests.
+
+    Returns:
+        list: One forecast per coordinate (None where a request failed).
+    """
+    chunks = _chunks(coords)
+    def fetch(chunk):
+        # Map builds only use what single predictions leave of the upstream budget
+        budget.set_priority(budget.BATCH)
+        return fetch_weather_forecasts(chunk, days=days, surface=MAP_VARIABLES)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = pool.map(fetch, chunks)
+        forecasts = []
+        for chunk, fetched in zip(chunks, results):
+            fetched = fetched or []
+            forecasts += fetched[:len(chunk)] + [None] * (len(chunk) - len(fetched))
+    return forecasts
+
+
+def classify_cells(forecasts: list, now: datetime, hours: int) -> tuple:
+    """
+    Snow lines and terrain types of a chunk of cells (runs in a worker process).
+
+    Returns:
+        tuple: (snow_line uint16 (cells, hours), type uint8 (cells, hours), terrain int16 (cells,)).
+    """
+    n = len(forecasts)
+    lines = np.full((n, hours), NO_SNOW_LINE, dtype=np.uint16)
+    codes = np.full((n, hours), NO_DATA, dtype=np.uint8)
+    terrain = np.full(n, NO_TERRAIN, dtype=np.int16)
+    type_codes = {name: code for code, name in enumerate(PRECIP_TYPES)}
+
+    cells = [i for i, forecast in enumerate(forecasts) if forecast]
+    blocks = [prepare_hours(forecasts[i], None, now, 0, hours) for i in cells]
+    # All terrain types of the chunk in one batch
+    for i, block, physics in zip(cells, blocks, classify(blocks)):
+        terrain[i] = int(round(block["display_elevation"]))
+        for h, (precip, precip_type) in enumerate(zip(block["precips"], physics["type"])):
+            codes[i, h] = type_codes[precip_type] if precip else DRY
+
+        for h, line in enumerate(snow_lines(sweep(forecasts[i], MAP_ELEVATIONS, now, hours)["type"], MAP_ELEVATIONS)):
+            if line is not None:
+                lines[i, h] = line
+    return lines, codes, terrain
+
+
+def build_map(step: float = DEFAULT_STEP, hours: int = 24, workers: int = None, out_dir: str = MAP_DIR,
+              concurrency: int = FETCH_CONCURRENCY, cells_per_task: int = 50) -> str:
+    """
+    Runs the map job and publishes the result in `out_dir`.
+
+    Returns:
+        str: The directory of the new map.
+
+    Raises:
+        MapBudgetExceeded: If the build would use too much of the daily quota (see check_budget).
+    """
+    now = datetime.now(ZoneInfo("Europe/Zurich"))
+    grid = Grid(step)
+    coords = grid.coords()
+    days = forecast_days_for(hours, now)
+    check_budget(fetch_cost(coords, days))
+
+    started = time.perf_counter()
+    forecasts = fetch_grid(coords, days, concurrency)
+    fetched = time.perf_counter()
+
+    lines = np.full((len(grid), hours), NO_SNOW_LINE, dtype=np.uint16)
+    codes = np.full((len(grid), hours), NO_DATA, dtype=np.uint8)
+    terrain = np.full(len(grid), NO_TERRAIN, dtype=np.int16)
+    tasks = range(0, len(coords), cells_per_task)
+    # Looked up here so importing this module (app.py does) skips multiprocessing
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(classify_cells, forecasts[i:i + cells_per_task], now, hours) for i in tasks]
+        for i, future in zip(tasks, futures):
+            chunk_lines, chunk_codes, chunk_terrain = future.result()
+            lines[i:i + len(chunk_terrain)] = chunk_lines
+            codes[i:i + len(chunk_terrain)] = chunk_codes
+            terrain[i:i + len(chunk_terrain)] = chunk_terrain
+    classified = time.perf_counter()
+
+    times = _hour_times(forecasts, now, hours)
+    run = current_model_run()
+    map_dir = write_tiles(out_dir, run, grid, times, lines, codes, terrain)
+    missing = sum(1 for forecast in forecasts if not forecast)
+    print(f"Map {run}: {len(grid)} cells x {len(times)} hours ({missing} without forecast), "
+          f"fetch {fetched - started:.1f}s, classify {classified - fetched:.1f}s -> {map_dir}")
+    return map_dir
+
+
+def write_tiles(out_dir: str, run: str, grid: Grid, times: list, lines: np.ndarray,
+                codes: np.ndarray, terrain: np.ndarray) -> str:
+    """Writes the tiles and index of a map and points 'latest.json' at it."""
+    zurich = ZoneInfo("Europe/Zurich")
+    generated = datetime.now(zurich)
+    name = f"{run.replace(':', '')}-{generated:%Y%m%dT%H%M%S}"
+    map_dir = os.path.join(out_dir, name)
+    staging = tempfile.mkdtemp(prefix=f".{name}-", dir=_makedirs(out_dir))
+
+    tiles = []
+    for h, time_str in enumerate(times):
+        valid = datetime.fromisoformat(time_str).replace(tzinfo=zurich)
+        valid_time = int(valid.timestamp())
+        tile = f"{valid.astimezone(timezone.utc):%Y%m%dT%H%MZ}.bin"
+        with open(os.path.join(staging, tile), "wb") as f:
+            f.write(grid.header(HOUR_TILE, valid_time))
+            f.write(lines[:, h].astype("<u2").tobytes())
+            f.write(codes[:, h].tobytes())
+        tiles.append({"time": time_str, "tile": tile})
+    with open(os.path.join(staging, "terrain.bin"), "wb") as f:
+        f.write(grid.header(TERRAIN_TILE))
+        f.write(terrain.astype("<i2").tobytes())
+
+    index = {
+        "run": run,
+        "map": name,
+        "generated": generated.isoformat(timespec="seconds"),
+        "grid": grid.to_dict(),
+        "elevations": [MAP_ELEVATIONS[0], MAP_ELEVATIONS[-1], MAP_ELEVATIONS[1] - MAP_ELEVATIONS[0]],
+        "types": list(PRECIP_TYPES),
+        "codes": {"no_snow_line": NO_SNOW_LINE, "dry": DRY, "no_data": NO_DATA, "no_terrain": NO_TERRAIN},
+        "terrain": "terrain.bin",
+        "hours": tiles,
+    }
+    with open(os.path.join(staging, "index.json"), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+
+    # Publish, then drop builds older than the KEEP_MAPS latest ones
+    os.replace(staging, map_dir)
+    _write_atomic(os.path.join(out_dir, "latest.json"), json.dumps({"map": name, "run": run}))
+    _remove_old_maps(out_dir, keep=name)
+    return map_dir
+
+
+def latest_index(out_dir: str = None) -> dict:
+    """The index of the published map (in MAP_DIR by default), or None if there is none."""
+    out_dir = out_dir or MAP_DIR
+    try:
+        with open(os.path.join(out_dir, "latest.json"), encoding="utf-8") as f:
+            latest = json.load(f)
+        with open(os.path.join(out_dir, latest["map"], "index.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def _remove_old_maps(out_dir: str, keep: str):
+    maps = sorted(
+        entry.name for entry in os.scandir(out_dir)
+        if entry.is_dir() and not entry.name.startswith(".")
+        and os.path.exists(os.path.join(entry.path, "index.json"))
+    )
+    for name in maps[:-KEEP_MAPS]:
+        if name != keep:
+            shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def _hour_times(forecasts: list, now: datetime, hours: int) -> list:
+    for forecast in forecasts:
+        if forecast:
+            return prepare_hours(forecast, None, now, 0, hours)["times"]
+    return []
+
+
+def _chunks(coords: list) -> list:
+    return [coords[i:i + MAX_LOCATIONS_PER_REQUEST] for i in range(0, len(coords), MAX_LOCATIONS_PER_REQUEST)]
+
+
+def _makedirs(path: str) -> str:
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _write_atomic(path: str, text: str):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".latest-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--step", type=float, default=DEFAULT_STEP, help="Grid spacing in degrees (multiple of 0.02)")
+    parser.add_argument("--hours", type=int, default=24, help="Hours from the current hour")
+    parser.add_argument("--workers", type=int, help="Classification processes (default: CPU count)")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="Concurrent upstream requests")
+    parser.add_argument("--out", default=MAP_DIR, help="Output directory (SNOW_MAP_DIR)")
+    args = parser.parse_args()
+    if not 1 <= args.hours <= 48:
+        sys.exit("--hours must be between 1 and 48")
+    try:
+        build_map(args.step, args.hours, args.workers, args.out, args.concurrency)
+    except MapBudgetExceeded as e:
+        sys.exit(str(e))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+# Set SNOW_METRICS=0 to turn instrumentation off; every hook then returns
+# immediately (or is a shared no-op context manager).
+ENABLED = os.environ.get("SNOW_METRICS", "1").lower() not in ("0", "false", "no", "off")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+_registry = []
+_collectors = []
+_timings = ContextVar("server_timings", default=None)
+_NOOP = nullcontext()
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, help: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # labels -> [per-bucket counts..., +Inf bucket, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        if not ENABLED:
+            return
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    le = _labels(self.labelnames + ("le",), labels + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(series[-1])}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("snow_stage_seconds", "Time spent per request stage", ("stage",))
+REQUEST_SECONDS = Histogram("snow_request_seconds", "Request duration", ("endpoint", "status"))
+RESPONSE_BYTES = Histogram(
+    "snow_response_bytes", "Response body size", ("endpoint", "format"), buckets=SIZE_BUCKETS
+)
+UPSTREAM_SECONDS = Histogram("snow_upstream_seconds", "Upstream HTTP attempt duration", ("host", "outcome"))
+UPSTREAM_RETRIES = Counter("snow_upstream_retries_total", "Upstream attempts that were retried", ("host",))
+
+
+class _Stage:
+    __slots__ = ("name", "started")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        STAGE_SECONDS.observe(elapsed, self.name)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((self.name, elapsed))
+        return False
+
+
+def stage(name: str):
+    """
+    Times a block as one request stage:
+
+        with metrics.stage("geocode"):
+            ...
+
+    The duration goes into snow_stage_seconds and, inside a request, into the
+    Server-Timing header.
+    """
+    if not ENABLED:
+        return _NOOP
+    return _Stage(name)
+
+
+def begin_request():
+    """Starts collecting Server-Timing entries for the current request."""
+    if ENABLED:
+        _timings.set([])
+
+
+def server_timing() -> str:
+    """Returns the Server-Timing header value for the current request (or "")."""
+    timings = _timings.get()
+    if not timings:
+        return ""
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings)
+
+
+def register_collector(collect):
+    """
+    Adds a callable evaluated on every scrape. It returns an iterable of
+    (name, type, help, value) tuples, e.g. counters kept by another module,
+    optionally with a fifth item: a dict of labels.
+    """
+    _collectors.append(collect)
+
+
+def render() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines += metric.render()
+    for collect in _collectors:
+        described = set()
+        for name, kind, help, value, *labels in collect():
+            if name not in described:
+                described.add(name)
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            labels = labels[0] if labels else {}
+            lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = (f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,883 @@
+import bisect
+import statistics
+from collections.abc import Mapping, Sequence
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+
+from profiles import SURFACE, ProfileColumn
+from snow_engine import SnowPredictor
+
+P_LEVELS = [1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 700, 650, 600, 550, 500]
+
+
+def parse_elevation(value):
+    """Parses the optional manual elevation from a request; invalid or empty -> None."""
+    if value and value != '':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def hour_window(all_times: list, now: datetime = None, offset: int = 0, count: int = 24) -> tuple:
+    """
+    Returns (start_index, end_index, now_zurich) for `count` steps starting
+    `offset` steps after the current hour in Zurich (default: the next 24 hours).
+    """
+    # Find start index for current hour in Zurich timezone (times are sorted ISO strings)
+    now_zurich = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    current_hour_iso = now_zurich.strftime("%Y-%m-%dT%H:00")
+    start_index = bisect.bisect_left(all_times, current_hour_iso)
+    if start_index == len(all_times):
+        start_index = 0
+
+    # Slice next 24 hours
+    start_index += offset
+    return start_index, start_index + count, now_zurich
+
+
+def forecast_days_for(hours: int, now: datetime = None) -> int:
+    """Days from local midnight (Open-Meteo's forecast_days) covering `hours` hours from the current hour."""
+    now_zurich = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    return (now_zurich.hour + hours - 1) // 24 + 1
+
+
+def hours_left(days: int, now: datetime = None) -> int:
+    """Hours from the current hour to the end of a forecast of `days` days from local midnight."""
+    now_zurich = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    return days * 24 - now_zurich.hour
+
+
+def day_label(dt: datetime, now: datetime) -> str:
+    """'Today', 'Tomorrow', then the weekday ('Saturday') for later days."""
+    days = (dt.date() - now.date()).days
+    if days <= 0:
+        return "Today"
+    if days == 1:
+        return "Tomorrow"
+    return dt.strftime("%A")
+
+
+class _PerQuarterHour(Sequence):
+    """An hourly series read at 15-minute steps (each step gets the value of its hour)."""
+    __slots__ = ("values", "hour_index")
+
+    def __init__(self, values: list, hour_index: list):
+        self.values = values
+        self.hour_index = hour_index
+
+    def __len__(self):
+        return len(self.hour_index)
+
+    def __getitem__(self, i):
+        values = self.values
+        if isinstance(i, slice):
+            return [values[h] if h < len(values) else None for h in self.hour_index[i]]
+        h = self.hour_index[i]
+        return values[h] if h < len(values) else None
+
+
+class QuarterHourly(Mapping):
+    """
+    The 'hourly' block of an Open-Meteo response at 15-minute resolution.
+
+    Series in 'minutely_15' are used as they are; every other series
+    (pressure levels, cloud cover, surface pressure) repeats the value of the
+    hour containing the step. Nothing is copied up front, so prepare_hours
+    only pays for the steps it slices. 'precipitation' is per 15 minutes.
+    """
+
+    def __init__(self, weather_data: dict):
+        self.hourly = weather_data.get("hourly", {})
+        self.minutely = weather_data.get("minutely_15", {})
+        hour_times = self.hourly.get("time", [])
+        # Compare on the hour ("2026-01-15T10") so 10:15 maps to 10:00
+        hours = [t[:13] for t in hour_times]
+        self.times = self.minutely.get("time", [])
+        self.hour_index = [max(bisect.bisect_right(hours, t[:13]) - 1, 0) for t in self.times]
+
+    def __getitem__(self, key):
+        if key == "time":
+            return self.times
+        if key in self.minutely:
+            return self.minutely[key]
+        return _PerQuarterHour(self.hourly[key], self.hour_index)
+
+    def __contains__(self, key):
+        return key in self.minutely or key in self.hourly
+
+    def __iter__(self):
+        return iter(dict.fromkeys([*self.hourly, *self.minutely]))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+
+def quarter_hourly(weather_data: dict) -> dict:
+    """
+    Returns a view of `weather_data` whose 'hourly' block has 15-minute steps
+    (see QuarterHourly), for prepare_hours. Responses without 'minutely_15'
+    are returned unchanged.
+    """
+    if not weather_data.get("minutely_15", {}).get("time"):
+        return weather_data
+    return {**weather_data, "hourly": QuarterHourly(weather_data)}
+
+
+def prepare_hours(weather_data: dict, manual_elevation: float = None, now: datetime = None,
+                  offset: int = 0, count: int = 24) -> dict:
+    """
+    Slices the next 24 hours (or `count` hours from `offset`) from an Open-Meteo
+    response and builds the per-hour profiles and user conditions at the
+    display elevation.
+
+    Returns:
+        dict: The sliced hourly series plus 'profiles' (a ProfileColumn per
+              hour), 'temps', 'rhs', 'pressures' and 'display_elevation',
+              ready for classify().
+    """
+    # Process Data & Apply Manual Elevation logic handled dynamically in loop
+    base_elevation = weather_data.get('elevation', 0)
+    display_elevation = manual_elevation if manual_elevation is not None else base_elevation
+
+    # Hourly data processing
+    hourly = weather_data.get("hourly", {})
+    all_times = hourly.get("time", [])
+    start_index, end_index, now_zurich = hour_window(all_times, now, offset, count)
+
+    times = all_times[start_index:end_index]
+    temps = hourly.get("temperature_2m", [])[start_index:end_index]
+    rhs = hourly.get("relative_humidity_2m", [])[start_index:end_index]
+    pressures = hourly.get("surface_pressure", [])[start_index:end_index]
+
+    # Pre-extract multi-level profile data
+    lvl_temps = {p: hourly.get(f"temperature_{p}hPa", [])[start_index:end_index] for p in P_LEVELS}
+    lvl_heights = {p: hourly.get(f"geopotential_height_{p}hPa", [])[start_index:end_index] for p in P_LEVELS}
+    lvl_rhs = {p: hourly.get(f"relative_humidity_{p}hPa", [])[start_index:end_index] for p in P_LEVELS}
+
+    # Per-hour rows of the level values (in P_LEVELS order)
+    heights_by_hour = list(zip(*(lvl_heights[p] for p in P_LEVELS)))
+    temps_by_hour = list(zip(*(lvl_temps[p] for p in P_LEVELS)))
+    rhs_by_hour = list(zip(*(lvl_rhs[p] or [80] * len(times) for p in P_LEVELS)))  # Fallback RH
+
+    # Build the per-hour profiles and user conditions
+    hour_profiles = []
+    hour_temps = []
+    hour_rhs = []
+    hour_pressures = []
+
+    for i, time_str in enumerate(times):
+        pressure = pressures[i] if i < len(pressures) else 1013.25
+
+        # Build Upper Air Profile (Pressure Levels), sorted by altitude
+        column = ProfileColumn.from_levels(P_LEVELS, heights_by_hour[i], temps_by_hour[i], rhs_by_hour[i])
+
+        # Determine User Conditions (Temp/RH)
+        # If Manual Elevation: Interpolate from Upper Profile (standard lapse rate
+        # above/below it, to avoid crazy extrapolation of the boundary layer)
+        # If Auto Elevation: Use Modeled Surface Data (temps[i], rhs[i])
+
+        user_temp = temps[i]
+        user_rh = rhs[i]
+
+        if manual_elevation is not None:
+            conditions = column.interpolate(display_elevation)
+            if conditions is not None:
+                user_temp, user_rh = conditions
+
+        # Construct Final Profile for Calculation
+        # Always inject the user "Surface" point (near-duplicate heights < 5m are dropped)
+        hour_profiles.append(column.with_surface(display_elevation, user_temp))
+        hour_temps.append(user_temp)
+        hour_rhs.append(user_rh)
+        hour_pressures.append(pressure)
+
+    return {
+        "now": now_zurich,
+        "display_elevation": display_elevation,
+        "times": times,
+        "precips": hourly.get("precipitation", [])[start_index:end_index],
+        "temps_850": hourly.get("temperature_850hPa", [])[start_index:end_index],
+        "cloud_covers": hourly.get("cloud_cover", [])[start_index:end_index],
+        "is_day_list": hourly.get("is_day", [])[start_index:end_index],
+        "profiles": hour_profiles,
+        "temps": hour_temps,
+        "rhs": hour_rhs,
+        "pressures": hour_pressures,
+    }
+
+
+def classify(blocks: list) -> list:
+    """
+    Runs the physics for every hour of every prepared block in one batch call.
+
+    Args:
+        blocks (list): Results of prepare_hours (one per location/elevation).
+
+    Returns:
+        list: Per block, a dict of per-hour lists: 'fl', 'wet_bulb', 'type',
+              'icon', 'pos', 'neg'.
+    """
+    profiles, temps, rhs, pressures, temps_850, elevations = [], [], [], [], [], []
+    for block in blocks:
+        n_hours = len(block["times"])
+        profiles += block["profiles"]
+        temps += block["temps"]
+        rhs += block["rhs"]
+        pressures += block["pressures"]
+        block_850 = block["temps_850"][:n_hours]
+        temps_850 += block_850 + [None] * (n_hours - len(block_850))
+        elevations += [block["display_elevation"]] * n_hours
+
+    if not profiles:
+        return [{key: [] for key in ("fl", "wet_bulb", "type", "icon", "pos", "neg")} for _ in blocks]
+
+    profile_z, profile_temp = SnowPredictor.stack_profiles(profiles)
+
+    # Dynamic Freezing Level Calculation (Isotherm)
+    fl_levels = SnowPredictor.calculate_freezing_level_batch(profile_z, profile_temp, elevations)
+
+    precip_batch = SnowPredictor.determine_precip_type_batch(
+        temps, rhs, fl_levels, elevations, np.asarray(temps_850, dtype=float), pressures,
+        profile_z, profile_temp
+    )
+
+    columns = {
+        "fl": fl_levels.tolist(),
+        "wet_bulb": precip_batch['wet_bulb'].tolist(),
+        "type": precip_batch['type'].tolist(),
+        "icon": precip_batch['icon'].tolist(),
+        "pos": precip_batch['areas']['pos'].tolist(),
+        "neg": precip_batch['areas']['neg'].tolist(),
+    }
+
+    results = []
+    offset = 0
+    for block in blocks:
+        n_hours = len(block["times"])
+        results.append({key: values[offset:offset + n_hours] for key, values in columns.items()})
+        offset += n_hours
+    return results
+
+
+def assemble(location_data: dict, block: dict, physics: dict) -> dict:
+    """Builds the /api/predict response body from a prepared and classified block."""
+    response = location_header(location_data, block["display_elevation"])
+    response["hourly_data"] = assemble_hours(block, physics)
+    return response
+
+
+def location_header(location_data: dict, display_elevation: float) -> dict:
+    """The location part of a /api/predict response."""
+    return {
+        "location": {
+            "display_name": location_data["display_name"],
+            "lat": location_data["lat"],
+            "lon": location_data["lon"]
+        },
+        "elevation": int(display_elevation)
+    }
+
+
+def hour_condition(icon: str, precip_type: str, precip: float, cloud_cover: float, is_day: int) -> tuple:
+    """Returns the (icon, type) shown for an hour; dry hours show the sky instead."""
+    if precip == 0:
+        if cloud_cover > 75:
+            return "☁️", "Cloudy"
+        if cloud_cover > 25:
+            return "⛅", "Partly Cloudy"
+        return ("☀️" if is_day else "🌙"), "Clear"
+    return icon, precip_type
+
+
+def assemble_hours(block: dict, physics: dict) -> list:
+    """Builds the 'hourly_data' entries of a prepared and classified block."""
+    display_elevation = block["display_elevation"]
+    hourly_data = []
+
+    for i, time_str in enumerate(block["times"]):
+        dt = datetime.fromisoformat(time_str)
+        precip = block["precips"][i]
+        cloud_covers = block["cloud_covers"]
+        is_day_list = block["is_day_list"]
+        cloud_cover = cloud_covers[i] if i < len(cloud_covers) else 0
+        is_day = is_day_list[i] if i < len(is_day_list) else 1
+        profile = block["profiles"][i]
+
+        # Override temp/rh variables for downstream use (precip calc, etc)
+        temp = block["temps"][i]
+        rh = block["rhs"][i]
+        fl = physics["fl"][i]
+        wet_bulb = physics["wet_bulb"][i]
+
+        # Icon & Type Logic
+        condition_icon, weather_type = hour_condition(
+            physics["icon"][i], physics["type"][i], precip, cloud_cover, is_day
+        )
+
+        day = day_label(dt, block["now"])
+
+        # Build Visualization Data (Backend Logic for Frontend)
+        viz_profile = []
+        for z, point_temp, level in zip(profile.z, profile.temp, profile.level):
+            z_rel = int(z - display_elevation)
+
+            # Filter for relevant range (Widened for dynamic frontend scaling)
+            # We keep a large buffer (-1000 to +4000) to ensure we catch high FLs/SFGs
+            if z_rel < -1000 or z_rel > 4000:
+                continue
+
+            sign = "+" if z_rel > 0 else ""
+            label = f"{int(z)}m ({sign}{z_rel}m)"
+            if level == SURFACE:
+                label = "Surface (0m)"
+
+            viz_profile.append({
+                "z": z,
+                "temp": point_temp,
+                "z_rel": z_rel,
+                "label": label,
+                "type": "SFC" if level == SURFACE else f"{level}hPa"
+            })
+
+        hourly_data.append({
+            "time": dt.strftime("%H:%M"),
+            "day": day,
+            "temp": temp,
+            "humidity": rh,
+            "wet_bulb": round(wet_bulb, 1),
+            "precip": precip if precip > 0 else 0,
+            "fl": int(fl),
+            "icon": condition_icon,
+            "type": weather_type,
+            "wb_class": "wb-freezing" if wet_bulb < 0.5 else ("wb-cold" if wet_bulb < 1.0 else "wb-warm"),
+            "profile": profile.to_points(),
+            "viz": {
+                "profile": viz_profile,
+                "elevation": int(display_elevation), # User Elevation for ASL labels
+                "sfg": int(fl - 300) if fl else None # Snowfall Limit (approx 300m below FL)
+            },
+            "areas": {"pos": physics["pos"][i], "neg": physics["neg"][i]}
+        })
+
+    return hourly_data
+
+
+def assemble_compact(location_data: dict, block: dict, physics: dict) -> dict:
+    """
+    Builds the compact (columnar) form of a /api/predict response.
+
+    Every per-hour field is one array indexed by hour, and each hour's profile
+    is sent once as parallel arrays. Values are the same as in the default
+    shape; what the client can derive is left out:
+
+        viz.profile  -> profiles filtered to -1000..+4000 m around 'elevation'
+        viz.sfg      -> fl - 300
+        wb_class     -> from wet_bulb (< 0.5 freezing, < 1.0 cold, else warm)
+        profile type -> "SFC" where level is 0, else f"{level}hPa"
+
+    Profile 'rh' is null for the surface point, which has no humidity.
+    """
+    cloud_covers = block["cloud_covers"]
+    is_day_list = block["is_day_list"]
+
+    hours = {key: [] for key in (
+        "time", "day", "temp", "humidity", "wet_bulb", "precip", "fl", "icon", "type", "pos", "neg"
+    )}
+    profiles = {"level": [], "z": [], "temp": [], "rh": []}
+
+    for i, time_str in enumerate(block["times"]):
+        dt = datetime.fromisoformat(time_str)
+        precip = block["precips"][i]
+        cloud_cover = cloud_covers[i] if i < len(cloud_covers) else 0
+        is_day = is_day_list[i] if i < len(is_day_list) else 1
+        icon, weather_type = hour_condition(physics["icon"][i], physics["type"][i], precip, cloud_cover, is_day)
+
+        hours["time"].append(dt.strftime("%H:%M"))
+        hours["day"].append(day_label(dt, block["now"]))
+        hours["temp"].append(block["temps"][i])
+        hours["humidity"].append(block["rhs"][i])
+        hours["wet_bulb"].append(round(physics["wet_bulb"][i], 1))
+        hours["precip"].append(precip if precip > 0 else 0)
+        hours["fl"].append(int(physics["fl"][i]))
+        hours["icon"].append(icon)
+        hours["type"].append(weather_type)
+        hours["pos"].append(physics["pos"][i])
+        hours["neg"].append(physics["neg"][i])
+
+        profile = block["profiles"][i]
+        profiles["level"].append(profile.level)
+        profiles["z"].append(profile.z)
+        profiles["temp"].append(profile.temp)
+        profiles["rh"].append(profile.rh)
+
+    return {
+        "format": "compact",
+        **location_header(location_data, block["display_elevation"]),
+        "hours": hours,
+        "profiles": profiles
+    }
+
+
+def build_prediction(location_data: dict, weather_data: dict, manual_elevation: float = None) -> dict:
+    """Runs the full prediction for one location: prepare, classify, assemble."""
+    block = prepare_hours(weather_data, manual_elevation)
+    return assemble(location_data, block, classify([block])[0])
+
+
+def upper_air_arrays(hourly: dict, start_index: int, end_index: int) -> tuple:
+    """
+    Builds the pressure-level profile of every hour as height-sorted arrays.
+
+    Returns:
+        tuple: (z, temp, rh), each of shape (hours, levels), NaN-padded on the
+               right where a level has no geopotential height.
+    """
+    n_hours = len(hourly.get("time", [])[start_index:end_index])
+    z = np.full((n_hours, len(P_LEVELS)), np.nan)
+    temp = np.full((n_hours, len(P_LEVELS)), np.nan)
+    rh = np.full((n_hours, len(P_LEVELS)), np.nan)
+    for j, p in enumerate(P_LEVELS):
+        _fill(z[:, j], hourly.get(f"geopotential_height_{p}hPa", [])[start_index:end_index])
+        _fill(temp[:, j], hourly.get(f"temperature_{p}hPa", [])[start_index:end_index])
+        rhs = hourly.get(f"relative_humidity_{p}hPa", [])[start_index:end_index]
+        if rhs:
+            _fill(rh[:, j], rhs)
+        else:
+            rh[:, j] = 80 # Fallback RH
+
+    # Sort by altitude (stable, missing levels last)
+    order = np.argsort(np.where(np.isnan(z), np.inf, z), axis=1, kind="stable")
+    return tuple(np.take_along_axis(a, order, axis=1) for a in (z, temp, rh))
+
+
+def _fill(column: np.ndarray, values: list):
+    n = min(len(column), len(values))
+    column[:n] = np.asarray(values[:n], dtype=float)
+
+
+def _padded(values: list, n: int, fill=np.nan) -> np.ndarray:
+    column = np.full(n, fill, dtype=float)
+    _fill(column, values)
+    return column
+
+
+def interpolate_at(z, temp, rh, elevation, fallback_temp, fallback_rh) -> tuple:
+    """
+    Vectorized version of the manual-elevation interpolation in prepare_hours:
+    linear between the neighbouring levels, standard lapse rate (and the
+    nearest level's RH) above or below the profile.
+
+    Args:
+        z, temp, rh: Sorted, NaN-padded profile arrays of shape (rows, levels).
+        elevation: Per-row elevations.
+        fallback_temp, fallback_rh: Per-row values used when a row has no levels.
+
+    Returns:
+        tuple: (temp, rh) at the given elevations.
+    """
+    rows = np.arange(z.shape[0])
+    valid = ~np.isnan(z)
+    n_valid = valid.sum(axis=1)
+    n_below = (valid & (z <= elevation[:, None])).sum(axis=1)
+
+    below = np.maximum(n_below - 1, 0)
+    above = np.minimum(n_below, z.shape[1] - 1)
+    zb, tb, rb = z[rows, below], temp[rows, below], rh[rows, below]
+    za, ta, ra = z[rows, above], temp[rows, above], rh[rows, above]
+
+    has_below = n_below > 0
+    has_above = n_below < n_valid
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = (elevation - zb) / (za - zb)
+        user_temp = np.where(
+            has_below & has_above, tb + fraction * (ta - tb),
+            np.where(has_above, ta + (elevation - za) * -0.0065, tb + (elevation - zb) * -0.0065)
+        )
+        user_rh = np.where(has_below & has_above, rb + fraction * (ra - rb), np.where(has_above, ra, rb))
+    has_levels = n_valid > 0
+    return np.where(has_levels, user_temp, fallback_temp), np.where(has_levels, user_rh, fallback_rh)
+
+
+def insert_surface(z, temp, elevation, surface_temp) -> tuple:
+    """
+    Inserts the surface point into sorted profiles and applies the same < 5 m
+    deduplication as prepare_hours, without re-sorting.
+
+    Returns:
+        tuple: (z, temp) of shape (rows, levels + 1), sorted and NaN-padded.
+    """
+    n_rows, n_levels = z.shape
+    valid = ~np.isnan(z)
+    # The surface point goes before any level at exactly the same height
+    position = (valid & (z < elevation[:, None])).sum(axis=1)
+
+    cols = np.arange(n_levels + 1)
+    src = np.where(cols < position[:, None], cols, cols - 1).clip(0, max(n_levels - 1, 0))
+    is_surface = cols == position[:, None]
+    merged_z = np.where(is_surface, elevation[:, None], np.take_along_axis(z, src, axis=1))
+    merged_t = np.where(is_surface, surface_temp[:, None], np.take_along_axis(temp, src, axis=1))
+
+    # Deduplication (only if VERY close, e.g. < 5m) against the last kept point
+    keep = ~np.isnan(merged_z)
+    last_z = merged_z[:, 0].copy()
+    for j in range(1, n_levels + 1):
+        keep[:, j] &= merged_z[:, j] - last_z > 5
+        last_z = np.where(keep[:, j], merged_z[:, j], last_z)
+
+    # Compact the kept points to the left, preserving order
+    order = np.argsort(~keep, axis=1, kind="stable")
+    kept = np.take_along_axis(keep, order, axis=1)
+    return (
+        np.where(kept, np.take_along_axis(merged_z, order, axis=1), np.nan),
+        np.where(kept, np.take_along_axis(merged_t, order, axis=1), np.nan),
+    )
+
+
+SNOW_TYPES = ("Snow", "Wet Snow")
+
+# Sweeps evaluate the wet-bulb for every (hour, elevation) cell, so they use the
+# fixed-step solver (within 1e-7 °C of the iterative one, see snow_engine)
+SWEEP_WET_BULB_METHOD = "fast"
+
+
+def sweep(weather_data: dict, elevations: list, now: datetime = None, count: int = 24) -> dict:
+    """
+    Classifies every hour at every elevation in one vectorized pass.
+
+    The pressure-level profile of each hour is built and sorted once; each
+    elevation then only interpolates its surface point and inserts it. Results
+    per elevation match /api/predict with that manual elevation.
+
+    Returns:
+        dict: 'now', 'times' and 'precips' of the hours, and the arrays 'code',
+              'type', 'wet_bulb', 'fl', 'pos' and 'neg' of shape (hours, elevations).
+    """
+    hourly = weather_data.get("hourly", {})
+    start_index, end_index, now_zurich = hour_window(hourly.get("time", []), now, 0, count)
+    times = hourly.get("time", [])[start_index:end_index]
+    n_hours, n_elev = len(times), len(elevations)
+
+    upper_z, upper_t, upper_rh = upper_air_arrays(hourly, start_index, end_index)
+    pressures = _padded(hourly.get("surface_pressure", [])[start_index:end_index], n_hours, 1013.25)
+    temps_850 = _padded(hourly.get("temperature_850hPa", [])[start_index:end_index], n_hours)
+
+    # Rows are hour-major: (hour 0, every elevation), (hour 1, every elevation), ...
+    elevation = np.tile(np.asarray(elevations, dtype=float), n_hours)
+    z = np.repeat(upper_z, n_elev, axis=0)
+    temp = np.repeat(upper_t, n_elev, axis=0)
+    rh = np.repeat(upper_rh, n_elev, axis=0)
+
+    surface_temps = _padded(hourly.get("temperature_2m", [])[start_index:end_index], n_hours)
+    surface_rhs = _padded(hourly.get("relative_humidity_2m", [])[start_index:end_index], n_hours)
+    user_temp, user_rh = interpolate_at(
+        z, temp, rh, elevation, np.repeat(surface_temps, n_elev), np.repeat(surface_rhs, n_elev)
+    )
+    profile_z, profile_temp = insert_surface(z, temp, elevation, user_temp)
+
+    fl_levels = SnowPredictor.calculate_freezing_level_batch(profile_z, profile_temp, elevation)
+    precip_batch = SnowPredictor.determine_precip_type_batch(
+        user_temp, user_rh, fl_levels, elevation,
+        np.repeat(temps_850, n_elev),
+        np.repeat(pressures, n_elev),
+        profile_z, profile_temp,
+        wet_bulb_method=SWEEP_WET_BULB_METHOD
+    )
+
+    shape = (n_hours, n_elev)
+    return {
+        "now": now_zurich,
+        "times": times,
+        "precips": hourly.get("precipitation", [])[start_index:end_index],
+        "code": precip_batch['code'].reshape(shape),
+        "type": precip_batch['type'].reshape(shape),
+        "wet_bulb": precip_batch['wet_bulb'].reshape(shape),
+        "fl": fl_levels.reshape(shape),
+        "pos": precip_batch['areas']['pos'].reshape(shape),
+        "neg": precip_batch['areas']['neg'].reshape(shape),
+    }
+
+
+def snow_lines(types: np.ndarray, elevations: list) -> list:
+    """
+    Per hour (row of `types`), the lowest elevation from which every higher
+    step is snow, or None if the highest step is not snow. Elevations ascending.
+    """
+    is_snow = np.isin(types, SNOW_TYPES)
+    lines = []
+    for row in is_snow:
+        snow_line = None
+        if len(elevations) and row[-1]:
+            not_snow = np.flatnonzero(~row)
+            snow_line = elevations[not_snow[-1] + 1] if len(not_snow) else elevations[0]
+        lines.append(snow_line)
+    return lines
+
+
+def build_sweep(location_data: dict, weather_data: dict, elevations: list, now: datetime = None) -> dict:
+    """
+    Classifies every hour at every elevation (see sweep()).
+
+    Returns:
+        dict: Location, the elevation axis and, per hour, columnar lists
+              ('type', 'wet_bulb', 'fl', 'pos', 'neg') plus the 'snow_line':
+              the lowest elevation from which all higher steps are snow.
+    """
+    result = sweep(weather_data, elevations, now)
+    types, wet_bulbs, fls, pos, neg = (result[key] for key in ("type", "wet_bulb", "fl", "pos", "neg"))
+    lines = snow_lines(types, elevations)
+
+    precips = result["precips"]
+    hourly_data = []
+    for i, time_str in enumerate(result["times"]):
+        dt = datetime.fromisoformat(time_str)
+        precip = precips[i] if i < len(precips) else 0
+        hourly_data.append({
+            "time": dt.strftime("%H:%M"),
+            "day": day_label(dt, result["now"]),
+            "precip": precip if precip > 0 else 0,
+            "snow_line": lines[i],
+            "type": types[i].tolist(),
+            "wet_bulb": [round(wb, 1) for wb in wet_bulbs[i].tolist()],
+            "fl": [int(fl) for fl in fls[i].tolist()],
+            "pos": pos[i].tolist(),
+            "neg": neg[i].tolist(),
+        })
+
+    return {
+        "location": {
+            "display_name": location_data["display_name"],
+            "lat": location_data["lat"],
+            "lon": location_data["lon"]
+        },
+        "elevations": list(elevations),
+        "hourly_data": hourly_data
+    }
+
+
+def route(forecasts: list, elevations: list, now: datetime = None, offset: int = 0, count: int = 24) -> dict:
+    """
+    Classifies every hour at every waypoint of a track in one vectorized pass.
+
+    Waypoints in the same grid cell get the same forecast object; its
+    pressure-level profile is built and sorted once, as in sweep(). Results
+    per waypoint match /api/predict at its position and manual elevation.
+
+    Args:
+        forecasts (list): Per waypoint, the forecast of its grid cell.
+        elevations (list): Per waypoint, its elevation (None: the model terrain).
+
+    Returns:
+        dict: 'now', 'times' and 'elevations' (per waypoint, as used), and the
+              arrays 'precip', 'type', 'wet_bulb', 'fl', 'pos' and 'neg' of
+              shape (hours, waypoints).
+    """
+    now = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    cells = {}
+    for forecast in forecasts:
+        cells.setdefault(id(forecast), (len(cells), forecast))
+    index = np.array([cells[id(forecast)][0] for forecast in forecasts], dtype=int)
+
+    # Per cell: the window's hours and its upper-air profiles
+    columns = []
+    for _, forecast in cells.values():
+        hourly = forecast.get("hourly", {})
+        start_index, end_index, _ = hour_window(hourly.get("time", []), now, offset, count)
+        columns.append((hourly, start_index, end_index, upper_air_arrays(hourly, start_index, end_index)))
+    # Cells are fetched for the same day; a shorter one limits the window
+    times = min((hourly.get("time", [])[start:end] for hourly, start, end, _ in columns), key=len, default=[])
+    n_hours, n_points = len(times), len(forecasts)
+    n_levels = max((upper[0].shape[1] for *_, upper in columns), default=0)
+
+    # Cell arrays of shape (cells, hours, levels), NaN-padded to the deepest profile
+    upper = [np.full((len(columns), n_hours, n_levels), np.nan) for _ in range(3)]
+    surface = {name: np.full((len(columns), n_hours), np.nan) for name in (
+        "temperature_2m", "relative_humidity_2m", "surface_pressure", "temperature_850hPa", "precipitation"
+    )}
+    surface["surface_pressure"][:] = 1013.25
+    for c, (hourly, start_index, end_index, arrays) in enumerate(columns):
+        for target, array in zip(upper, arrays):
+            target[c, :, :array.shape[1]] = array[:n_hours]
+        for name, target in surface.items():
+            _fill(target[c], hourly.get(name, [])[start_index:end_index][:n_hours])
+
+    # Rows are hour-major: (hour 0, every waypoint), (hour 1, every waypoint), ...
+    def rows(cell_array):
+        return np.swapaxes(cell_array[index], 0, 1).reshape((n_hours * n_points,) + cell_array.shape[2:])
+
+    terrain = [forecast.get("elevation", 0) for forecast in forecasts]
+    point_elevations = np.array([t if e is None else e for e, t in zip(elevations, terrain)], dtype=float)
+    manual = np.tile([e is not None for e in elevations], n_hours)
+    elevation = np.tile(point_elevations, n_hours)
+
+    z, temp, rh = (rows(a) for a in upper)
+    surface_temps, surface_rhs = rows(surface["temperature_2m"]), rows(surface["relative_humidity_2m"])
+    user_temp, user_rh = interpolate_at(z, temp, rh, elevation, surface_temps, surface_rhs)
+    # Without an elevation, the waypoint gets the modeled surface conditions
+    user_temp = np.where(manual, user_temp, surface_temps)
+    user_rh = np.where(manual, user_rh, surface_rhs)
+    profile_z, profile_temp = insert_surface(z, temp, elevation, user_temp)
+
+    fl_levels = SnowPredictor.calculate_freezing_level_batch(profile_z, profile_temp, elevation)
+    precip_batch = SnowPredictor.determine_precip_type_batch(
+        user_temp, user_rh, fl_levels, elevation,
+        rows(surface["temperature_850hPa"]),
+        rows(surface["surface_pressure"]),
+        profile_z, profile_temp,
+        wet_bulb_method=SWEEP_WET_BULB_METHOD
+    )
+
+    shape = (n_hours, n_points)
+    return {
+        "now": now,
+        "times": times,
+        "elevations": point_elevations.tolist(),
+        "precip": rows(surface["precipitation"]).reshape(shape),
+        "type": precip_batch['type'].reshape(shape),
+        "wet_bulb": precip_batch['wet_bulb'].reshape(shape),
+        "fl": fl_levels.reshape(shape),
+        "pos": precip_batch['areas']['pos'].reshape(shape),
+        "neg": precip_batch['areas']['neg'].reshape(shape),
+    }
+
+
+def build_route(waypoints: list, forecasts: list, now: datetime = None, offset: int = 0, count: int = 24) -> dict:
+    """
+    Classifies every hour at every waypoint of a track (see route()).
+
+    Args:
+        waypoints (list): (lat, lon, elevation) per waypoint (elevation may be None).
+        forecasts (list): Per waypoint, the forecast of its grid cell.
+
+    Returns:
+        dict: The waypoints (with the elevations used), the number of grid
+              'cells' they span and, per hour, columnar lists along the track
+              ('precip', 'type', 'wet_bulb', 'fl'; None where the forecast
+              has no data).
+    """
+    result = route(forecasts, [elevation for _, _, elevation in waypoints], now, offset, count)
+    precips, types, wet_bulbs, fls = (result[key] for key in ("precip", "type", "wet_bulb", "fl"))
+
+    hourly_data = []
+    for i, time_str in enumerate(result["times"]):
+        dt = datetime.fromisoformat(time_str)
+        # Missing surface or level data leave NaN: reported as None (JSON null)
+        missing = np.isnan(wet_bulbs[i])
+        hourly_data.append({
+            "time": dt.strftime("%H:%M"),
+            "day": day_label(dt, result["now"]),
+            "precip": [precip if precip > 0 else 0 for precip in np.nan_to_num(precips[i]).tolist()],
+            "type": [None if m else t for t, m in zip(types[i].tolist(), missing.tolist())],
+            "wet_bulb": [None if m else round(wb, 1) for wb, m in zip(wet_bulbs[i].tolist(), missing.tolist())],
+            "fl": [None if np.isnan(fl) else int(fl) for fl in fls[i].tolist()],
+        })
+
+    return {
+        "waypoints": [
+            {"lat": lat, "lon": lon, "elevation": None if np.isnan(elevation) else int(elevation)}
+            for (lat, lon, _), elevation in zip(waypoints, result["elevations"])
+        ],
+        "cells": len({id(forecast) for forecast in forecasts}),
+        "hourly_data": hourly_data
+    }
+
+
+# Precipitation types grouped into the classes of the ensemble probabilities
+ENSEMBLE_CLASSES = {
+    "Snow": ("Snow", "Wet Snow"),
+    "Mix": ("Mix", "Snow/Mix", "Ice Pellets"),
+    "Rain": ("Rain",),
+    "Freezing Rain": ("Freezing Rain",),
+}
+
+
+def build_ensemble(location_data: dict, forecasts: dict, manual_elevation: float = None,
+                   now: datetime = None) -> dict:
+    """
+    Classifies the next 24 hours of every member of a multi-model forecast in
+    one batch and summarizes the members per hour.
+
+    Args:
+        forecasts (dict): Open-Meteo response per model (None entries are skipped).
+
+    Returns:
+        dict: Location, 'models' (the members used) and per hour:
+              'probabilities' (share of the members per ENSEMBLE_CLASSES class),
+              'precip_probability' (share of the members with precipitation),
+              'snow_line' (min/median/max over the members of the snowfall
+              limit, fl - 300 m) and each member's 'types'.
+    """
+    now = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    members = [model for model, data in forecasts.items() if data]
+    blocks = [prepare_hours(forecasts[model], manual_elevation, now) for model in members]
+    physics = classify(blocks)
+
+    # Members share the hourly grid, but match hours by time in case one is shorter
+    positions = [{t: i for i, t in enumerate(block["times"])} for block in blocks]
+    reference = blocks[0] if blocks else {"times": [], "display_elevation": manual_elevation or 0}
+
+    hourly_data = []
+    for time_str in reference["times"]:
+        dt = datetime.fromisoformat(time_str)
+        types, snow_lines, wet = {}, [], 0
+        for model, block, result, position in zip(members, blocks, physics, positions):
+            i = position.get(time_str)
+            if i is None or block["temps"][i] is None:
+                continue  # No data from this member for this hour
+            types[model] = result["type"][i]
+            snow_lines.append(int(result["fl"][i] - 300))
+            precips = block["precips"]
+            wet += 1 if i < len(precips) and precips[i] else 0
+
+        n = len(types)
+        hourly_data.append({
+            "time": dt.strftime("%H:%M"),
+            "day": day_label(dt, now),
+            "members": n,
+            "precip_probability": round(wet / n, 2) if n else None,
+            "probabilities": {
+                name: round(sum(1 for t in types.values() if t in group) / n, 2) if n else None
+                for name, group in ENSEMBLE_CLASSES.items()
+            },
+            "snow_line": {
+                "min": min(snow_lines),
+                "median": int(statistics.median(snow_lines)),
+                "max": max(snow_lines),
+            } if snow_lines else None,
+            "types": types,
+        })
+
+    return {
+        **location_header(location_data, reference["display_elevation"]),
+        "models": members,
+        "hourly_data": hourly_data
+    }
+
+
+def iter_prediction(weather_data: dict, manual_elevation: float = None, hours: int = 24,
+                    first_chunk: int = 1, chunk: int = 6, start: int = 0):
+    """
+    Yields the 'hourly_data' entries one by one, computing them in small
+    batches so the first hours are available before the rest is computed.
+
+    Args:
+        hours (int): Number of hours (steps, for 15-minute data) to yield.
+        first_chunk (int): Size of the first batch (keep small for a fast first hour).
+        chunk (int): Size of the following batches.
+        start (int): First hour (step), counted from the current hour.
+    """
+    now = datetime.now(ZoneInfo("Europe/Zurich"))
+    offset = start
+    end = start + hours
+    size = first_chunk
+    while offset < end:
+        block = prepare_hours(weather_data, manual_elevation, now, offset, min(size, end - offset))
+        if not block["times"]:
+            return
+        yield from assemble_hours(block, classify([block])[0])
+        offset += len(block["times"])
+        size = chunk
@@ -0,0 +1,392 @@
+"""
+Background prefetching for popular locations.
+
+Predictions are counted per grid cell and elevation. A scheduler thread wakes
+up after every hour and model update, fetches the forecasts of the most
+requested cells (new runs in batched upstream requests) and computes their
+next 24 hours at the most requested elevations. /api/predict then answers
+those requests from the precomputed results, without fetching, preparing or
+classifying.
+
+Prefetching is off unless SNOW_PREFETCH=1 (set in the Dockerfile), so
+scripts and tools that import the app don't fetch in the background. With
+the shared SQLite file of the caches (cache.SHARED_CACHE_PATH), all workers
+of a host add their counts to it and find the results there. Every process
+starts a scheduler, but only the one holding the lease prefetches; another
+takes over when it stops renewing. Without the file, every process counts
+and prefetches on its own.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+import budget
+import metrics
+from cache import SHARED_CACHE_PATH, SHARED_STORE
+from pipeline import classify, prepare_hours
+from profiles import ProfileColumn
+from weather import current_model_run, get_weather_forecasts, next_model_update, snap_to_grid
+
+ENABLED = os.environ.get("SNOW_PREFETCH", "0").lower() not in ("0", "false", "no", "off")
+
+# Size of the hot set: cells, and elevations per cell (None is the model terrain)
+PREFETCH_LOCATIONS = 20
+ELEVATIONS_PER_LOCATION = 3
+
+# Cells whose counts are tracked at all (the least requested one is dropped)
+MAX_TRACKED_LOCATIONS = 1024
+
+# Counts are multiplied by this at every model run, so the hot set follows demand
+DECAY = 0.5
+
+# Delay after the hour / model update before prefetching
+TICK_DELAY = timedelta(seconds=30)
+
+# The scheduler lease outlasts two ticks, so a stopped leader is replaced within hours
+LEASE_SECONDS = 2 * 3600
+
+# Counts recorded by a worker are added to the shared ones at most this often (s)
+FLUSH_SECONDS = 30.0
+
+# Version of the precomputed results in the shared store (bump when their shape changes)
+RESULTS_VERSION = "1"
+
+PRECOMPUTED = metrics.Counter(
+    "snow_precomputed_requests_total", "Predictions looked up in the precomputed results", ("result",)
+)
+
+
+class Popularity:
+    """Thread-safe, decaying request counts per grid cell and elevation."""
+
+    def __init__(self, max_locations: int = MAX_TRACKED_LOCATIONS):
+        self.max_locations = max_locations
+        self._cells = {}  # cell -> [count, location_data, {elevation: count}]
+        self._lock = threading.Lock()
+
+    def record(self, location_data: dict, elevation: float = None):
+        cell = snap_to_grid(location_data["lat"], location_data["lon"])
+        with self._lock:
+            entry = self._cells.get(cell)
+            if entry is None:
+                if len(self._cells) >= self.max_locations:
+                    del self._cells[min(self._cells, key=lambda c: self._cells[c][0])]
+                entry = self._cells[cell] = [0.0, location_data, {}]
+            entry[0] += 1
+            entry[1] = location_data
+            entry[2][elevation] = entry[2].get(elevation, 0) + 1
+
+    def top(self, locations: int = PREFETCH_LOCATIONS, elevations: int = ELEVATIONS_PER_LOCATION) -> list:
+        """The most requested cells as (location_data, [elevations]), most requested first."""
+        with self._lock:
+            ranked = sorted(self._cells.values(), key=lambda entry: -entry[0])[:locations]
+            return [
+                (location_data, sorted(counts, key=lambda e: -counts[e])[:elevations])
+                for _, location_data, counts in ranked
+            ]
+
+    def decay(self, factor: float = DECAY):
+        """Scales all counts by `factor`, dropping cells that fall below one request."""
+        with self._lock:
+            for cell, entry in list(self._cells.items()):
+                entry[0] *= factor
+                entry[2] = {e: n * factor for e, n in entry[2].items() if n * factor >= 0.5}
+                if entry[0] < 1 or not entry[2]:
+                    del self._cells[cell]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._cells)
+
+
+class SharedPopularity(Popularity):
+    """
+    Popularity of all workers of a host. Requests are counted in memory and
+    added to the counts in the shared SQLite file every FLUSH_SECONDS;
+    top(), decay() and len() use the shared counts.
+    """
+
+    def __init__(self, path: str, max_locations: int = MAX_TRACKED_LOCATIONS):
+        super().__init__(max_locations)
+        self.path = path
+        self._flushed = time.monotonic()
+
+    def record(self, location_data: dict, elevation: float = None):
+        super().record(location_data, elevation)
+        if time.monotonic() - self._flushed >= FLUSH_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Adds the counts recorded since the last flush to the shared ones."""
+        with self._lock:
+            cells, self._cells = self._cells, {}
+            self._flushed = time.monotonic()
+        rows = [
+            (json.dumps(cell), json.dumps(elevation), count, json.dumps(location_data))
+            for cell, (_, location_data, counts) in cells.items()
+            for elevation, count in counts.items()
+        ]
+        if not rows:
+            return
+        try:
+            with _transaction(self.path) as db:
+                db.executemany(
+                    "INSERT INTO prefetch_counts (cell, elevation, count, location) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (cell, elevation) DO UPDATE SET "
+                    "count = count + excluded.count, location = excluded.location",
+                    rows
+                )
+                # Keep the most requested cells
+                db.execute(
+                    "DELETE FROM prefetch_counts WHERE cell NOT IN ("
+                    "SELECT cell FROM prefetch_counts GROUP BY cell ORDER BY SUM(count) DESC LIMIT ?)",
+                    (self.max_locations,)
+                )
+        except sqlite3.Error as e:
+            print(f"Error writing prefetch counts: {e}")
+
+    def top(self, locations: int = PREFETCH_LOCATIONS, elevations: int = ELEVATIONS_PER_LOCATION) -> list:
+        self.flush()
+        cells = {}  # cell -> [count, location_data, {elevation: count}]
+        for cell, elevation, count, location in self._rows("SELECT cell, elevation, count, location FROM prefetch_counts"):
+            entry = cells.setdefault(cell, [0.0, json.loads(location), {}])
+            entry[0] += count
+            entry[2][json.loads(elevation)] = count
+        ranked = sorted(cells.values(), key=lambda entry: -entry[0])[:locations]
+        return [
+            (location_data, sorted(counts, key=lambda e: -counts[e])[:elevations])
+            for _, location_data, counts in ranked
+        ]
+
+    def decay(self, factor: float = DECAY):
+        self.flush()
+        try:
+            with _transaction(self.path) as db:
+                db.execute("UPDATE prefetch_counts SET count = count * ?", (factor,))
+                db.execute("DELETE FROM prefetch_counts WHERE count < 0.5")
+                db.execute(
+                    "DELETE FROM prefetch_counts WHERE cell IN ("
+                    "SELECT cell FROM prefetch_counts GROUP BY cell HAVING SUM(count) < 1)"
+                )
+        except sqlite3.Error as e:
+            print(f"Error decaying prefetch counts: {e}")
+
+    def _rows(self, query: str) -> list:
+        try:
+            return _connection(self.path).execute(query).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error reading prefetch counts: {e}")
+            return []
+
+    def __len__(self):
+        rows = self._rows("SELECT COUNT(DISTINCT cell) FROM prefetch_counts")
+        return rows[0][0] if rows else 0
+
+
+class Results:
+    """
+    Prepared blocks and physics of the default 24-hour window, keyed by the
+    forecast fingerprint, the manual elevation and the current hour (so they
+    are only used for the exact forecast and window they were computed from).
+
+    With a `shared` store, results are also written to it, and looked up there
+    when they are not in memory (e.g. computed by another worker).
+    """
+
+    def __init__(self, max_entries: int = 2 * PREFETCH_LOCATIONS * ELEVATIONS_PER_LOCATION, shared=None):
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(weather_data: dict, manual_elevation, now: datetime) -> tuple:
+        return weather_data.get("fingerprint"), manual_elevation, now.strftime("%Y-%m-%dT%H")
+
+    def get(self, weather_data: dict, manual_elevation) -> tuple:
+        """Returns (block, physics) for the next 24 hours, or None."""
+        key = self.key(weather_data, manual_elevation, datetime.now(ZoneInfo("Europe/Zurich")))
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+        if result is None and self.shared is not None:
+            shared = self.shared.get("prefetch", key)
+            if shared is not None and shared[1] == RESULTS_VERSION:
+                result = _decode_result(shared[0])
+                self._remember(key, result)
+        PRECOMPUTED.inc("hit" if result is not None else "miss")
+        return result
+
+    def put(self, key: tuple, block: dict, physics: dict):
+        self._remember(key, (block, physics))
+        if self.shared is not None:
+            self.shared.put("prefetch", key, RESULTS_VERSION, _encode_result(block, physics))
+
+    def _remember(self, key: tuple, result: tuple):
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def _encode_result(block: dict, physics: dict) -> list:
+    """A precomputed result as JSON values (the datetime and profile columns as lists)."""
+    profiles = [[column.z, column.temp, column.rh, column.level] for column in block["profiles"]]
+    return [dict(block, now=block["now"].isoformat(), profiles=profiles), physics]
+
+
+def _decode_result(value: list) -> tuple:
+    block, physics = value
+    block["now"] = datetime.fromisoformat(block["now"]).astimezone(ZoneInfo("Europe/Zurich"))
+    block["profiles"] = [ProfileColumn(*columns) for columns in block["profiles"]]
+    return block, physics
+
+
+popularity = SharedPopularity(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else Popularity()
+results = Results(shared=SHARED_STORE)
+_last_warm = {"seconds": 0.0, "locations": 0, "results": 0}
+_started = False
+_start_lock = threading.Lock()
+_token = None  # (pid, lease token) of this process
+_process = threading.local()  # The SQLite connection of each thread
+
+
+def warm(now: datetime = None) -> int:
+    """
+    Fetches the forecasts of the hot set (stale ones from the upstream, in
+    batches) and precomputes their next 24 hours.
+
+    Returns:
+        int: Number of (cell, elevation) results computed.
+    """
+    started = time.perf_counter()
+    now = now or datetime.now(ZoneInfo("Europe/Zurich"))
+    budget.set_priority(budget.BACKGROUND)
+    hot = popularity.top()
+    pairs = [(location_data, elevation) for location_data, elevations in hot for elevation in elevations]
+    if not pairs:
+        return 0
+
+    forecasts = get_weather_forecasts(
+        [(location_data["lat"], location_data["lon"]) for location_data, _ in pairs], refresh=True
+    )
+    done = [(elevation, forecast) for (_, elevation), forecast in zip(pairs, forecasts) if forecast]
+    blocks = [prepare_hours(forecast, elevation, now) for elevation, forecast in done]
+    for (elevation, forecast), block, physics in zip(done, blocks, classify(blocks)):
+        results.put(Results.key(forecast, elevation, now), block, physics)
+
+    _last_warm.update(seconds=time.perf_counter() - started, locations=len(hot), results=len(done))
+    return len(done)
+
+
+def next_tick(now: datetime = None) -> datetime:
+    """The next hour or model update (whichever comes first), plus TICK_DELAY (UTC)."""
+    now = now or datetime.now(timezone.utc)
+    next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return min(next_hour, next_model_update(now)) + TICK_DELAY
+
+
+def _run():
+    run = current_model_run()
+    while True:
+        time.sleep(max(1.0, (next_tick() - datetime.now(timezone.utc)).total_seconds()))
+        try:
+            new_run = current_model_run() != run
+            run = current_model_run()
+            if _lead():
+                # Only the leader decays, so shared counts decay once per run
+                if new_run:
+                    popularity.decay()
+                warm()
+        except Exception as e:
+            print(f"Error prefetching forecasts: {e}")
+
+
+def _lead(path: str = SHARED_CACHE_PATH) -> bool:
+    """Takes or renews the scheduler lease; True if this process prefetches."""
+    if not path:
+        return True
+    now = time.time()
+    try:
+        with _transaction(path) as db:
+            row = db.execute("SELECT owner, expires FROM prefetch_leases WHERE name = 'prefetch'").fetchone()
+            if row is not None and row[0] != _owner() and row[1] > now:
+                return False
+            db.execute(
+                "INSERT OR REPLACE INTO prefetch_leases (name, owner, expires) VALUES ('prefetch', ?, ?)",
+                (_owner(), now + LEASE_SECONDS)
+            )
+            return True
+    except sqlite3.Error as e:
+        # A broken cache file must not stop prefetching
+        print(f"Error reading prefetch lease: {e}")
+        return True
+
+
+def _owner() -> str:
+    """A random token of this process (PIDs are reused across restarts and containers)."""
+    global _token
+    if _token is None or _token[0] != os.getpid():
+        _token = (os.getpid(), secrets.token_hex(16))
+    return _token[1]
+
+
+@contextmanager
+def _transaction(path: str):
+    """A write transaction on the shared file (IMMEDIATE takes the lock up front, so only one process wins)."""
+    db = _connection(path)
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        yield db
+        db.execute("COMMIT")
+    except BaseException:
+        db.execute("ROLLBACK")
+        raise
+
+
+def _connection(path: str) -> sqlite3.Connection:
+    # Connections must not cross threads or forks
+    db = getattr(_process, "db", None)
+    if db is None or _process.pid != os.getpid() or _process.path != path:
+        db = sqlite3.connect(path, timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS prefetch_leases (name TEXT PRIMARY KEY, owner TEXT, expires REAL)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS prefetch_counts ("
+            "cell TEXT, elevation TEXT, count REAL, location TEXT, PRIMARY KEY (cell, elevation))"
+        )
+        _process.db, _process.pid, _process.path = db, os.getpid(), path
+    return db
+
+
+def start():
+    """Starts the scheduler thread (once per process; see _lead)."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name="prefetch", daemon=True).start()
+
+
+def _prefetch_metrics():
+    yield "snow_prefetch_tracked_locations", "gauge", "Grid cells with request counts", len(popularity)
+    yield "snow_prefetch_results", "gauge", "Precomputed predictions held in memory by this process", len(results)
+    yield "snow_prefetch_last_seconds", "gauge", "Duration of the last prefetch", _last_warm["seconds"]
+    yield "snow_prefetch_last_results", "gauge", "Predictions computed by the last prefetch", _last_warm["results"]
+
+
+metrics.register_collector(_prefetch_metrics)
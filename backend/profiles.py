@@ -0,0 +1,130 @@
+import bisect
+
+# Level of the surface point; upper-air points carry their pressure in hPa
+SURFACE = 0
+
+# Points closer than this to the previous point are dropped when the surface
+# point is inserted (avoids glitches from near-duplicate heights)
+MIN_POINT_SPACING = 5
+
+# Standard atmosphere lapse rate used to extrapolate beyond the profile (°C/m)
+LAPSE_RATE = -0.0065
+
+
+class ProfileColumn:
+    """
+    Vertical profile of one hour as parallel, height-sorted columns.
+
+    `z`, `temp`, `rh` and `level` are plain lists (values keep their JSON
+    types, so responses are unchanged). `rh` is None for the surface point and
+    `level` is the pressure level in hPa, or SURFACE.
+
+    Columns are built sorted once; interpolation and slicing use bisect, and
+    the surface point is inserted in place instead of re-sorting.
+    """
+    __slots__ = ("z", "temp", "rh", "level")
+
+    def __init__(self, z: list, temp: list, rh: list = None, level: list = None):
+        self.z = z
+        self.temp = temp
+        self.rh = rh if rh is not None else [None] * len(z)
+        self.level = level if level is not None else [None] * len(z)
+
+    @classmethod
+    def from_levels(cls, levels: list, heights: list, temps: list, rhs: list) -> "ProfileColumn":
+        """
+        Builds a column from pressure-level values of one hour. Levels without
+        a geopotential height are skipped.
+        """
+        z, temp, rh, level = [], [], [], []
+        for p, z_h, t, r in zip(levels, heights, temps, rhs):
+            if z_h is not None:
+                z.append(z_h)
+                temp.append(t)
+                rh.append(r)
+                level.append(p)
+
+        # Pressure levels are usually already ascending in height
+        if any(z[i] > z[i + 1] for i in range(len(z) - 1)):
+            order = sorted(range(len(z)), key=z.__getitem__)
+            z = [z[i] for i in order]
+            temp = [temp[i] for i in order]
+            rh = [rh[i] for i in order]
+            level = [level[i] for i in order]
+        return cls(z, temp, rh, level)
+
+    @classmethod
+    def from_points(cls, points: list) -> "ProfileColumn":
+        """Builds a column from a list of {'z', 'temp', ['rh'], ['type']} dicts, keeping their order."""
+        return cls(
+            [p['z'] for p in points],
+            [p['temp'] for p in points],
+            [p.get('rh') for p in points],
+            [SURFACE if p.get('type') == 'SFC' else _level(p.get('type')) for p in points],
+        )
+
+    def __len__(self):
+        return len(self.z)
+
+    def interpolate(self, elevation: float):
+        """
+        Returns (temp, rh) at `elevation`: linear between the neighbouring
+        points, extrapolated with the standard lapse rate (and the nearest RH)
+        outside the profile. None for an empty profile.
+        """
+        n = len(self.z)
+        if n == 0:
+            return None
+        i = bisect.bisect_right(self.z, elevation)
+        z, temp, rh = self.z, self.temp, self.rh
+        if 0 < i < n:
+            fraction = (elevation - z[i - 1]) / (z[i] - z[i - 1])
+            return (
+                temp[i - 1] + fraction * (temp[i] - temp[i - 1]),
+                rh[i - 1] + fraction * (rh[i] - rh[i - 1])
+            )
+        # Below the lowest point (i == 0) or above the highest one (i == n)
+        nearest = 0 if i == 0 else n - 1
+        return temp[nearest] + (elevation - z[nearest]) * LAPSE_RATE, rh[nearest]
+
+    def with_surface(self, elevation: float, temp: float) -> "ProfileColumn":
+        """
+        Returns a new column with the surface point inserted at `elevation`,
+        dropping every point within MIN_POINT_SPACING of the one below it.
+        """
+        i = bisect.bisect_left(self.z, elevation)
+        z = self.z[:i] + [elevation] + self.z[i:]
+        temps = self.temp[:i] + [temp] + self.temp[i:]
+        rh = self.rh[:i] + [None] + self.rh[i:]
+        level = self.level[:i] + [SURFACE] + self.level[i:]
+
+        keep = [0]
+        for j in range(1, len(z)):
+            if z[j] - z[keep[-1]] > MIN_POINT_SPACING:
+                keep.append(j)
+        if len(keep) == len(z):
+            return ProfileColumn(z, temps, rh, level)
+        return ProfileColumn(
+            [z[j] for j in keep], [temps[j] for j in keep], [rh[j] for j in keep], [level[j] for j in keep]
+        )
+
+    def above(self, elevation: float) -> "ProfileColumn":
+        """Returns the points strictly above `elevation` (the columns are sliced, the values shared)."""
+        i = bisect.bisect_right(self.z, elevation)
+        return ProfileColumn(self.z[i:], self.temp[i:], self.rh[i:], self.level[i:])
+
+    def to_points(self) -> list:
+        """The profile as the list of dicts used in /api/predict responses."""
+        points = []
+        for z, temp, rh, level in zip(self.z, self.temp, self.rh, self.level):
+            if level == SURFACE:
+                points.append({"z": z, "temp": temp, "type": "SFC"})
+            else:
+                points.append({"z": z, "temp": temp, "rh": rh, "type": f"{level}hPa"})
+        return points
+
+
+def _level(label):
+    if label and label.endswith("hPa"):
+        return int(label[:-3])
+    return None
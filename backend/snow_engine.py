@@ -1,4 +1,31 @@
 import math
+import numpy as np
+
+from profiles import ProfileColumn
+
+# Precipitation classes used by the batch engine. Codes index into these tuples.
+PRECIP_TYPES = ("Rain", "Snow", "Wet Snow", "Ice Pellets", "Freezing Rain", "Mix", "Snow/Mix")
+PRECIP_ICONS = ("💧", "❄️", "🌨️", "🧊", "⚠️", "🌨️", "🌨️")
+RAIN, SNOW, WET_SNOW, ICE_PELLETS, FREEZING_RAIN, MIX, SNOW_MIX = range(len(PRECIP_TYPES))
+
+# Wet-bulb solvers of the batch engine. "iterative" matches calculate_wet_bulb;
+# "fast" runs a fixed number of Newton steps on every element without
+# convergence bookkeeping, which makes it about 1.6x faster (bench/run.py,
+# calculate_wet_bulb_batch[fast]). Within WET_BULB_FAST_DOMAIN (temp, rh,
+# pressure ranges) it stays within WET_BULB_FAST_MAX_ERROR °C of "iterative"
+# (worst case measured on a dense grid over the whole domain: 8.6e-8 °C;
+# checked by bench/run.py --check). Inputs outside the domain are solved
+# iteratively.
+WET_BULB_METHODS = ("iterative", "fast")
+WET_BULB_FAST_STEPS = 5
+WET_BULB_FAST_DOMAIN = ((-40.0, 40.0), (0.0, 100.0), (500.0, 1050.0))
+WET_BULB_FAST_MAX_ERROR = 1e-7
+
+
+def _round_like_builtin(values: np.ndarray, ndigits: int) -> np.ndarray:
+    """Rounds exactly like the builtin round(), which np.round does not for every float."""
+    return np.array([round(v, ndigits) for v in values.tolist()], dtype=float)
+
 
 class SnowPredictor:
     @staticmethod
@@ -44,69 +71,85 @@ class SnowPredictor:
         return tw
 
     @staticmethod
-    def calculate_freezing_level(profile: list, surface_elevation: float) -> float:
+    def calculate_freezing_level(profile, surface_elevation: float) -> float:
         """
         Calculates the 0°C level (isotherm) by interpolating the atmospheric profile.
         Finds the HIGHEST crossing point (important for inversion handling).
+
+        Args:
+            profile (ProfileColumn | list): Profile ordered from the bottom up
+                (a ProfileColumn or a list of {'z', 'temp'} dicts).
+            surface_elevation (float): Returned when no level can be determined.
         """
         if not profile or len(profile) < 2:
             return surface_elevation
-            
+        if isinstance(profile, ProfileColumn):
+            z, temps = profile.z, profile.temp
+        else:
+            z = [p['z'] for p in profile]
+            temps = [p['temp'] for p in profile]
+
         # Search from TOP down to find the highest crossing
-        reversed_profile = profile[::-1]
-        for i in range(len(reversed_profile) - 1):
-            p_top = reversed_profile[i]
-            p_bot = reversed_profile[i+1]
-            
+        for i in range(len(z) - 1, 0, -1):
+            t_top = temps[i]
+            t_bot = temps[i - 1]
+
             # Crossing 0C
-            if (p_top['temp'] <= 0 and p_bot['temp'] >= 0) or (p_top['temp'] >= 0 and p_bot['temp'] <= 0):
-                if p_top['temp'] == p_bot['temp']:
-                    return p_top['z']
+            if (t_top <= 0 and t_bot >= 0) or (t_top >= 0 and t_bot <= 0):
+                if t_top == t_bot:
+                    return z[i]
                 # Linear interpolation: z = z1 + (target - t1) * (z2 - z1) / (t2 - t1)
-                fraction = (-p_top['temp']) / (p_bot['temp'] - p_top['temp'])
-                return round(p_top['z'] + fraction * (p_bot['z'] - p_top['z']))
-                
+                fraction = (-t_top) / (t_bot - t_top)
+                return round(z[i] + fraction * (z[i - 1] - z[i]))
+
         # Handle cases with NO crossing (entirely cold or entirely warm)
-        
+
         # 1. Entirely Cold: Extrapolate downward from surface
         # Uses a standard lapse rate (-6.5C / km) to find a representative FL below surface
-        if all(p['temp'] <= 0 for p in profile):
-             surf = profile[0]
-             if surf['temp'] == 0: return surf['z']
+        if all(t <= 0 for t in temps):
+             if temps[0] == 0: return z[0]
              # z = z_surf - (temp_surf / lapse_rate)
              # lapse_rate = -0.0065 C/m
-             return round(surf['z'] - (surf['temp'] / -0.0065))
-             
+             return round(z[0] - (temps[0] / -0.0065))
+
         # 2. Entirely Warm: Fl is likely above top of profile
-        if all(p['temp'] >= 0 for p in profile):
-             top = profile[-1]
-             return round(top['z'] + (top['temp'] / 0.0065))
-             
+        if all(t >= 0 for t in temps):
+             return round(z[-1] + (temps[-1] / 0.0065))
+
         return surface_elevation
 
     @staticmethod
-    def calculate_bourgouin_areas(profile: list) -> dict:
+    def calculate_bourgouin_areas(profile) -> dict:
         """
         Calculates Positive (Melting) and Negative (Refreezing) areas.
         CRITICAL FIX: Only counts Negative Area that occurs BELOW the highest melting layer.
         The cold upper atmosphere (snow source) should NOT count as refreezing energy.
+
+        Args:
+            profile (ProfileColumn | list): A ProfileColumn (already sorted) or
+                a list of {'z', 'temp'} dicts in any order.
         """
         if not profile or len(profile) < 2:
             return {"positive": 0, "negative": 0}
-            
-        # Ensure profile is sorted by height (Surface -> Top)
-        sorted_profile = sorted(profile, key=lambda x: x['z'])
-        
+
+        if isinstance(profile, ProfileColumn):
+            z, temps = profile.z, profile.temp
+        else:
+            # Ensure profile is sorted by height (Surface -> Top)
+            sorted_profile = sorted(profile, key=lambda x: x['z'])
+            z = [p['z'] for p in sorted_profile]
+            temps = [p['temp'] for p in sorted_profile]
+
         # 1. Identify the highest point where T > 0 (Top of the melting layer)
         # If the entire profile is < 0, then melting energy is 0.
         highest_warm_z = -9999
         has_warm_layer = False
-        
-        for p in sorted_profile:
-            if p['temp'] > 0:
+
+        for z_i, t_i in zip(z, temps):
+            if t_i > 0:
                 has_warm_layer = True
-                if p['z'] > highest_warm_z:
-                    highest_warm_z = p['z']
+                if z_i > highest_warm_z:
+                    highest_warm_z = z_i
                     
         if not has_warm_layer:
             # All cold -> Pure Snow
@@ -115,15 +158,15 @@ class SnowPredictor:
         pos_area = 0.0
         neg_area = 0.0
         
-        for i in range(len(sorted_profile) - 1):
-            p1 = sorted_profile[i]
-            p2 = sorted_profile[i+1]
-            
-            dz = p2['z'] - p1['z']
+        for i in range(len(z) - 1):
+            z1 = z[i]
+            z2 = z[i + 1]
+
+            dz = z2 - z1
             if dz <= 0: continue
-            
-            t1 = p1['temp']
-            t2 = p2['temp']
+
+            t1 = temps[i]
+            t2 = temps[i + 1]
             
             # Area Calculation
             # We split the segment if it crosses 0°C to be precise
@@ -147,7 +190,7 @@ class SnowPredictor:
                     pos_area += 0.5 * t1 * dz_1
                 else:
                     # Only count neg if below highest warm z
-                    if p1['z'] < highest_warm_z:
+                    if z1 < highest_warm_z:
                         neg_area += 0.5 * abs(t1) * dz_1
                         
                 # Part 2 (Triangle starting at 0, ending at t2)
@@ -155,7 +198,7 @@ class SnowPredictor:
                 if t2 > 0:
                     pos_area += 0.5 * t2 * dz_2
                 else:
-                    if p2['z'] < highest_warm_z:
+                    if z2 < highest_warm_z:
                          neg_area += 0.5 * abs(t2) * dz_2
 
             # NON-CROSSING: Entirely Warm or Entirely Cold
@@ -164,7 +207,7 @@ class SnowPredictor:
                 pos_area += avg_t * dz
             else:
                 # Entirely Cold
-                if p2['z'] <= highest_warm_z: 
+                if z2 <= highest_warm_z:
                     neg_area += abs(avg_t) * dz
                     
         return {"positive": round(pos_area, 1), "negative": round(neg_area, 1)}
@@ -177,7 +220,7 @@ class SnowPredictor:
         elevation: float,
         temp_850hpa: float,
         pressure: float = 1013.25,
-        profile: list = None
+        profile=None
     ) -> dict:
         """
         Determines the type of precipitation risk based on meteorological parameters.
@@ -205,10 +248,15 @@ class SnowPredictor:
             # Precip falling at the user's location is only affected by the air above.
             # 1. Filter points above elevation
             # 2. Add the user's current conditions as the "Surface" point
-            relevant_profile = [p for p in profile if p['z'] > elevation]
-            
-            # Insert User Surface Point
-            relevant_profile.insert(0, {"z": elevation, "temp": temp_surface})
+            if isinstance(profile, ProfileColumn):
+                above = profile.above(elevation)
+                # Insert User Surface Point (below every point of the column)
+                relevant_profile = ProfileColumn([elevation] + above.z, [temp_surface] + above.temp)
+            else:
+                relevant_profile = [p for p in profile if p['z'] > elevation]
+
+                # Insert User Surface Point
+                relevant_profile.insert(0, {"z": elevation, "temp": temp_surface})
             
             areas = SnowPredictor.calculate_bourgouin_areas(relevant_profile)
             result["areas"] = {"pos": areas['positive'], "neg": areas['negative']}
@@ -263,3 +311,334 @@ class SnowPredictor:
              result["icon"] = "🌨️"
              
         return result
+
+
+    # ------------------------------------------------------------------
+    # Batch (vectorized) engine
+    #
+    # The methods below evaluate a whole block of hours at once. Profiles are
+    # passed as 2D arrays of shape (rows, levels), sorted by height within each
+    # row and padded with NaN heights on the right (see stack_profiles). They
+    # mirror the scalar methods above step by step, which stay the reference.
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def stack_profiles(profiles: list) -> tuple:
+        """
+        Packs per-hour profiles (sorted by 'z') into padded arrays.
+
+        Args:
+            profiles (list): One profile per row, each a ProfileColumn or a list
+                of {'z', 'temp'} dicts.
+
+        Returns:
+            tuple: (z, temp) float arrays of shape (rows, max_levels), NaN-padded.
+        """
+        n_levels = max((len(p) for p in profiles), default=0)
+        z = np.full((len(profiles), n_levels), np.nan)
+        temp = np.full((len(profiles), n_levels), np.nan)
+        for i, profile in enumerate(profiles):
+            if isinstance(profile, ProfileColumn):
+                z[i, :len(profile)] = profile.z
+                temp[i, :len(profile)] = profile.temp
+            else:
+                z[i, :len(profile)] = [p['z'] for p in profile]
+                temp[i, :len(profile)] = [p['temp'] for p in profile]
+        return z, temp
+
+    @staticmethod
+    def calculate_wet_bulb_batch(temp_air, relative_humidity, pressure=1013.25, method="iterative") -> np.ndarray:
+        """
+        Vectorized calculate_wet_bulb. The default "iterative" method runs the
+        same Newton-Raphson iteration on every element and freezes each element
+        as soon as it converges; "fast" trades that for a fixed step count
+        (see WET_BULB_METHODS).
+
+        Args:
+            temp_air (array_like): Air temperatures in Celsius.
+            relative_humidity (array_like): Relative humidities in %.
+            pressure (array_like): Surface pressures in hPa.
+            method (str): "iterative" or "fast".
+
+        Returns:
+            np.ndarray: Wet-bulb temperatures in Celsius (broadcast shape of the inputs).
+        """
+        temp_air, relative_humidity, pressure = np.broadcast_arrays(
+            np.asarray(temp_air, dtype=float),
+            np.asarray(relative_humidity, dtype=float),
+            np.asarray(pressure, dtype=float),
+        )
+        if method == "fast":
+            return SnowPredictor._wet_bulb_fast(temp_air, relative_humidity, pressure)
+        if method != "iterative":
+            raise ValueError(f"Unknown wet-bulb method '{method}' (expected one of {WET_BULB_METHODS})")
+
+        es = 6.112 * np.exp(17.67 * temp_air / (temp_air + 243.5))
+        e = es * (relative_humidity / 100.0)
+
+        A = 0.000661
+        tw = temp_air.copy()
+        result = temp_air.copy()
+        active = ~(relative_humidity >= 99.9)
+
+        for _ in range(10):
+            if not active.any():
+                break
+            es_tw = 6.112 * np.exp(17.67 * tw / (tw + 243.5))
+            des_dtw = es_tw * 17.67 * 243.5 / (tw + 243.5)**2
+
+            f = es_tw - A * pressure * (temp_air - tw) - e
+            df = des_dtw + A * pressure
+
+            tw_new = tw - f / df
+            converged = active & (np.abs(tw_new - tw) < 0.001)
+            result = np.where(converged, tw_new, result)
+            active = active & ~converged
+            tw = np.where(active, tw_new, tw)
+
+        return np.where(active, tw, result)
+
+    @staticmethod
+    def _wet_bulb_fast(temp_air: np.ndarray, relative_humidity: np.ndarray, pressure: np.ndarray) -> np.ndarray:
+        (t_min, t_max), (rh_min, rh_max), (p_min, p_max) = WET_BULB_FAST_DOMAIN
+        outside = ~(
+            (temp_air >= t_min) & (temp_air <= t_max)
+            & (relative_humidity >= rh_min) & (relative_humidity <= rh_max)
+            & (pressure >= p_min) & (pressure <= p_max)
+        )
+
+        # Same psychrometric equation as calculate_wet_bulb, rearranged to
+        # es(Tw) + A*P*Tw = A*P*T + e, and updated in place
+        A = 0.000661
+        a_p = A * pressure
+        rhs = a_p * temp_air + 6.112 * np.exp(17.67 * temp_air / (temp_air + 243.5)) * (relative_humidity / 100.0)
+        tw = temp_air.copy()
+        x = np.empty_like(tw)
+        es_tw = np.empty_like(tw)
+        for _ in range(WET_BULB_FAST_STEPS):
+            np.add(tw, 243.5, out=x)
+            np.divide(tw, x, out=es_tw)
+            es_tw *= 17.67
+            np.exp(es_tw, out=es_tw)
+            es_tw *= 6.112
+            f = es_tw + a_p * tw - rhs
+            # df = es_tw * 17.67 * 243.5 / (tw + 243.5)**2 + A * P
+            x *= x
+            es_tw /= x
+            es_tw *= 17.67 * 243.5
+            es_tw += a_p
+            tw -= f / es_tw
+
+        result = np.where(relative_humidity >= 99.9, temp_air, tw)
+        if outside.any():
+            result[outside] = SnowPredictor.calculate_wet_bulb_batch(
+                temp_air[outside], relative_humidity[outside], pressure[outside]
+            )
+        return result
+
+    @staticmethod
+    def calculate_freezing_level_batch(z, temp, surface_elevation) -> np.ndarray:
+        """
+        Vectorized calculate_freezing_level: highest 0°C crossing per row, with the
+        same lapse-rate extrapolation for entirely cold or entirely warm rows.
+
+        Args:
+            z (array_like): Heights, shape (rows, levels), sorted and NaN-padded.
+            temp (array_like): Temperatures matching z.
+            surface_elevation (array_like): Per-row (or scalar) fallback elevation.
+
+        Returns:
+            np.ndarray: Freezing level per row in meters.
+        """
+        z = np.atleast_2d(np.asarray(z, dtype=float))
+        temp = np.atleast_2d(np.asarray(temp, dtype=float))
+        n_rows = z.shape[0]
+        result = np.broadcast_to(np.asarray(surface_elevation, dtype=float), (n_rows,)).copy()
+        if z.shape[1] < 2:
+            return result
+
+        valid = ~np.isnan(z)
+        n_valid = valid.sum(axis=1)
+        rows = np.arange(n_rows)
+
+        t_bot, t_top = temp[:, :-1], temp[:, 1:]
+        z_bot, z_top = z[:, :-1], z[:, 1:]
+        crossing = valid[:, :-1] & valid[:, 1:] & (
+            ((t_top <= 0) & (t_bot >= 0)) | ((t_top >= 0) & (t_bot <= 0))
+        )
+        has_crossing = crossing.any(axis=1)
+
+        # Highest crossing segment = last True along the level axis
+        seg = crossing.shape[1] - 1 - np.argmax(crossing[:, ::-1], axis=1)
+        tt, tb = t_top[rows, seg], t_bot[rows, seg]
+        zt, zb = z_top[rows, seg], z_bot[rows, seg]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = (-tt) / (tb - tt)
+            crossing_level = np.where(tt == tb, zt, np.rint(zt + fraction * (zb - zt)))
+
+        # Entirely cold: extrapolate downward from the lowest point
+        all_cold = np.all(~valid | (temp <= 0), axis=1)
+        surf_z, surf_t = z[:, 0], temp[:, 0]
+        cold_level = np.where(surf_t == 0, surf_z, np.rint(surf_z - (surf_t / -0.0065)))
+
+        # Entirely warm: extrapolate upward from the highest point
+        all_warm = np.all(~valid | (temp >= 0), axis=1)
+        last = np.maximum(n_valid - 1, 0)
+        top_z, top_t = z[rows, last], temp[rows, last]
+        warm_level = np.rint(top_z + (top_t / 0.0065))
+
+        enough = n_valid >= 2
+        result = np.where(enough & ~has_crossing & all_warm, warm_level, result)
+        result = np.where(enough & ~has_crossing & all_cold, cold_level, result)
+        result = np.where(enough & has_crossing, crossing_level, result)
+        return result
+
+    @staticmethod
+    def calculate_bourgouin_areas_batch(z, temp) -> dict:
+        """
+        Vectorized calculate_bourgouin_areas. Loops over the (few) levels and
+        accumulates all rows at once, in the same order as the scalar version.
+
+        Args:
+            z (array_like): Heights, shape (rows, levels), sorted and NaN-padded.
+            temp (array_like): Temperatures matching z.
+
+        Returns:
+            dict: {'positive': np.ndarray, 'negative': np.ndarray} in m·°C.
+        """
+        z = np.atleast_2d(np.asarray(z, dtype=float))
+        temp = np.atleast_2d(np.asarray(temp, dtype=float))
+        n_rows, n_levels = z.shape
+        valid = ~np.isnan(z)
+
+        warm = valid & (temp > 0)
+        has_warm_layer = warm.any(axis=1)
+        highest_warm_z = np.where(warm, z, -9999).max(axis=1, initial=-9999)
+
+        pos_area = np.zeros(n_rows)
+        neg_area = np.zeros(n_rows)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(n_levels - 1):
+                z1, z2 = z[:, i], z[:, i + 1]
+                t1, t2 = temp[:, i], temp[:, i + 1]
+
+                dz = z2 - z1
+                active = valid[:, i] & valid[:, i + 1] & (dz > 0) & has_warm_layer
+
+                avg_t = (t1 + t2) / 2.0
+
+                # Crossing case: exactly one end is warm, split the segment at 0°C
+                crossing = ((t1 > 0) & (t2 < 0)) | ((t1 < 0) & (t2 > 0))
+                fraction = np.abs(t1) / (np.abs(t1) + np.abs(t2))
+                dz_1 = dz * fraction
+                dz_2 = dz - dz_1
+                cross_pos = np.where(t1 > 0, 0.5 * t1 * dz_1, 0.5 * t2 * dz_2)
+                cross_neg = np.where(
+                    t1 > 0,
+                    np.where(z2 < highest_warm_z, 0.5 * np.abs(t2) * dz_2, 0.0),
+                    np.where(z1 < highest_warm_z, 0.5 * np.abs(t1) * dz_1, 0.0),
+                )
+
+                # Non-crossing: trapezoidal rule
+                all_warm = (t1 >= 0) & (t2 >= 0)
+                flat_pos = np.where(all_warm, avg_t * dz, 0.0)
+                flat_neg = np.where(~all_warm & (z2 <= highest_warm_z), np.abs(avg_t) * dz, 0.0)
+
+                pos_area = np.where(active, pos_area + np.where(crossing, cross_pos, flat_pos), pos_area)
+                neg_area = np.where(active, neg_area + np.where(crossing, cross_neg, flat_neg), neg_area)
+
+        return {
+            "positive": _round_like_builtin(pos_area, 1),
+            "negative": _round_like_builtin(neg_area, 1),
+        }
+
+    @staticmethod
+    def determine_precip_type_batch(
+        temp_surface,
+        rh_surface,
+        freezing_level,
+        elevation,
+        temp_850hpa,
+        pressure=1013.25,
+        z=None,
+        temp=None,
+        wet_bulb_method="iterative"
+    ) -> dict:
+        """
+        Vectorized determine_precip_type over many rows (hours, elevations, ...).
+
+        Per-row inputs are 1D arrays (scalars broadcast). The optional profile is
+        given as padded (z, temp) arrays; rows without any profile points fall back
+        to the simple wet-bulb logic, exactly like the scalar method.
+        wet_bulb_method is passed to calculate_wet_bulb_batch.
+
+        Returns:
+            dict: Arrays keyed like the scalar result: 'type', 'icon', 'risk_level',
+                  'wet_bulb', 'areas' ({'pos', 'neg'}), plus the integer 'code'.
+        """
+        temp_surface, rh_surface, freezing_level, elevation, temp_850hpa, pressure = (
+            np.atleast_1d(a) for a in np.broadcast_arrays(
+                *(np.asarray(v, dtype=float) for v in (
+                    temp_surface, rh_surface, freezing_level, elevation, temp_850hpa, pressure
+                ))
+            )
+        )
+        n_rows = temp_surface.shape[0]
+        wet_bulb = SnowPredictor.calculate_wet_bulb_batch(temp_surface, rh_surface, pressure, wet_bulb_method)
+
+        pos = np.zeros(n_rows)
+        neg = np.zeros(n_rows)
+        has_profile = np.zeros(n_rows, dtype=bool)
+
+        if z is not None:
+            z = np.atleast_2d(np.asarray(z, dtype=float))
+            temp = np.atleast_2d(np.asarray(temp, dtype=float))
+            n_levels = z.shape[1]
+            valid = ~np.isnan(z)
+            has_profile = valid.any(axis=1)
+
+            # Keep only points above the user's elevation. Rows are sorted, so these
+            # form a suffix of the valid points: shift each row left past the rest.
+            n_skip = (valid & ~(z > elevation[:, None])).sum(axis=1)
+            src = n_skip[:, None] + np.arange(n_levels)
+            in_range = src < n_levels
+            src = np.minimum(src, n_levels - 1)
+            above_z = np.where(in_range, np.take_along_axis(z, src, axis=1), np.nan)
+            above_t = np.where(in_range, np.take_along_axis(temp, src, axis=1), np.nan)
+
+            # Insert the user surface point at the bottom
+            relevant_z = np.concatenate([elevation[:, None], above_z], axis=1)
+            relevant_t = np.concatenate([temp_surface[:, None], above_t], axis=1)
+
+            areas = SnowPredictor.calculate_bourgouin_areas_batch(relevant_z, relevant_t)
+            pos = np.where(has_profile, areas['positive'], 0.0)
+            neg = np.where(has_profile, areas['negative'], 0.0)
+
+        # Bourgouin classification
+        melted = np.where(
+            (neg > 400) | ((neg > 150) & (neg > 0.3 * pos)), ICE_PELLETS,
+            np.where(temp_surface < 0, FREEZING_RAIN,
+                     np.where(pos < 300, MIX, RAIN))
+        )
+        bourgouin = np.where(pos < 100, np.where(temp_surface > 0, WET_SNOW, SNOW), melted)
+
+        # Fallback to simple logic if no profile
+        is_inversion = (elevation < 1000) & (temp_surface < 0) & (temp_850hpa > 0)
+        simple = np.where(
+            is_inversion, FREEZING_RAIN,
+            np.where(wet_bulb < 0.5, np.where(temp_surface > 0, WET_SNOW, SNOW),
+                     np.where(elevation > (freezing_level - 300), SNOW_MIX, RAIN))
+        )
+
+        code = np.where(has_profile, bourgouin, simple)
+        risk_high = ~has_profile & is_inversion
+
+        return {
+            "code": code,
+            "type": np.array(PRECIP_TYPES, dtype=object)[code],
+            "icon": np.array(PRECIP_ICONS, dtype=object)[code],
+            "risk_level": np.where(risk_high, "High", "None").astype(object),
+            "wet_bulb": wet_bulb,
+            "areas": {"pos": pos, "neg": neg},
+        }
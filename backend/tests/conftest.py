@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The backend modules are imported flat, as app.py does; bench/ has the fixture replay
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.join(BACKEND_DIR, "bench"))
+
+# No background threads reaching the real upstream APIs while testing
+os.environ["SNOW_PREFETCH"] = "0"
+os.environ["SNOW_WARMUP"] = "0"
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_configure(config):
+    # The shared cache and budgets of the tests, in the session's tmp_path_factory
+    # directory (kept and removed like tmp_path's). Set here rather than in a
+    # fixture: cache.py reads SNOW_CACHE_PATH when the test modules import it.
+    # trylast: after pytest's tmp_path plugin has set up the factory
+    cache_dir = config._tmp_path_factory.mktemp("shared-cache")
+    os.environ["SNOW_CACHE_PATH"] = str(cache_dir / "cache.sqlite3")
+
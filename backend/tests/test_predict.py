@@ -0,0 +1,124 @@
+"""
+/api/predict at several manual elevations, with the upstream APIs replayed
+from the bench fixtures, against the outputs of the original per-hour
+implementation (data/predict_baseline.json).
+
+Requests go through geocoding, the forecast cache and the upstream request
+path, so what is fetched and cached is tested along with the engine: every
+elevation must get the same answer whichever elevation filled the cache.
+
+The file holds, per fixture, elevation and forecast hour, the freezing
+level, snowfall limit, type and wet bulb, and a digest of the whole hourly
+entry. Regenerate it (from the current code) only for changes meant to
+alter predictions:
+
+    python tests/test_predict.py
+"""
+import hashlib
+import json
+import os
+import sys
+from datetime import timedelta
+
+import pytest
+
+if __name__ == "__main__":
+    BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    sys.path[:0] = [BACKEND_DIR, os.path.join(BACKEND_DIR, "bench")]
+
+import replay  # noqa: E402
+import weather  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "predict_baseline.json")
+
+# None: the model terrain
+ELEVATIONS = [None, 300, 1500, 2500, 3000, 3500]
+
+
+def hour_digest(entry: dict) -> str:
+    """Digest of an 'hourly_data' entry without its time labels (ints and floats hash alike, as JSON compares)."""
+    entry = {key: value for key, value in entry.items() if key not in ("time", "day")}
+    text = json.dumps(_as_floats(entry), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+def summary(entry: dict) -> dict:
+    return {
+        "fl": entry["fl"],
+        "sfg": entry["viz"]["sfg"],
+        "type": entry["type"],
+        "wet_bulb": entry["wet_bulb"],
+        "digest": hour_digest(entry),
+    }
+
+
+def _as_floats(value):
+    if isinstance(value, dict):
+        return {key: _as_floats(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_as_floats(item) for item in value]
+    if isinstance(value, int) and not isinstance(value, bool):
+        return float(value)
+    return value
+
+
+def fixture_hour(entry: dict) -> int:
+    """Index of an 'hourly_data' entry in a replayed forecast (which starts at local midnight today)."""
+    return (0 if entry["day"] == "Today" else 24) + int(entry["time"][:2])
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    with open(BASELINE_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope="module")
+def client():
+    import app
+    return app.app.test_client()
+
+
+@pytest.mark.parametrize("scenario", replay.SCENARIOS)
+@pytest.mark.parametrize("order", ["ascending", "descending"])
+def test_predict_matches_baseline(baseline, client, scenario, order):
+    fixture = replay.load(scenario)
+    elevations = ELEVATIONS if order == "ascending" else ELEVATIONS[::-1]
+    weather._forecast_cache.clear()
+    with replay.Replay(fixture):
+        for elevation in elevations:
+            response = client.post("/api/predict", json={"location": fixture["location"], "elevation": elevation})
+            assert response.status_code == 200, response.get_data(as_text=True)
+            body = response.get_json()
+            expected = baseline[scenario][str(elevation)]
+            assert body["elevation"] == expected["elevation"]
+            assert len(body["hourly_data"]) == 24
+            for entry in body["hourly_data"]:
+                hour = fixture_hour(entry)
+                assert summary(entry) == expected["hours"][hour], f"{scenario} at {elevation} m, hour {hour}"
+
+
+def main():
+    from pipeline import assemble, classify, prepare_hours
+
+    results = {}
+    for scenario in replay.SCENARIOS:
+        fixture = replay.load(scenario)
+        open_meteo = fixture["open_meteo"]
+        location_data = {"display_name": fixture["location"], "lat": 0.0, "lon": 0.0}
+        for elevation in ELEVATIONS:
+            hours = []
+            for day in (0, 1):
+                block = prepare_hours(open_meteo, elevation, replay.first_hour(open_meteo) + timedelta(days=day))
+                body = assemble(location_data, block, classify([block])[0])
+                hours += [summary(entry) for entry in body["hourly_data"]]
+            results.setdefault(scenario, {})[str(elevation)] = {"elevation": body["elevation"], "hours": hours}
+
+    with open(BASELINE_PATH, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=1, sort_keys=True, ensure_ascii=False)
+        f.write("\n")
+    print(f"Wrote {BASELINE_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Sharing of prefetching between the workers of a host: request counts, the
+scheduler lease and the precomputed results, through the SQLite file.
+"""
+import sqlite3
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import prefetch
+import replay
+import weather
+from cache import SharedStore
+from pipeline import assemble, assemble_compact, classify, prepare_hours
+
+ZERMATT = {"lat": 46.02, "lon": 7.75, "name": "Zermatt", "display_name": "Zermatt, Valais, Switzerland"}
+DAVOS = {"lat": 46.8, "lon": 9.83, "name": "Davos", "display_name": "Davos, Grisons, Switzerland"}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "shared.sqlite")
+
+
+def test_counts_of_all_workers_are_merged(path):
+    first, second = prefetch.SharedPopularity(path), prefetch.SharedPopularity(path)
+    for _ in range(3):
+        first.record(ZERMATT)
+    second.record(ZERMATT, 2500.0)
+    for _ in range(5):
+        second.record(DAVOS)
+    first.flush()
+
+    assert second.top() == [(DAVOS, [None]), (ZERMATT, [None, 2500.0])]
+    assert len(first) == 2
+    first.decay()
+    assert first.top() == [(DAVOS, [None]), (ZERMATT, [None, 2500.0])]
+    first.decay()
+    assert first.top() == [(DAVOS, [None])]
+
+
+def test_lease_is_held_by_one_process(path, monkeypatch):
+    assert prefetch._lead(path)
+    assert prefetch._lead(path)
+
+    # Another process (a different token) holds it until it expires
+    monkeypatch.setattr(prefetch, "_token", (prefetch.os.getpid(), "other"))
+    assert not prefetch._lead(path)
+    with sqlite3.connect(path) as db:
+        db.execute("UPDATE prefetch_leases SET expires = 0")
+    assert prefetch._lead(path)
+
+
+def test_results_are_shared_unchanged(path):
+    with replay.Replay(replay.load("inversion")):
+        forecast = weather.fetch_weather_forecast(46.0, 7.7)
+    now = datetime.now(ZoneInfo("Europe/Zurich"))
+    block = prepare_hours(forecast, 2000.0, now)
+    physics = classify([block])[0]
+
+    store = SharedStore(path)
+    prefetch.Results(shared=store).put(prefetch.Results.key(forecast, 2000.0, now), block, physics)
+    shared = prefetch.Results(shared=store).get(forecast, 2000.0)
+
+    assert shared is not None
+    assert assemble(ZERMATT, *shared) == assemble(ZERMATT, block, physics)
+    assert assemble_compact(ZERMATT, *shared) == assemble_compact(ZERMATT, block, physics)
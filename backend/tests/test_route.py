@@ -0,0 +1,45 @@
+"""
+/api/predict/route's classification of waypoints (pipeline.build_route),
+on the bench fixtures.
+"""
+import copy
+
+import pytest
+
+import replay
+import weather
+from pipeline import build_route
+
+WAYPOINTS = [(46.0, 7.7, 2000.0), (46.0, 7.7, None)]
+
+
+@pytest.fixture(scope="module")
+def forecast():
+    with replay.Replay(replay.load("inversion")):
+        return weather.fetch_weather_forecast(46.0, 7.7)
+
+
+def test_route_has_a_value_per_waypoint_and_hour(forecast):
+    result = build_route(WAYPOINTS, [forecast, forecast], count=3)
+
+    assert len(result["hourly_data"]) == 3
+    for hour in result["hourly_data"]:
+        for key in ("precip", "type", "wet_bulb", "fl"):
+            assert len(hour[key]) == len(WAYPOINTS)
+            assert None not in hour[key]
+
+
+def test_route_without_surface_or_level_data_gives_none(forecast):
+    missing = copy.deepcopy(forecast)
+    missing["elevation"] = None
+    for name in missing["hourly"]:
+        if name not in ("time", "precipitation"):
+            missing["hourly"][name] = [None] * len(missing["hourly"][name])
+
+    result = build_route(WAYPOINTS, [missing, missing], count=3)
+
+    assert result["waypoints"][1]["elevation"] is None
+    for hour in result["hourly_data"]:
+        assert hour["type"] == [None, None]
+        assert hour["wet_bulb"] == [None, None]
+        assert hour["fl"][1] is None
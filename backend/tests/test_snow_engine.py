@@ -0,0 +1,135 @@
+"""
+The batch engine against the scalar SnowPredictor methods, which stay the
+reference, on every hour of the bench fixtures at several elevations.
+"""
+import numpy as np
+import pytest
+
+import replay
+from pipeline import prepare_hours
+from snow_engine import WET_BULB_FAST_DOMAIN, WET_BULB_FAST_MAX_ERROR, SnowPredictor
+
+ELEVATIONS = [None, 300, 1500, 3000]
+
+# The iterative batch solver uses np.exp instead of math.exp
+WET_BULB_TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope="module")
+def hours():
+    """Per fixture hour and elevation: the engine inputs, as pipeline.classify builds them."""
+    rows = []
+    for scenario in replay.SCENARIOS:
+        open_meteo = replay.load(scenario)["open_meteo"]
+        for elevation in ELEVATIONS:
+            block = prepare_hours(open_meteo, elevation, replay.first_hour(open_meteo), 0, 48)
+            temps_850 = block["temps_850"]
+            for i in range(len(block["times"])):
+                rows.append({
+                    "profile": block["profiles"][i],
+                    "temp": block["temps"][i],
+                    "rh": block["rhs"][i],
+                    "pressure": block["pressures"][i],
+                    "temp_850": temps_850[i] if i < len(temps_850) else None,
+                    "elevation": block["display_elevation"],
+                })
+    return rows
+
+
+def _column(rows, key):
+    return [row[key] for row in rows]
+
+
+def test_wet_bulb_batch_matches_scalar():
+    temp, rh, pressure = (a.ravel() for a in np.meshgrid(
+        np.linspace(-45, 45, 91), [0, 1, 20, 50, 80, 95, 99.9, 100], [450, 700, 850, 1013.25, 1060], indexing="ij"
+    ))
+    expected = [SnowPredictor.calculate_wet_bulb(*args) for args in zip(temp.tolist(), rh.tolist(), pressure.tolist())]
+    batch = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure)
+    np.testing.assert_allclose(batch, expected, rtol=0, atol=WET_BULB_TOLERANCE)
+
+
+def test_wet_bulb_fast_within_max_error_inside_domain():
+    (t_min, t_max), (rh_min, rh_max), (p_min, p_max) = WET_BULB_FAST_DOMAIN
+    rng = np.random.default_rng(0)
+    temp = rng.uniform(t_min, t_max, 20000)
+    rh = rng.uniform(rh_min, rh_max, 20000)
+    pressure = rng.uniform(p_min, p_max, 20000)
+    fast = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure, method="fast")
+    iterative = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure)
+    assert np.abs(fast - iterative).max() <= WET_BULB_FAST_MAX_ERROR
+
+
+def test_wet_bulb_fast_falls_back_outside_domain():
+    # Too warm, too cold, too low and too high pressure, mixed with inputs inside the domain
+    temp = np.array([45.0, -50.0, 10.0, 10.0, 5.0, -5.0])
+    rh = np.array([30.0, 60.0, 50.0, 50.0, 70.0, 99.95])
+    pressure = np.array([1000.0, 1000.0, 400.0, 1080.0, 900.0, 900.0])
+    fast = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure, method="fast")
+    iterative = SnowPredictor.calculate_wet_bulb_batch(temp, rh, pressure)
+    np.testing.assert_array_equal(fast[:4], iterative[:4])
+    np.testing.assert_allclose(fast[4:], iterative[4:], rtol=0, atol=WET_BULB_FAST_MAX_ERROR)
+    assert fast[5] == temp[5]
+
+
+def test_wet_bulb_batch_rejects_unknown_method():
+    with pytest.raises(ValueError):
+        SnowPredictor.calculate_wet_bulb_batch([1.0], [50.0], [900.0], method="exact")
+
+
+def test_freezing_level_batch_matches_scalar(hours):
+    z, temp = SnowPredictor.stack_profiles(_column(hours, "profile"))
+    batch = SnowPredictor.calculate_freezing_level_batch(z, temp, _column(hours, "elevation"))
+    expected = [SnowPredictor.calculate_freezing_level(row["profile"], row["elevation"]) for row in hours]
+    assert batch.tolist() == expected
+
+
+def test_bourgouin_areas_batch_matches_scalar(hours):
+    z, temp = SnowPredictor.stack_profiles(_column(hours, "profile"))
+    batch = SnowPredictor.calculate_bourgouin_areas_batch(z, temp)
+    expected = [SnowPredictor.calculate_bourgouin_areas(row["profile"]) for row in hours]
+    assert batch["positive"].tolist() == [areas["positive"] for areas in expected]
+    assert batch["negative"].tolist() == [areas["negative"] for areas in expected]
+
+
+@pytest.mark.parametrize("with_profile", [True, False])
+def test_precip_type_batch_matches_scalar(hours, with_profile):
+    profiles = _column(hours, "profile")
+    z, temp = SnowPredictor.stack_profiles(profiles)
+    if not with_profile:
+        # Rows without profile points use the simple wet-bulb logic
+        z, temp = np.full_like(z, np.nan), np.full_like(temp, np.nan)
+    freezing_levels = [SnowPredictor.calculate_freezing_level(p, row["elevation"]) for p, row in zip(profiles, hours)]
+    batch = SnowPredictor.determine_precip_type_batch(
+        _column(hours, "temp"), _column(hours, "rh"), freezing_levels, _column(hours, "elevation"),
+        np.asarray(_column(hours, "temp_850"), dtype=float), _column(hours, "pressure"), z, temp
+    )
+
+    expected = [
+        SnowPredictor.determine_precip_type(
+            row["temp"], row["rh"], fl, row["elevation"], row["temp_850"], row["pressure"],
+            row["profile"] if with_profile else None
+        )
+        for row, fl in zip(hours, freezing_levels)
+    ]
+    assert batch["type"].tolist() == [result["type"] for result in expected]
+    assert batch["icon"].tolist() == [result["icon"] for result in expected]
+    assert batch["areas"]["pos"].tolist() == [result["areas"]["pos"] for result in expected]
+    assert batch["areas"]["neg"].tolist() == [result["areas"]["neg"] for result in expected]
+    np.testing.assert_allclose(
+        batch["wet_bulb"], [result["wet_bulb"] for result in expected], rtol=0, atol=WET_BULB_TOLERANCE
+    )
+
+
+def test_precip_type_batch_fast_method_matches_types(hours):
+    z, temp = SnowPredictor.stack_profiles(_column(hours, "profile"))
+    args = (
+        _column(hours, "temp"), _column(hours, "rh"),
+        SnowPredictor.calculate_freezing_level_batch(z, temp, _column(hours, "elevation")),
+        _column(hours, "elevation"), np.asarray(_column(hours, "temp_850"), dtype=float),
+        _column(hours, "pressure"), z, temp
+    )
+    iterative = SnowPredictor.determine_precip_type_batch(*args)
+    fast = SnowPredictor.determine_precip_type_batch(*args, wet_bulb_method="fast")
+    assert fast["type"].tolist() == iterative["type"].tolist()
+    np.testing.assert_allclose(fast["wet_bulb"], iterative["wet_bulb"], rtol=0, atol=WET_BULB_FAST_MAX_ERROR)
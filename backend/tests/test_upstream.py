@@ -0,0 +1,63 @@
+"""
+Request budgets and circuit breakers of upstream calls, without a network:
+the calls are shed before anything is sent.
+"""
+import asyncio
+import contextvars
+import time
+
+import pytest
+
+import budget
+import upstream
+
+HOST = "upstream.test"
+URL = f"http://{HOST}/v1/forecast"
+
+
+@pytest.fixture
+def exhausted(monkeypatch):
+    """An in-memory budget whose daily quota for HOST is used up."""
+    monkeypatch.setattr(budget, "BUDGET", budget.Budget(path="", limits={HOST: budget.Limit(1.0, 1.0, daily=0.0)}))
+
+
+@pytest.fixture
+def half_open(monkeypatch):
+    """A breaker for HOST whose reset timeout has passed (the next call is the trial)."""
+    breaker = upstream.CircuitBreaker()
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout - 1
+    monkeypatch.setitem(upstream._breakers, HOST, breaker)
+    return breaker
+
+
+def test_shed_trial_call_releases_half_open_breaker(exhausted, half_open):
+    with pytest.raises(budget.BudgetExceeded):
+        upstream.get_json(URL)
+    assert half_open.state == "half-open"
+    assert half_open.allow()
+
+
+def test_shed_async_trial_call_releases_half_open_breaker(exhausted, half_open):
+    with pytest.raises(budget.BudgetExceeded):
+        asyncio.run(upstream.get_json_async(URL))
+    assert half_open.state == "half-open"
+    assert half_open.allow()
+
+
+def test_request_waits_at_most_request_max_wait(monkeypatch):
+    # One token per second: without the request's limit, batch calls would queue for minutes
+    monkeypatch.setattr(budget, "BUDGET", budget.Budget(path="", limits={HOST: budget.Limit(1.0, 1.0)}))
+    monkeypatch.setattr(budget, "REQUEST_MAX_WAIT", 0.5)
+
+    def request():
+        budget.begin_request()
+        budget.set_priority(budget.BATCH)
+        budget.acquire(HOST)
+        budget.acquire(HOST)
+
+    started = time.monotonic()
+    context = contextvars.copy_context()
+    with pytest.raises(budget.BudgetExceeded):
+        context.run(request)
+    assert time.monotonic() - started < 0.5
+    assert context.run(budget.shed_retry_after) > 0
@@ -0,0 +1,190 @@
+"""
+Builds data/gazetteer.tsv.gz from a GeoNames dump and the curated additions,
+and its lookup index (data/gazetteer.index, not in git; the app writes it on
+its first load if it is missing).
+
+Usage (from the backend directory):
+    curl -O https://download.geonames.org/export/dump/CH.zip && unzip CH.zip
+    python tools/build_gazetteer.py --geonames CH.txt
+    python tools/build_gazetteer.py --index-only    # (re)build the index only, e.g. at install time
+
+GeoNames data is licensed under CC BY 4.0 (https://www.geonames.org).
+"""
+import argparse
+import csv
+import gzip
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gazetteer import GAZETTEER_PATH, INDEX_PATH, Gazetteer, source_hash, normalize  # noqa: E402
+
+EXTRA_PATH = os.path.join(os.path.dirname(GAZETTEER_PATH), "gazetteer_extra.tsv")
+
+CANTONS = {
+    "AG": "Aargau", "AI": "Appenzell Innerrhoden", "AR": "Appenzell Ausserrhoden",
+    "BE": "Bern", "BL": "Basel-Landschaft", "BS": "Basel-City", "FR": "Fribourg",
+    "GE": "Geneva", "GL": "Glarus", "GR": "Grisons", "JU": "Jura", "LU": "Lucerne",
+    "NE": "Neuchatel", "NW": "Nidwalden", "OW": "Obwalden", "SG": "Saint Gallen",
+    "SH": "Schaffhausen", "SO": "Solothurn", "SZ": "Schwyz", "TG": "Thurgau",
+    "TI": "Ticino", "UR": "Uri", "VD": "Vaud", "VS": "Valais", "ZG": "Zug", "ZH": "Zurich",
+}
+
+# GeoNames feature (class, code) -> gazetteer kind
+FEATURE_KINDS = {
+    ("T", "PK"): "peak",
+    ("T", "MT"): "peak",
+    ("T", "PASS"): "pass",
+    ("S", "RSRT"): "resort",
+}
+
+# Ranks break ties between places sharing a name. Places rank by population;
+# resorts win over villages of the same name, peaks and passes come last.
+KIND_RANK = {"resort": 1_000_000, "place": 0, "pass": 0, "peak": 0}
+
+MERGE_DISTANCE_KM = 5
+MAX_ALIASES = 6
+
+
+def read_geonames(path: str, min_population: int) -> list:
+    """Reads a GeoNames dump (CH.txt / cities1000.txt format), Swiss rows only."""
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            cols = line.rstrip("\n").split("\t")
+            if len(cols) < 17 or cols[8] != "CH":
+                continue
+            fclass, fcode = cols[6], cols[7]
+            kind = "place" if fclass == "P" else FEATURE_KINDS.get((fclass, fcode))
+            population = int(cols[14] or 0)
+            if kind is None or (kind == "place" and population < min_population):
+                continue
+            elevation = cols[15] or (cols[16] if cols[16] not in ("", "-9999") else "")
+            rows.append({
+                "name": cols[1],
+                "aliases": _latin_aliases(cols[1], cols[3].split(",") if cols[3] else []),
+                "lat": float(cols[4]),
+                "lon": float(cols[5]),
+                "kind": kind,
+                "canton": CANTONS.get(cols[10], ""),
+                "elevation": elevation,
+                "rank": population + KIND_RANK[kind],
+            })
+    return rows
+
+
+def read_extra(path: str) -> list:
+    rows = []
+    with open(path, encoding="utf-8") as f:
+        reader = csv.reader((line for line in f if not line.startswith("#")), delimiter="\t")
+        for name, aliases, lat, lon, kind, canton, elevation in reader:
+            rows.append({
+                "name": name,
+                "aliases": [a for a in aliases.split("|") if a],
+                "lat": float(lat),
+                "lon": float(lon),
+                "kind": kind,
+                "canton": canton,
+                "elevation": elevation,
+                "rank": KIND_RANK[kind],
+            })
+    return rows
+
+
+def merge(base: list, extra: list) -> list:
+    """
+    Folds curated rows into the GeoNames rows. A curated row whose name or
+    alias matches a nearby GeoNames row replaces its name, kind and elevation
+    and adds its aliases; anything else is appended.
+    """
+    by_key = {}
+    for row in base:
+        by_key.setdefault(normalize(row["name"]), []).append(row)
+
+    for row in extra:
+        keys = {normalize(n) for n in (row["name"], *row["aliases"])}
+        target = next(
+            (b for key in keys for b in by_key.get(key, ()) if _distance_km(b, row) < MERGE_DISTANCE_KM),
+            None
+        )
+        if target is None:
+            base.append(row)
+            continue
+        aliases = [target["name"], *target["aliases"], *row["aliases"]]
+        target["aliases"] = [a for a in dict.fromkeys(aliases) if normalize(a) != normalize(row["name"])]
+        target["name"] = row["name"]
+        target["kind"] = row["kind"]
+        target["elevation"] = row["elevation"] or target["elevation"]
+        target["canton"] = row["canton"] or target["canton"]
+        target["rank"] = max(target["rank"], row["rank"])
+    return base
+
+
+def write(rows: list, path: str):
+    rows = sorted(rows, key=lambda r: (normalize(r["name"]), -r["rank"]))
+    with gzip.open(path, "wt", encoding="utf-8", compresslevel=9) as f:
+        f.write("# name\taliases\tlat\tlon\tkind\tcanton\televation\trank\n")
+        f.write("# Place data (c) GeoNames, CC BY 4.0; built by tools/build_gazetteer.py\n")
+        for r in rows:
+            f.write("\t".join([
+                r["name"],
+                "|".join(r["aliases"]),
+                f"{r['lat']:.5f}",
+                f"{r['lon']:.5f}",
+                r["kind"],
+                r["canton"],
+                str(r["elevation"]),
+                str(r["rank"]),
+            ]) + "\n")
+
+
+def write_index(path: str, index_path: str):
+    """Builds the lookup index of a gazetteer file (see Gazetteer.read_index)."""
+    Gazetteer.load(path, index_path=None).write_index(index_path, source_hash(path))
+
+
+def _latin_aliases(name: str, alternates: list) -> list:
+    seen = {normalize(name)}
+    aliases = []
+    for alt in alternates:
+        key = normalize(alt)
+        if not key or key in seen:
+            continue
+        if any(ord(c) > 0x24F for c in alt):  # skip non-Latin scripts
+            continue
+        seen.add(key)
+        aliases.append(alt)
+        if len(aliases) >= MAX_ALIASES:
+            break
+    return aliases
+
+
+def _distance_km(a: dict, b: dict) -> float:
+    cos_lat = math.cos(math.radians(a["lat"]))
+    return math.hypot(a["lat"] - b["lat"], (a["lon"] - b["lon"]) * cos_lat) * 111.2
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--geonames", help="GeoNames dump file (e.g. CH.txt)")
+    parser.add_argument("--extra", default=EXTRA_PATH, help="Curated additions TSV")
+    parser.add_argument("--output", default=GAZETTEER_PATH)
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--min-population", type=int, default=0, help="Skip smaller populated places")
+    parser.add_argument("--index-only", action="store_true", help="Only rebuild the index of --output")
+    args = parser.parse_args()
+    if not args.index_only and not args.geonames:
+        parser.error("--geonames is required (or --index-only)")
+
+    if not args.index_only:
+        rows = merge(read_geonames(args.geonames, args.min_population), read_extra(args.extra))
+        write(rows, args.output)
+        print(f"Wrote {len(rows)} places to {args.output}")
+    write_index(args.output, args.index)
+    print(f"Wrote the lookup index to {args.index}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+import asyncio
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import budget
+import metrics
+
+USER_AGENT = "SwissSnowPredictor/1.0"
+
+# Upstream statuses worth retrying (rate limiting and gateway trouble)
+RETRY_STATUSES = {429, 502, 503, 504}
+
+
+class UpstreamUnavailable(requests.RequestException):
+    """Raised without contacting the upstream while its circuit breaker is open."""
+
+
+class HostPolicy:
+    """Timeouts and retry budget for one upstream host."""
+    __slots__ = ("connect_timeout", "read_timeout", "retries", "backoff_base", "backoff_max", "deadline")
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff_base=0.25, backoff_max=2.0, deadline=15.0):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+
+
+# Keep every policy's deadline well below gunicorn's 30s worker timeout
+HOST_POLICIES = {
+    "api.open-meteo.com": HostPolicy(read_timeout=10.0, retries=2, deadline=15.0),
+    "nominatim.openstreetmap.org": HostPolicy(read_timeout=5.0, retries=1, backoff_base=1.0, deadline=8.0),
+}
+DEFAULT_POLICY = HostPolicy()
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls for
+    `reset_timeout` seconds. Then a single trial call is let through
+    (half-open): success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release(self):
+        """Gives back a claimed trial that was never sent (e.g. shed by the budget)."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold or self.opened_at is not None:
+                self.opened_at = time.monotonic()
+
+
+_session = None
+_session_lock = threading.Lock()
+_breakers = {}
+
+# Connections of the async client (asgi.py keeps many upstream requests in flight)
+ASYNC_MAX_CONNECTIONS = 200
+_async_client = None
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide pooled session (keep-alive, gzip, no adapter retries)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "User-Agent": USER_AGENT,
+                    "Accept-Encoding": "gzip, deflate",
+                })
+                _session = session
+    return _session
+
+
+def get_breaker(host: str) -> CircuitBreaker:
+    breaker = _breakers.get(host)
+    if breaker is None:
+        breaker = _breakers.setdefault(host, CircuitBreaker())
+    return breaker
+
+
+def get_json(url: str, params: dict = None, headers: dict = None, cost: float = 1.0):
+    """
+    GETs a JSON document from an upstream API.
+
+    Uses the shared connection pool and the host's timeouts, retries connection
+    errors, timeouts and RETRY_STATUSES with jittered exponential backoff
+    (bounded by the host deadline), and trips the host's circuit breaker after
+    repeated failures. Every attempt first takes `cost` from the host's
+    request budget (see budget.py); a 429 with Retry-After pauses the budget.
+
+    Raises:
+        requests.RequestException: On failure (UpstreamUnavailable if the
+            circuit is open, budget.BudgetExceeded if the call was shed), so
+            callers keep their existing error handling.
+    """
+    host = urlsplit(url).hostname
+    policy = HOST_POLICIES.get(host, DEFAULT_POLICY)
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{host} is unavailable (circuit open)")
+
+    session = get_session()
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            budget.acquire(host, cost)
+        except budget.BudgetExceeded:
+            breaker.release()
+            raise
+        retry_after = None
+        attempt_started = time.perf_counter()
+        try:
+            response = session.get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=(policy.connect_timeout, policy.read_timeout)
+            )
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - attempt_started, host, str(response.status_code))
+            if response.status_code in RETRY_STATUSES:
+                retry_after = _retry_after_seconds(response)
+                _pause_budget(host, response.status_code, retry_after)
+            response.raise_for_status()
+            data = response.json()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as e:
+            if not isinstance(e, requests.HTTPError):
+                metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - attempt_started, host, type(e).__name__)
+            retryable = not isinstance(e, requests.HTTPError) or e.response.status_code in RETRY_STATUSES
+            if not retryable:
+                # The host answered; a client error says nothing about its health
+                breaker.record_success()
+                raise
+            delay = _backoff(policy, attempt, retry_after)
+            if attempt >= policy.retries or time.monotonic() - started + delay > policy.deadline:
+                breaker.record_failure()
+                raise
+            metrics.UPSTREAM_RETRIES.inc(host)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except requests.RequestException:
+            breaker.record_failure()
+            raise
+
+        breaker.record_success()
+        return data
+
+
+def get_async_client():
+    """Returns the pooled httpx client of the running event loop."""
+    # Imported on first use: only asgi.py needs httpx, and it would add to
+    # every cold start of the WSGI and serverless deployments
+    import httpx
+
+    global _async_client
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client[0] is not loop:
+        client = httpx.AsyncClient(
+            headers={"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"},
+            limits=httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS, max_keepalive_connections=32),
+        )
+        _async_client = (loop, client)
+    return _async_client[1]
+
+
+async def close_async_client():
+    global _async_client
+    if _async_client is not None:
+        client, _async_client = _async_client[1], None
+        await client.aclose()
+
+
+async def get_json_async(url: str, params: dict = None, headers: dict = None, cost: float = 1.0):
+    """
+    Async counterpart of get_json: the same host policies, retries and circuit
+    breakers, without blocking the event loop while waiting.
+
+    Raises:
+        requests.RequestException: On failure, like get_json.
+    """
+    try:
+        import httpx
+    except ImportError:
+        raise requests.RequestException("httpx is required for async upstream requests")
+    host = urlsplit(url).hostname
+    policy = HOST_POLICIES.get(host, DEFAULT_POLICY)
+    breaker = get_breaker(host)
+    if not breaker.allow():
+        raise UpstreamUnavailable(f"{host} is unavailable (circuit open)")
+
+    client = get_async_client()
+    timeout = httpx.Timeout(policy.read_timeout, connect=policy.connect_timeout)
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            await budget.acquire_async(host, cost)
+        except budget.BudgetExceeded:
+            breaker.release()
+            raise
+        retry_after = None
+        attempt_started = time.perf_counter()
+        try:
+            response = await client.get(url, params=params, headers=headers, timeout=timeout)
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - attempt_started, host, str(response.status_code))
+            if response.status_code in RETRY_STATUSES:
+                retry_after = _retry_after_seconds(response)
+                _pause_budget(host, response.status_code, retry_after)
+            response.raise_for_status()
+            data = response.json()
+        except (httpx.TransportError, httpx.HTTPStatusError) as e:
+            status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+            if status is None:
+                metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - attempt_started, host, type(e).__name__)
+            if status is not None and status not in RETRY_STATUSES:
+                breaker.record_success()
+                raise _requests_error(e) from e
+            delay = _backoff(policy, attempt, retry_after)
+            if attempt >= policy.retries or time.monotonic() - started + delay > policy.deadline:
+                breaker.record_failure()
+                raise _requests_error(e) from e
+            metrics.UPSTREAM_RETRIES.inc(host)
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+        except (httpx.HTTPError, ValueError) as e:
+            breaker.record_failure()
+            raise requests.RequestException(str(e)) from e
+
+        breaker.record_success()
+        return data
+
+
+def _pause_budget(host: str, status: int, retry_after: float):
+    # The host is rate limiting us: every worker waits, not just this call
+    if status == 429 and retry_after:
+        budget.BUDGET.block(host, retry_after)
+
+
+def _requests_error(error) -> requests.RequestException:
+    # Callers handle requests' exceptions (see get_json)
+    import httpx
+    if isinstance(error, httpx.HTTPStatusError):
+        return requests.HTTPError(str(error))
+    if isinstance(error, httpx.TimeoutException):
+        return requests.Timeout(str(error))
+    return requests.ConnectionError(str(error))
+
+
+def _backoff(policy: HostPolicy, attempt: int, retry_after: float = None) -> float:
+    # "Full jitter" keeps workers that failed together from retrying in lockstep
+    delay = random.uniform(0, min(policy.backoff_max, policy.backoff_base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+def _retry_after_seconds(response) -> float:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
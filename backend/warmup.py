@@ -0,0 +1,100 @@
+"""
+Warm-up for cold starts (serverless functions, fresh workers).
+
+The first request of a process pays for what is only done once: loading
+the gazetteer and connecting to Open-Meteo (DNS, TCP and TLS). start() does
+both in a background thread as soon as app.py is imported, so the connection
+is opened while the runtime hands over the first request and while that
+request geocodes. Only a HEAD request for the root of the host is sent (no
+API call), with BACKGROUND priority through the host's request budget and
+circuit breaker like any other upstream call; its connection stays in the
+session's pool for the first real request. Nominatim is not warmed: the
+gazetteer answers almost every query, and its usage policy asks for no
+requests beyond the searches.
+
+Off by default; set SNOW_WARMUP=1 to turn it on (vercel.json does).
+"""
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+import budget
+import metrics
+from gazetteer import get_gazetteer
+from upstream import DEFAULT_POLICY, HOST_POLICIES, get_breaker, get_session
+from weather import OPEN_METEO_URL
+
+ENABLED = os.environ.get("SNOW_WARMUP", "0").lower() not in ("0", "false", "no", "off")
+
+_last_warmup = {"seconds": 0.0, "connections": 0}
+_started = False
+_start_lock = threading.Lock()
+
+
+def preconnect(urls: list) -> int:
+    """
+    Opens one pooled connection to the host of each URL with a HEAD request
+    for the host's root, through the shared session (same pool, proxies and
+    TLS settings as the requests that follow). Hosts whose circuit is open or
+    whose budget sheds the request are skipped.
+
+    Returns:
+        int: Number of connections opened.
+    """
+    session = get_session()
+    opened = 0
+    for url in urls:
+        parts = urlsplit(url)
+        policy = HOST_POLICIES.get(parts.hostname, DEFAULT_POLICY)
+        breaker = get_breaker(parts.hostname)
+        if not breaker.allow():
+            continue
+        try:
+            budget.acquire(parts.hostname)
+        except budget.BudgetExceeded:
+            breaker.release()
+            continue
+        try:
+            # Any answer will do; closing the response returns the connection to the pool
+            response = session.request(
+                "HEAD", f"{parts.scheme}://{parts.netloc}/", allow_redirects=False,
+                timeout=(policy.connect_timeout, policy.read_timeout)
+            )
+            response.close()
+            breaker.record_success()
+            opened += 1
+        except requests.RequestException as e:
+            breaker.record_failure()
+            print(f"Error connecting to {url}: {e}")
+    return opened
+
+
+def warm_up() -> dict:
+    """Loads the gazetteer and connects to Open-Meteo; returns what was done."""
+    budget.begin_background()
+    started = time.perf_counter()
+    connections = preconnect([OPEN_METEO_URL])
+    get_gazetteer()
+    _last_warmup.update(seconds=time.perf_counter() - started, connections=connections)
+    return dict(_last_warmup)
+
+
+def start():
+    """Runs warm_up() in a background thread (once per process)."""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=warm_up, name="warmup", daemon=True).start()
+
+
+def _warmup_metrics():
+    yield "snow_warmup_seconds", "gauge", "Duration of the startup warm-up", _last_warmup["seconds"]
+    yield "snow_warmup_connections", "gauge", "Upstream connections opened by the warm-up", _last_warmup["connections"]
+
+
+metrics.register_collector(_warmup_metrics)
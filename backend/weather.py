@@ -1,49 +1,418 @@
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from cache import SHARED_STORE, ForecastCache
+from upstream import get_json, get_json_async
+import budget
+import metrics
 
-def get_weather_forecast(lat: float, lon: float) -> dict:
+# Nearby coordinates resolve to the same model grid cell (ICON-D2 is ~2.2km, 0.02°),
+# so forecasts are fetched and cached per snapped cell.
+GRID_RESOLUTION_DEG = 0.02
+
+# icon_seamless is updated every 3 hours; Open-Meteo publishes a run roughly 2h later.
+MODEL_UPDATE_HOURS = 3
+MODEL_PUBLISH_DELAY = timedelta(hours=2)
+
+# Override to point at a local stand-in (see bench/standin.py)
+OPEN_METEO_URL = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+
+# Locations per multi-location request (keeps the URL and response size reasonable)
+MAX_LOCATIONS_PER_REQUEST = 25
+
+# High-res Swiss ICON models (1km/2.2km), used for every prediction
+DEFAULT_MODEL = "icon_seamless"
+
+# Members of the ensemble mode: the ICON family, ECMWF IFS and the GFS family.
+# Levels a model does not provide come back as nulls and are skipped.
+ENSEMBLE_MODELS = ["icon_seamless", "icon_eu", "icon_global", "ecmwf_ifs025", "gfs_seamless"]
+
+# Ensemble members are fetched concurrently (shared by all requests)
+_member_pool = ThreadPoolExecutor(max_workers=2 * len(ENSEMBLE_MODELS), thread_name_prefix="ensemble")
+
+# Days from local midnight to fetch by default (covers the next 24 hours) and at most
+FORECAST_DAYS = 2
+MAX_FORECAST_DAYS = 7
+
+# Hourly series requested besides the pressure-level profiles, and the current conditions
+SURFACE_VARIABLES = [
+    "temperature_2m",
+    "relative_humidity_2m",
+    "precipitation",
+    "weather_code",
+    "cloud_cover",
+    "freezing_level_height",
+    "temperature_850hPa",
+    "temperature_700hPa",
+    "is_day",
+    "surface_pressure",
+]
+CURRENT_VARIABLES = "temperature_2m,weather_code,is_day"
+
+# Series also requested every 15 minutes when 15-minute data is asked for
+# (ICON-D2 provides them; elsewhere Open-Meteo interpolates the hourly data)
+MINUTELY_VARIABLES = ["temperature_2m", "relative_humidity_2m", "precipitation", "weather_code", "is_day"]
+
+# Pressure levels of the profiles (temperature, humidity and height of each)
+PRESSURE_LEVELS = [1000, 975, 950, 925, 900, 875, 850, 825, 800, 775, 750, 700, 650, 600, 550, 500]
+
+# Upstream requests in flight on the event loop of asgi.py, per cache key
+_pending_fetches = {}
+
+_forecast_cache = ForecastCache(
+    max_entries=512,
+    ttl=MODEL_UPDATE_HOURS * 3600,
+    max_stale=2 * MODEL_UPDATE_HOURS * 3600,
+    shared=SHARED_STORE,
+    namespace="forecast",
+    # Stale-while-revalidate refreshes only take what interactive calls leave
+    background=budget.begin_background,
+)
+
+
+def _cache_metrics():
+    stats = _forecast_cache.stats()
+    yield "snow_forecast_cache_entries", "gauge", "Forecasts held in the cache", stats["entries"]
+    for event in ("hits", "stale_hits", "shared_hits", "misses", "coalesced"):
+        yield f"snow_forecast_cache_{event}_total", "counter", f"Forecast cache {event.replace('_', ' ')}", stats[event]
+
+
+metrics.register_collector(_cache_metrics)
+
+
+def snap_to_grid(lat: float, lon: float) -> tuple:
+    """Snaps coordinates to the center of their forecast grid cell."""
+    return (
+        round(round(lat / GRID_RESOLUTION_DEG) * GRID_RESOLUTION_DEG, 4),
+        round(round(lon / GRID_RESOLUTION_DEG) * GRID_RESOLUTION_DEG, 4)
+    )
+
+
+def forecast_days(forecast: dict) -> int:
+    """The number of days (from local midnight) a forecast response covers."""
+    return len(forecast.get("hourly", {}).get("time", [])) // 24
+
+
+class _Contents:
+    """What a forecast response holds: days and 15-minute data."""
+    __slots__ = ("days", "minutely")
+
+    def __init__(self, days: int = FORECAST_DAYS, minutely: bool = False):
+        self.days = days
+        self.minutely = minutely
+
+    @classmethod
+    def of(cls, forecast: dict) -> "_Contents":
+        return cls(forecast_days(forecast), "minutely_15" in forecast)
+
+    def covered_by(self, forecast: dict) -> bool:
+        return forecast_days(forecast) >= self.days and (not self.minutely or "minutely_15" in forecast)
+
+    def union(self, *others) -> "_Contents":
+        everything = (self,) + others
+        return _Contents(max(c.days for c in everything), any(c.minutely for c in everything))
+
+    def fetch(self, coords: list, model: str = DEFAULT_MODEL) -> list:
+        return fetch_weather_forecasts(coords, self.days, self.minutely, model)
+
+    async def fetch_async(self, coords: list, model: str = DEFAULT_MODEL) -> list:
+        return await fetch_weather_forecasts_async(coords, self.days, self.minutely, model)
+
+
+def current_model_run(now: datetime = None) -> str:
+    """
+    Returns the latest model run expected to be available, e.g. "2026-01-15T06Z".
+    """
+    now = now or datetime.now(timezone.utc)
+    available = now.astimezone(timezone.utc) - MODEL_PUBLISH_DELAY
+    run = available.replace(hour=available.hour - available.hour % MODEL_UPDATE_HOURS, minute=0, second=0, microsecond=0)
+    return run.strftime("%Y-%m-%dT%HZ")
+
+
+def next_model_update(now: datetime = None) -> datetime:
+    """Returns when the run after current_model_run() is expected to be available (UTC)."""
+    now = now or datetime.now(timezone.utc)
+    run = datetime.strptime(current_model_run(now), "%Y-%m-%dT%HZ").replace(tzinfo=timezone.utc)
+    return run + timedelta(hours=MODEL_UPDATE_HOURS) + MODEL_PUBLISH_DELAY
+
+
+def fingerprint(forecast: dict) -> str:
+    """
+    Hash of the data of a forecast response that predictions depend on
+    (generation time and the 'current' block are left out).
+    """
+    data = [forecast.get("elevation"), forecast.get("hourly"), forecast.get("minutely_15")]
+    text = json.dumps(data, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def get_weather_forecast(lat: float, lon: float, days: int = FORECAST_DAYS, minutely: bool = False,
+                         model: str = DEFAULT_MODEL) -> dict:
+    """
+    Returns the weather forecast for the grid cell containing (lat, lon).
+
+    Responses are cached per grid cell, model and model run. Concurrent misses for the
+    same cell share one upstream request, and a forecast from the previous run
+    is served while the new run is fetched in the background.
+    The returned dict is shared between callers and must not be modified.
+
+    A cached forecast that lacks days or 15-minute data is fetched again with
+    the union of both.
+
+    Args:
+        lat (float): Latitude.
+        lon (float): Longitude.
+        days (int): Days from local midnight the forecast must cover (at most MAX_FORECAST_DAYS).
+        minutely (bool): Whether 15-minute data ('minutely_15') is needed.
+        model (str): Open-Meteo weather model.
+
+    Returns:
+        dict: The JSON response from Open-Meteo API containing current and hourly
+              forecast, plus 'model_run' (the run it was fetched for) and
+              'fingerprint' (see fingerprint()).
+    """
+    cell = snap_to_grid(lat, lon)
+    # The forecast window starts at local midnight, so a new day needs a new fetch
+    today = datetime.now(ZoneInfo("Europe/Zurich")).date().isoformat()
+    run = current_model_run()
+    key = (cell, today, model)
+    needed = _Contents(min(days, MAX_FORECAST_DAYS), minutely)
+    forecast = _forecast_cache.get(key, run, lambda: (needed.fetch([cell], model) or [None])[0])
+    if forecast is not None and not needed.covered_by(forecast):
+        fetched = needed.union(_Contents.of(forecast)).fetch([cell], model)
+        if fetched and fetched[0] is not None:
+            _forecast_cache.put(key, run, fetched[0])
+            forecast = fetched[0]
+    return forecast
+
+
+async def get_weather_forecast_async(lat: float, lon: float, days: int = FORECAST_DAYS,
+                                    minutely: bool = False, model: str = DEFAULT_MODEL) -> dict:
+    """
+    Async counterpart of get_weather_forecast (same cache and arguments), for
+    asgi.py. Concurrent misses for the same cell share one upstream request.
+
+    A stale forecast is returned as it is, and refreshed in the background
+    (one upstream request per cell, with BACKGROUND priority).
+    """
+    cell = snap_to_grid(lat, lon)
+    today = datetime.now(ZoneInfo("Europe/Zurich")).date().isoformat()
+    run = current_model_run()
+    key = (cell, today, model)
+    needed = _Contents(min(days, MAX_FORECAST_DAYS), minutely)
+    # A shared fetch may have been started for less than this request needs: then fetch once more
+    for attempt in range(3):
+        forecast, fresh = _forecast_cache.lookup(key, run)
+        if attempt == 2 or forecast is not None and needed.covered_by(forecast):
+            if forecast is not None and not fresh and key not in _pending_fetches:
+                contents = needed.union(_Contents.of(forecast))
+                refresh = _pending_fetches[key] = asyncio.ensure_future(_refresh_async(contents, cell, model))
+                refresh.add_done_callback(functools.partial(_fetched, key, run))
+            return forecast
+        pending = _pending_fetches.get(key)
+        if pending is None:
+            contents = needed if forecast is None else needed.union(_Contents.of(forecast))
+            pending = _pending_fetches[key] = asyncio.ensure_future(contents.fetch_async([cell], model))
+            pending.add_done_callback(functools.partial(_fetched, key, run))
+        # Shielded: a cancelled request does not cancel a fetch others wait on
+        fetched = await asyncio.shield(pending)
+        if not fetched or fetched[0] is None:
+            return forecast
+
+
+async def _refresh_async(contents: "_Contents", cell: tuple, model: str) -> list:
+    # Runs in a copy of the request's context: detach it from the request
+    budget.begin_background()
+    return await contents.fetch_async([cell], model)
+
+
+def _fetched(key: tuple, run: str, pending: "asyncio.Future"):
+    _pending_fetches.pop(key, None)
+    if not pending.cancelled() and pending.exception() is None and pending.result():
+        _forecast_cache.put(key, run, pending.result()[0])
+
+
+def get_ensemble_forecasts(lat: float, lon: float, models: list = None) -> dict:
+    """
+    Returns the forecasts of several models for the grid cell containing
+    (lat, lon), fetched concurrently (each one cached like get_weather_forecast).
+
+    Args:
+        lat (float): Latitude.
+        lon (float): Longitude.
+        models (list): Open-Meteo models (default: ENSEMBLE_MODELS).
+
+    Returns:
+        dict: Forecast per model, in the given order (None where fetching failed).
+    """
+    models = models or ENSEMBLE_MODELS
+    # In the request's context, so shed calls are reported with it (see budget.py)
+    futures = [
+        _member_pool.submit(contextvars.copy_context().run, get_weather_forecast, lat, lon, model=model)
+        for model in models
+    ]
+    return {model: future.result() for model, future in zip(models, futures)}
+
+
+def get_weather_forecasts(coords: list, refresh: bool = False) -> list:
+    """
+    Returns forecasts for several (lat, lon) pairs, in order.
+
+    Cached cells are served from the cache; the remaining cells are fetched
+    together using Open-Meteo's multi-location requests.
+
+    Args:
+        coords (list): (lat, lon) tuples.
+        refresh (bool): Fetch stale cells with the others instead of serving
+            them while they are refreshed in the background (prefetching).
+
+    Returns:
+        list: One forecast dict per coordinate (None where fetching failed).
+    """
+    run = current_model_run()
+    today = datetime.now(ZoneInfo("Europe/Zurich")).date().isoformat()
+    cells = [snap_to_grid(lat, lon) for lat, lon in coords]
+    needed = _Contents()
+
+    forecasts = {}
+    missing = []
+    for cell in dict.fromkeys(cells):
+        key = (cell, today, DEFAULT_MODEL)
+        value, fresh = _forecast_cache.lookup(key, run)
+        if value is not None and not fresh and refresh:
+            missing.append(cell)
+            forecasts[cell] = value
+            continue
+        if value is not None and not fresh:
+            # Serve the stale entry and let the cache refresh it in the background
+            value = _forecast_cache.get(key, run, lambda cell=cell: (needed.fetch([cell]) or [None])[0])
+        if value is None:
+            missing.append(cell)
+        else:
+            forecasts[cell] = value
+
+    for start in range(0, len(missing), MAX_LOCATIONS_PER_REQUEST):
+        chunk = missing[start:start + MAX_LOCATIONS_PER_REQUEST]
+        fetched = needed.fetch(chunk) or []
+        for cell, data in zip(chunk, fetched):
+            _forecast_cache.put((cell, today, DEFAULT_MODEL), run, data)
+            if data is not None:
+                forecasts[cell] = data
+
+    return [forecasts.get(cell) for cell in cells]
+
+
+def fetch_weather_forecast(lat: float, lon: float, days: int = FORECAST_DAYS, minutely: bool = False,
+                           model: str = DEFAULT_MODEL) -> dict:
     """
     Fetches weather forecast from Open-Meteo API.
     
     Args:
         lat (float): Latitude.
         lon (float): Longitude.
+        days (int): Days to fetch, from local midnight.
+        minutely (bool): Also fetch MINUTELY_VARIABLES every 15 minutes.
+        model (str): Open-Meteo weather model.
         
     Returns:
         dict: The JSON response from Open-Meteo API containing current and hourly forecast.
     """
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "hourly": ",".join([
-            "temperature_2m",
-            "relative_humidity_2m",
-            "precipitation",
-            "weather_code",
-            "cloud_cover",
-            "freezing_level_height",
-            "temperature_850hPa",
-            "temperature_700hPa",
-            "is_day",
-            "surface_pressure",
-            "temperature_1000hPa", "temperature_975hPa", "temperature_950hPa", "temperature_925hPa", "temperature_900hPa", "temperature_875hPa", "temperature_850hPa", "temperature_825hPa", "temperature_800hPa", "temperature_775hPa", "temperature_750hPa", "temperature_700hPa", "temperature_650hPa", "temperature_600hPa", "temperature_550hPa", "temperature_500hPa",
-            "relative_humidity_1000hPa", "relative_humidity_975hPa", "relative_humidity_950hPa", "relative_humidity_925hPa", "relative_humidity_900hPa", "relative_humidity_875hPa", "relative_humidity_850hPa", "relative_humidity_825hPa", "relative_humidity_800hPa", "relative_humidity_775hPa", "relative_humidity_750hPa", "relative_humidity_700hPa", "relative_humidity_650hPa", "relative_humidity_600hPa", "relative_humidity_550hPa", "relative_humidity_500hPa",
-            "geopotential_height_1000hPa", "geopotential_height_975hPa", "geopotential_height_950hPa", "geopotential_height_925hPa", "geopotential_height_900hPa", "geopotential_height_875hPa", "geopotential_height_850hPa", "geopotential_height_825hPa", "geopotential_height_800hPa", "geopotential_height_775hPa", "geopotential_height_750hPa", "geopotential_height_700hPa", "geopotential_height_650hPa", "geopotential_height_600hPa", "geopotential_height_550hPa", "geopotential_height_500hPa"
-        ]),
-        "current": ",".join([
-            "temperature_2m",
-            "weather_code",
-            "is_day"
-        ]),
-        "timezone": "Europe/Zurich",
-        "forecast_days": 2, # Fetch 2 days to ensure we have next 24h from now
-        "models": "icon_seamless" # Uses high-res Swiss ICON models (1km/2.2km)
-    }
+    forecasts = fetch_weather_forecasts([(lat, lon)], days, minutely, model)
+    return forecasts[0] if forecasts else None
 
+
+def fetch_weather_forecasts(coords: list, days: int = FORECAST_DAYS, minutely: bool = False,
+                            model: str = DEFAULT_MODEL, surface: tuple = None) -> list:
+    """
+    Fetches forecasts for several locations in a single Open-Meteo request.
+
+    Args:
+        coords (list): (lat, lon) tuples.
+        days (int): Days to fetch, from local midnight.
+        minutely (bool): Also fetch MINUTELY_VARIABLES every 15 minutes.
+        model (str): Open-Meteo weather model.
+        surface (tuple): Hourly series to request besides the pressure levels, without
+            the current conditions (default: SURFACE_VARIABLES and CURRENT_VARIABLES).
+
+    Returns:
+        list: One Open-Meteo response dict per coordinate, in order, or None on error.
+    """
+    params = _forecast_params(coords, days, minutely, model, surface)
     try:
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        return response.json()
+        data = get_json(OPEN_METEO_URL, params=params, cost=call_cost(params))
     except requests.RequestException as e:
         print(f"Error fetching weather data: {e}")
         return None
+    return _stamp(data)
+
+
+async def fetch_weather_forecasts_async(coords: list, days: int = FORECAST_DAYS, minutely: bool = False,
+                                        model: str = DEFAULT_MODEL) -> list:
+    """Async counterpart of fetch_weather_forecasts (for asgi.py)."""
+    params = _forecast_params(coords, days, minutely, model)
+    try:
+        data = await get_json_async(OPEN_METEO_URL, params=params, cost=call_cost(params))
+    except requests.RequestException as e:
+        print(f"Error fetching weather data: {e}")
+        return None
+    return _stamp(data)
+
+
+def forecast_cost(coords: list, days: int = FORECAST_DAYS, minutely: bool = False, surface: tuple = None) -> float:
+    """The API calls fetch_weather_forecasts with these arguments costs (see call_cost)."""
+    return call_cost(_forecast_params(coords, days, minutely, DEFAULT_MODEL, surface))
+
+
+def call_cost(params: dict) -> float:
+    """
+    The API calls Open-Meteo counts for a request: one per location, more
+    for more than 10 variables or 2 weeks (fractional).
+    """
+    locations = params["latitude"].count(",") + 1
+    variables = sum(len(params[block].split(",")) for block in ("hourly", "current", "minutely_15") if block in params)
+    return locations * max(1.0, variables / 10) * max(1.0, params["forecast_days"] / 14)
+
+
+def _forecast_params(coords: list, days: int, minutely: bool, model: str, surface: tuple = None) -> dict:
+    params = {
+        "latitude": ",".join(str(lat) for lat, _ in coords),
+        "longitude": ",".join(str(lon) for _, lon in coords),
+        "hourly": _hourly_variables(surface),
+        "current": CURRENT_VARIABLES,
+        "timezone": "Europe/Zurich",
+        "forecast_days": days, # 2 days ensure we have next 24h from now
+        "models": model
+    }
+    if surface is not None:
+        del params["current"]
+    if minutely:
+        params["minutely_15"] = ",".join(MINUTELY_VARIABLES)
+    return params
+
+
+@functools.lru_cache(maxsize=None)
+def _hourly_variables(surface: tuple = None) -> str:
+    """The 'hourly' parameter for a set of surface series (None: SURFACE_VARIABLES), built once per set."""
+    return ",".join(list(SURFACE_VARIABLES if surface is None else surface) + [
+        f"{variable}_{p}hPa"
+        for variable in ("temperature", "relative_humidity", "geopotential_height")
+        for p in PRESSURE_LEVELS
+    ])
+
+
+def _stamp(data) -> list:
+    # A single location comes back as an object, several as a list
+    forecasts = data if isinstance(data, list) else [data]
+    run = current_model_run()
+    for forecast in forecasts:
+        # Identify the data for conditional responses (ETag) before it is shared
+        forecast["model_run"] = run
+        forecast["fingerprint"] = fingerprint(forecast)
+    return forecasts
@@ -1,12 +1,41 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { BrowserRouter, Routes, Route, useSearchParams } from 'react-router-dom';
-import axios from 'axios';
 import { MapPin, Wind, History, ArrowRight, Edit3 } from 'lucide-react';
 import WeatherBackground from './components/WeatherBackground';
 import WeatherCard from './components/WeatherCard';
 
 const API_BASE = (import.meta.env.VITE_API_BASE_URL || 'http://127.0.0.1:5001').replace(/\/$/, '');
 
+// Reads the NDJSON stream from /api/predict/stream and reports each message as it arrives.
+// A GET lets the browser (and any CDN) revalidate with the response's ETag when re-polling.
+async function streamPrediction(payload, onMessage) {
+  const query = new URLSearchParams(
+    Object.entries(payload).filter(([, value]) => value !== null && value !== undefined)
+  );
+  const res = await fetch(`${API_BASE}/api/predict/stream?${query}`, {
+    headers: { Accept: 'application/x-ndjson' }
+  });
+  if (!res.ok) {
+    const body = await res.json().catch(() => ({}));
+    throw new Error(body.error || 'Something went wrong');
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { done, value } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    let newline;
+    while ((newline = buffer.indexOf('\n')) >= 0) {
+      const line = buffer.slice(0, newline).trim();
+      buffer = buffer.slice(newline + 1);
+      if (line) onMessage(JSON.parse(line));
+    }
+  }
+}
+
 function SnowApp() {
   const [searchParams, setSearchParams] = useSearchParams();
   const [loading, setLoading] = useState(false);
@@ -35,11 +64,19 @@ function SnowApp() {
     setLoading(true);
     setError(null);
     try {
-      const res = await axios.post(`${API_BASE}/api/predict`, {
-        location,
-        elevation: elevation || null
+      // Show the first card as soon as its hour arrives, then append the rest
+      let header = null;
+      await streamPrediction({ location, elevation: elevation || null }, (msg) => {
+        if (msg.event === 'location') {
+          header = { location: msg.location, elevation: msg.elevation };
+        } else if (msg.event === 'hour') {
+          setData(prev => ({
+            ...header,
+            hourly_data: msg.index === 0 || !prev ? [msg.hour] : [...prev.hourly_data, msg.hour]
+          }));
+          setLoading(false);
+        }
       });
-      setData(res.data);
 
       // Update Local History
       setHistory(prev => {
@@ -51,7 +88,7 @@ function SnowApp() {
         return updated;
       });
     } catch (err) {
-      setError(err.response?.data?.error || 'Something went wrong');
+      setError(err instanceof TypeError ? 'Something went wrong' : err.message);
       setData(null);
     } finally {
       setLoading(false);
@@ -85,7 +122,7 @@ function SnowApp() {
   if (data) {
     // Generate Timeline labels (Every 3 hours or so to avoid clutter)
     const totalHours = data.hourly_data.length;
-    const progress = (activeHourIndex / (totalHours - 1)) * 100;
+    const progress = totalHours > 1 ? (activeHourIndex / (totalHours - 1)) * 100 : 0;
 
     // Get integer index for data access
     const currentIndex = Math.floor(activeHourIndex);